@@ -0,0 +1,171 @@
+"""
+Re-score archived border frames with the ML detector, in parallel, into
+the detection history.
+
+Frames are the 1000x500 JPEGs under the given directories (border_images/,
+cumulus_archive/frontera/<month>/, ml_detection original_*.jpg, ...; crossing
+crops and overlays have other sizes and are skipped), optionally limited to
+a date range taken from their filenames, each frame once (see
+frame_archive.py). Each frame is scored at the frontera.json points; the per-crossing results are written to the
+history database as a run at the frame's own time, under source
+'ml-backfill' so they never mix with the live 'ml' runs.
+
+The model is loaded once in the parent and the worker pool is forked
+after that (fork-after-load), so every worker shares the same read-only
+weights instead of loading its own copy. Only the parent writes to
+SQLite.
+
+Progress is checkpointed in border_images/backfill/<key>.done, one frame
+path per line, appended as each frame is recorded; the key hashes the
+threshold, grid and patch size and the detector's source, so a new
+threshold or detector version starts a fresh pass while an interrupted
+one resumes where it stopped.
+
+Frames archived from public/images/frontera/ carry cumulus.py's point
+markers, which bias the probabilities at the crossings; prefer
+border_images/ or raw exports where available.
+
+Usage:
+    python3 backfill.py border_images/
+    python3 backfill.py /home/morakana/cumulus/cumulus_archive/frontera --since 2025-08-01 --until 2025-08-31
+    python3 backfill.py border_images/ --threshold 0.3 --workers 4
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import datetime
+
+import detection_history
+from frame_archive import find_frames
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+CHECKPOINT_DIR = os.path.join(SCRIPT_DIR, 'border_images', 'backfill')
+DETECTOR_SOURCE = os.path.join(SCRIPT_DIR, 'cloud_detection_ml_final.py')
+SOURCE = 'ml-backfill'
+PROGRESS_EVERY = 10
+
+# Set in the parent before the pool forks; workers inherit it
+_detector = None
+_points = None
+
+
+def checkpoint_key(threshold, grid_size, patch_size):
+    """Identifies one scoring configuration (parameters + detector source)"""
+    digest = hashlib.sha1()
+    digest.update(json.dumps([threshold, grid_size, patch_size]).encode())
+    with open(DETECTOR_SOURCE, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return {line.rstrip('\n') for line in f if line.strip()}
+    except OSError:
+        return set()
+
+
+def _init_worker(threads):
+    import torch
+    torch.set_num_threads(threads)
+
+
+def _score(task):
+    """(ts, path, rows) for one frame, using the inherited detector"""
+    from PIL import Image
+    from frame import Frame
+    ts, path = task
+    with Image.open(path) as img:
+        image = img.convert('RGB')
+    results, _ = _detector.detect_at_points(Frame.from_pil(image), _points)
+    rows = [{'index': r['index'], 'probability': r['probability'], 'is_cloud': bool(r['is_cloud'])}
+            for r in results]
+    return ts, path, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-score archived border frames into the detection history')
+    parser.add_argument('frames', nargs='+', help='Frame files or directories')
+    parser.add_argument('--since', default=None, help='First day to include (YYYY-MM-DD)')
+    parser.add_argument('--until', default=None, help='Last day to include (YYYY-MM-DD)')
+    parser.add_argument('--threshold', '-t', type=float, default=0.25, help='Cloud detection threshold')
+    parser.add_argument('--workers', '-j', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes (default: one per CPU)')
+    parser.add_argument('--points', '-p', default=os.path.join(SCRIPT_DIR, 'public/images/frontera.json'),
+                        help='Border crossing points JSON')
+    parser.add_argument('--history-db', default=None,
+                        help='Detection history database (default: border_images/detection_history.db)')
+    parser.add_argument('--source', default=SOURCE, help=f'History source label (default: {SOURCE})')
+    parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and score everything')
+    args = parser.parse_args()
+
+    since = datetime.datetime.strptime(args.since, '%Y-%m-%d').timestamp() if args.since else None
+    until = ((datetime.datetime.strptime(args.until, '%Y-%m-%d') + datetime.timedelta(days=1)).timestamp()
+             if args.until else None)
+    frames = find_frames(args.frames, since, until)
+
+    global _detector, _points
+    with open(args.points) as f:
+        _points = json.load(f)['points']
+    from cloud_detection_ml_final import CloudDetectorML
+    _detector = CloudDetectorML(threshold=args.threshold)
+
+    key = checkpoint_key(args.threshold, _detector.grid_size, _detector.patch_size)
+    checkpoint_path = os.path.join(CHECKPOINT_DIR, key + '.done')
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    done = load_checkpoint(checkpoint_path)
+    todo = [frame for frame in frames if frame[1] not in done]
+    print(f'{len(frames)} frames, {len(frames) - len(todo)} already scored (checkpoint {key}), '
+          f'{len(todo)} to go with {args.workers} workers')
+    if not todo:
+        return
+
+    conn = detection_history.connect(args.history_db or detection_history.DB_PATH)
+    workers = max(1, min(args.workers, len(todo)))
+    pool = None
+    if workers > 1:
+        import multiprocessing
+        # fork after the model is loaded: workers share its weights copy-on-write.
+        # One torch thread each, so the pool doesn't oversubscribe the CPUs.
+        pool = multiprocessing.get_context('fork').Pool(workers, _init_worker, (1,))
+        results = pool.imap_unordered(_score, todo)
+    else:
+        results = map(_score, todo)
+
+    start = time.perf_counter()
+    scored = 0
+    try:
+        with open(checkpoint_path, 'a') as checkpoint:
+            for ts, path, rows in results:
+                detection_history.record_run(conn, args.source, rows, threshold=args.threshold, ts=ts)
+                checkpoint.write(path + '\n')
+                checkpoint.flush()
+                scored += 1
+                if scored % PROGRESS_EVERY == 0 or scored == len(todo):
+                    rate = scored / (time.perf_counter() - start)
+                    print(f'{scored}/{len(todo)} frames, {rate:.2f} frames/s, '
+                          f'ETA {(len(todo) - scored) / rate / 60:.1f} min')
+    except KeyboardInterrupt:
+        print(f'Interrupted after {scored} frames; rerun to resume')
+        if pool:
+            pool.terminate()
+        sys.exit(130)
+    finally:
+        conn.close()
+    if pool:
+        pool.close()
+        pool.join()
+    elapsed = time.perf_counter() - start
+    print(f'Scored {scored} frames in {elapsed:.1f}s ({scored / elapsed:.2f} frames/s) '
+          f'into {args.source} runs')
+
+
+if __name__ == '__main__':
+    main()
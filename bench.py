@@ -0,0 +1,257 @@
+"""
+Micro-benchmarks with golden outputs for the hot functions.
+
+Every case runs on fixed inputs from the repo (a border frame from
+border_images/, crossing_images/crossing_01.jpg, frontera.json), is timed
+over --repeat runs, and its output is compared with a stored golden array
+(bench_golden/<case>.npz) within the case's tolerance. A faster engine for
+any of these functions is only an improvement if it still passes here.
+
+    dithering_gray / dithering_color     880x528 crossing image, exact
+    image_signature / compare_signatures border frames, exact
+    selection_<strategy>                 frontera points scored by brightness, exact
+    generate_cloud_mask                  probability map, atol 1e-3
+    detect_at_points                     per-point probabilities, atol 1e-3
+    upscale_image                        272x453 crop, max abs diff 2 (uint8)
+
+Cases whose dependencies (torch, the Real-ESRGAN weights) are missing are
+reported as skipped. A case that runs but has no golden fails, like a
+mismatch, until one is recorded with --update-golden. Results are printed
+as a table and appended as one JSON line to
+border_images/metrics/bench_runs.jsonl for trend tracking.
+
+Usage:
+    python3 bench.py                          # all cases, compare with golden
+    python3 bench.py --only dither --repeat 10
+    python3 bench.py --update-golden          # store current outputs as golden
+    python3 bench.py --update-golden --only upscale_image   # record one case
+    python3 bench.py --json results.json      # also write this run's results
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_DIR = os.path.join(SCRIPT_DIR, 'bench_golden')
+HISTORY_PATH = os.path.join(SCRIPT_DIR, 'border_images', 'metrics', 'bench_runs.jsonl')
+
+FRAME_PATHS = [os.path.join(SCRIPT_DIR, 'border_images', 'border_2025-08-19_12-58-06.jpg'),
+               os.path.join(SCRIPT_DIR, 'border_images', 'border_2025-08-19_13-25-05.jpg')]
+CROSSING_PATH = os.path.join(SCRIPT_DIR, 'crossing_images', 'crossing_01.jpg')
+POINTS_PATH = os.path.join(SCRIPT_DIR, 'public', 'images', 'frontera.json')
+
+
+class Case:
+    """One benchmark: setup() -> args (untimed), run(*args) -> output (timed)"""
+
+    def __init__(self, name, setup, run, atol=0.0, max_repeat=None):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        self.atol = atol
+        self.max_repeat = max_repeat
+
+
+def _crossing_bgr():
+    import cv2
+    return cv2.resize(cv2.imread(CROSSING_PATH), (880, 528), interpolation=cv2.INTER_AREA)
+
+
+def _frames():
+    from PIL import Image
+    return [Image.open(path).convert('RGB') for path in FRAME_PATHS]
+
+
+def _candidates():
+    """frontera points scored by frame brightness, as cumulus.py's RGB fallback does"""
+    import cv2
+    import point_sampler
+    with open(POINTS_PATH) as f:
+        points = json.load(f)['points']
+    xy = point_sampler.points_xy(points)
+    samples = point_sampler.sample_rgb(cv2.imread(FRAME_PATHS[0]), xy)
+    return [{'index': i, 'point': p, 'probability': float(samples['probability'][i])}
+            for i, p in enumerate(points)]
+
+
+def _cases():
+    import dithering
+    import selection
+    from image_signature import get_image_signature, compare_signatures
+
+    def dither_gray_setup():
+        import cv2
+        return (cv2.cvtColor(_crossing_bgr(), cv2.COLOR_BGR2GRAY),)
+
+    cases = [
+        Case('dithering_gray', dither_gray_setup, lambda img: dithering.dithering_gray(img.copy(), 1)),
+        Case('dithering_color', lambda: (_crossing_bgr(),), lambda img: dithering.dithering_color(img.copy(), 1)),
+        Case('image_signature', lambda: (_frames()[0],), lambda img: np.array(get_image_signature(img))),
+        Case('compare_signatures', lambda: tuple(get_image_signature(f) for f in _frames()),
+             lambda a, b: np.array(compare_signatures(a, b)), atol=1e-9),
+    ]
+    for strategy in selection.STRATEGIES:
+        cases.append(Case(f'selection_{strategy}', lambda: (_candidates(),),
+                          lambda c, s=strategy: np.array([x['index'] for x in selection.select(c, s)])))
+
+    def detector_setup():
+        from frame import Frame
+        from cloud_detection_ml_final import CloudDetectorML
+        with open(POINTS_PATH) as f:
+            points = json.load(f)['points']
+        return CloudDetectorML(), Frame.from_pil(_frames()[0]), points
+
+    def detect_at_points(detector, frame, points):
+        results, _ = detector.detect_at_points(frame, points)
+        return np.array([r['probability'] for r in results])
+
+    def upscale_setup():
+        import geo
+        from PIL import Image
+        import upscale
+        upscale._load_model()
+        return (Image.open(CROSSING_PATH).convert('RGB').resize(geo.CROSSING_CROP_SIZE, Image.LANCZOS),)
+
+    def upscale_run(img):
+        from upscale import upscale_image
+        return np.asarray(upscale_image(img))
+
+    cases += [
+        Case('generate_cloud_mask', detector_setup,
+             lambda detector, frame, points: detector.generate_cloud_mask(frame), atol=1e-3, max_repeat=1),
+        Case('detect_at_points', detector_setup, detect_at_points, atol=1e-3, max_repeat=1),
+        Case('upscale_image', upscale_setup, upscale_run, atol=2, max_repeat=3),
+    ]
+    return cases
+
+
+def load_golden(name):
+    path = os.path.join(GOLDEN_DIR, name + '.npz')
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as golden:
+        return golden['out']
+
+
+def save_golden(name, out):
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    np.savez_compressed(os.path.join(GOLDEN_DIR, name + '.npz'), out=out)
+
+
+def check(out, golden, atol):
+    """(matches, max abs difference) of an output against its golden array"""
+    out = np.asarray(out)
+    if out.shape != golden.shape:
+        return False, None
+    if out.dtype == bool or golden.dtype == bool:
+        diff = float(np.count_nonzero(out != golden))
+    else:
+        diff = float(np.abs(out.astype(np.float64) - golden.astype(np.float64)).max()) if out.size else 0.0
+    return diff <= atol, diff
+
+
+def run_case(case, repeat, update_golden):
+    """Result dict for one case"""
+    result = {'case': case.name}
+    try:
+        args = case.setup()
+    except (ImportError, OSError) as e:
+        result.update(status='skipped', reason=str(e).splitlines()[0][:120])
+        return result
+
+    times = []
+    out = None
+    for _ in range(min(repeat, case.max_repeat or repeat)):
+        start = time.perf_counter()
+        out = case.run(*args)
+        times.append(time.perf_counter() - start)
+    result.update(repeats=len(times), min_s=round(min(times), 6), median_s=round(statistics.median(times), 6))
+
+    if update_golden:
+        save_golden(case.name, np.asarray(out))
+        result['status'] = 'golden-updated'
+        return result
+    golden = load_golden(case.name)
+    if golden is None:
+        result['status'] = 'no-golden'
+        return result
+    ok, diff = check(out, golden, case.atol)
+    result.update(status='ok' if ok else 'MISMATCH', max_diff=diff)
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks with golden outputs for the hot functions')
+    parser.add_argument('--only', action='append', default=None,
+                        help='Run cases whose name contains this (repeatable)')
+    parser.add_argument('--repeat', '-n', type=int, default=5, help='Timed runs per case')
+    parser.add_argument('--update-golden', action='store_true', help='Store current outputs as golden')
+    parser.add_argument('--json', default=None, help='Also write this run\'s results to a JSON file')
+    parser.add_argument('--history', default=HISTORY_PATH, help='JSON-lines trend file (\'\' to skip)')
+    parser.add_argument('--list', action='store_true', help='List the cases and exit')
+    args = parser.parse_args()
+
+    cases = _cases()
+    if args.only:
+        cases = [c for c in cases if any(pattern in c.name for pattern in args.only)]
+    if args.list:
+        for case in cases:
+            print(case.name)
+        return
+
+    results = []
+    for case in cases:
+        result = run_case(case, args.repeat, args.update_golden)
+        results.append(result)
+        if 'median_s' in result:
+            diff = '' if result.get('max_diff') is None else f"  max diff {result['max_diff']:g}"
+            print(f"{case.name:22s} {result['median_s'] * 1000:10.2f}ms median "
+                  f"{result['min_s'] * 1000:10.2f}ms min  x{result['repeats']:<3d} {result['status']}{diff}")
+        else:
+            print(f"{case.name:22s} {'':40s} {result['status']}: {result['reason']}")
+
+    record = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(record, f, indent=2)
+    if args.history and not args.update_golden:
+        os.makedirs(os.path.dirname(args.history), exist_ok=True)
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    failed = [r['case'] for r in results if r['status'] == 'MISMATCH']
+    missing = [r['case'] for r in results if r['status'] == 'no-golden']
+    if failed:
+        print(f"Golden mismatch: {', '.join(failed)}")
+    if missing:
+        print(f"No golden (record with --update-golden --only <case>): {', '.join(missing)}")
+    skipped = [r['case'] for r in results if r['status'] == 'skipped']
+    if skipped:
+        print(f"Not checked (dependencies missing): {', '.join(skipped)}")
+    sys.exit(1 if failed or missing else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -321,6 +321,12 @@ function pickRecentCrossing(crossingsDir, hoursWindow = 2) {
 let lastSelectedCrossing = null;
 let lastSelectedAt = null;
 
+// Used when cumulus.py rendered the BMP instead (render.json crossing_index).
+function setSelectedCrossing(idx, at = new Date().toISOString()) {
+    lastSelectedCrossing = idx;
+    lastSelectedAt = at;
+}
+
 function getLedState(crossingsDir, hoursWindow = 2) {
     const indices = new Set();
     if (fs.existsSync(crossingsDir)) {
@@ -355,8 +361,7 @@ async function generateCrossingBmp(outPath, crossingsDir, crossings) {
     if (idx == null || !crossings[idx]) {
         throw new Error('no recent crossing available');
     }
-    lastSelectedCrossing = idx;
-    lastSelectedAt = new Date().toISOString();
+    setSelectedCrossing(idx);
     const c = crossings[idx];
     const { lat, lon } = c.coordinates;
     const { x: cx, y: cy } = lonLatToMerc(lon, lat);
@@ -385,4 +390,5 @@ module.exports = {
     generateCrossingBmp,
     pickRecentCrossing,
     getLedState,
+    setSelectedCrossing,
 };
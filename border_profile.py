@@ -0,0 +1,230 @@
+"""
+Cloud coverage along the whole border, not just at the 51 crossings.
+
+The border polyline (the lat/lon vertices of geo.BORDER_LAT_LON, which
+create_border_line.py also draws from) is rasterized once into the
+1000x500 frame and cut into bins of BIN_PX pixels of arc length. A distance transform assigns every pixel
+within BAND_PX of the line to the bin of its nearest border pixel. That
+assignment is cached (border_images/border_band.npz) and each run reduces
+the probability map over it with two bincounts:
+
+    coverage[i]  fraction of bin i's band pixels above the threshold
+    mean[i]      mean probability over bin i's band
+
+The vertices are projected with geo.lat_lon_to_display, into the frame's
+display pixels (y compressed by 0.83 around y=250) where frontera.json
+puts the crossings; every crossing is within BAND_PX of the line. The
+hand-drawn cumulus_reference/border_line.svg is not used: it sits up to
+~16px off the crossings.
+
+Published as public/images/border_profile.json: per-bin centers in frame
+pixels plus coverage and mean as integer percents.
+
+Usage:
+    import border_profile
+    profile = border_profile.compute(prob_map, threshold=0.25)
+    border_profile.publish(profile)
+
+    python3 border_profile.py --rebuild    # rebuild the cached band, print its stats
+    python3 border_profile.py --check      # every crossing within BAND_PX of the line
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+import geo
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BAND_CACHE = os.path.join(SCRIPT_DIR, 'border_images', 'border_band.npz')
+PROFILE_PATH = os.path.join(SCRIPT_DIR, 'public', 'images', 'border_profile.json')
+FRONTERA_PATH = os.path.join(SCRIPT_DIR, 'public', 'images', 'frontera.json')
+
+FRAME_SIZE = geo.FRAME_SIZE
+# Half-width of the band around the border line, in frame pixels
+BAND_PX = 6
+# Arc length of one profile bin, in frame pixels
+BIN_PX = 5
+
+_band = None
+
+
+def border_polyline(size=FRAME_SIZE):
+    """Border vertices (geo.BORDER_LAT_LON) in display pixels, scaled to size"""
+    lat, lon = np.array(geo.BORDER_LAT_LON, dtype=np.float64).T
+    x, y = geo.lat_lon_to_display(lat, lon)
+    return np.stack([x * size[0] / FRAME_SIZE[0], y * size[1] / FRAME_SIZE[1]], axis=1)
+
+
+def _resample(polyline, step):
+    """Points every `step` pixels of arc length, with their cumulative length"""
+    seg = np.hypot(*np.diff(polyline, axis=0).T)
+    cum = np.concatenate([[0.0], np.cumsum(seg)])
+    s = np.arange(0.0, cum[-1] + step, step)
+    s[-1] = min(s[-1], cum[-1])
+    return np.stack([np.interp(s, cum, polyline[:, 0]), np.interp(s, cum, polyline[:, 1])], axis=1), s
+
+
+def distance_to_border(xy, size=FRAME_SIZE):
+    """Distance in pixels from each (N, 2) display pixel to the border polyline"""
+    polyline = border_polyline(size)
+    xy = np.asarray(xy, dtype=np.float64)[:, None, :]
+    start, seg = polyline[:-1], np.diff(polyline, axis=0)
+    t = np.clip(((xy - start) * seg).sum(axis=2) / np.maximum((seg * seg).sum(axis=1), 1e-12), 0.0, 1.0)
+    return np.hypot(*(start + t[..., None] * seg - xy).transpose(2, 0, 1)).min(axis=1)
+
+
+def build_band(size=FRAME_SIZE, band_px=BAND_PX, bin_px=BIN_PX):
+    """
+    Rasterize the border and assign band pixels to arc-length bins.
+
+    Returns a dict of arrays: 'pixels' (flat frame indices in the band),
+    'bins' (their bin), 'counts' (band pixels per bin) and 'centers'
+    (bin centers in frame pixels), plus the parameters and the border
+    vertices it was built from.
+    """
+    import cv2
+    width, height = size
+    polyline = border_polyline(size)
+    dense, arc = _resample(polyline, 0.5)
+    n_bins = max(1, int(np.ceil(arc[-1] / bin_px)))
+    dense_bins = np.minimum((arc / bin_px).astype(np.int32), n_bins - 1)
+
+    # Border pixels get the bin of the first dense sample that lands on them
+    xi = np.clip(np.round(dense[:, 0]).astype(np.int32), 0, width - 1)
+    yi = np.clip(np.round(dense[:, 1]).astype(np.int32), 0, height - 1)
+    bin_image = np.full((height, width), -1, dtype=np.int32)
+    flat = yi * width + xi
+    order = np.argsort(flat, kind='stable')
+    first = np.unique(flat[order], return_index=True)[1]
+    bin_image.ravel()[flat[order][first]] = dense_bins[order][first]
+
+    # Nearest border pixel (and its distance) for every pixel
+    not_border = (bin_image < 0).astype(np.uint8)
+    dist, labels = cv2.distanceTransformWithLabels(not_border, cv2.DIST_L2, 5,
+                                                   labelType=cv2.DIST_LABEL_PIXEL)
+    on_border = bin_image >= 0
+    label_to_bin = np.zeros(labels.max() + 1, dtype=np.int32)
+    label_to_bin[labels[on_border]] = bin_image[on_border]
+
+    pixels = np.flatnonzero(dist.ravel() <= band_px).astype(np.int32)
+    bins = label_to_bin[labels.ravel()[pixels]]
+    order = np.argsort(bins, kind='stable')
+    pixels, bins = pixels[order], bins[order]
+    # Bin centers: halfway along each bin
+    mid, _ = _resample(polyline, bin_px / 2.0)
+    centers = mid[1::2][:n_bins]
+    if len(centers) < n_bins:
+        centers = np.concatenate([centers, mid[-1:].repeat(n_bins - len(centers), axis=0)])
+    return {
+        'pixels': pixels,
+        'bins': bins,
+        'counts': np.bincount(bins, minlength=n_bins).astype(np.int32),
+        'centers': centers.astype(np.float32),
+        'size': np.array(size, dtype=np.int32),
+        'params': np.array([band_px, bin_px], dtype=np.float64),
+        'vertices': np.array(geo.BORDER_LAT_LON, dtype=np.float64),
+    }
+
+
+def load_band(size=FRAME_SIZE, band_px=BAND_PX, bin_px=BIN_PX, cache_path=BAND_CACHE, rebuild=False):
+    """Cached band for these parameters, rebuilt when the border vertices or parameters change"""
+    global _band
+    key = (tuple(size), band_px, bin_px)
+    if _band is not None and _band[0] == key and not rebuild:
+        return _band[1]
+    band = None
+    if not rebuild and os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as cached:
+                band = {k: cached[k] for k in cached.files}
+            if (tuple(band['size']) != tuple(size) or list(band['params']) != [band_px, bin_px]
+                    or not np.array_equal(band['vertices'], np.array(geo.BORDER_LAT_LON))):
+                band = None
+        except (OSError, ValueError, KeyError):
+            band = None
+    if band is None:
+        band = build_band(size, band_px, bin_px)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        np.savez(cache_path, **band)
+    _band = (key, band)
+    return band
+
+
+def compute(prob_map, threshold=0.25, band=None):
+    """{'coverage', 'mean', 'centers'} arrays along the border for one probability map"""
+    if band is None:
+        band = load_band(size=(prob_map.shape[1], prob_map.shape[0]))
+    values = prob_map.ravel()[band['pixels']].astype(np.float64)
+    n_bins = len(band['counts'])
+    counts = np.maximum(band['counts'], 1)
+    return {
+        'coverage': np.bincount(band['bins'], weights=(values > threshold).astype(np.float64), minlength=n_bins) / counts,
+        'mean': np.bincount(band['bins'], weights=values, minlength=n_bins) / counts,
+        'centers': band['centers'],
+        'threshold': threshold,
+    }
+
+
+def publish(profile, path=PROFILE_PATH, timestamp=None):
+    """Write the profile as compact JSON (integer percents) for the web page"""
+    data = {
+        'timestamp': timestamp or time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'threshold': profile['threshold'],
+        'bin_px': BIN_PX,
+        'band_px': BAND_PX,
+        'centers': np.round(profile['centers'], 1).tolist(),
+        'coverage': np.round(profile['coverage'] * 100).astype(int).tolist(),
+        'mean': np.round(profile['mean'] * 100).astype(int).tolist(),
+    }
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Border band cache and along-border cloud profile')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the cached band')
+    parser.add_argument('--cube', default=None,
+                        help='Probability cube directory: profile its latest frame')
+    parser.add_argument('--threshold', '-t', type=float, default=0.25)
+    parser.add_argument('--check', action='store_true',
+                        help='Check that every frontera.json crossing is within BAND_PX of the line')
+    args = parser.parse_args()
+
+    if args.check:
+        import point_sampler
+        with open(FRONTERA_PATH) as f:
+            xy = point_sampler.points_xy(json.load(f)['points'])
+        dist = distance_to_border(xy)
+        outside = np.flatnonzero(dist > BAND_PX)
+        print(f"{len(xy)} crossings: max {dist.max():.1f}px, mean {dist.mean():.1f}px from the border line, "
+              f"{len(outside)} outside +/-{BAND_PX}px" + (f": {outside.tolist()}" if len(outside) else ''))
+        if len(outside):
+            sys.exit(1)
+
+    start = time.perf_counter()
+    band = load_band(rebuild=args.rebuild)
+    print(f"Band: {len(band['pixels'])} pixels in {len(band['counts'])} bins "
+          f"({BIN_PX}px bins, +/-{BAND_PX}px), {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    if args.cube:
+        from prob_cube import ProbCube
+        cube = ProbCube(args.cube)
+        if not len(cube):
+            print('Cube is empty')
+            return
+        prob_map = np.asarray(cube.frames()[-1], dtype=np.float32)
+        start = time.perf_counter()
+        profile = compute(prob_map, args.threshold, band)
+        print(f"Profile in {(time.perf_counter() - start) * 1000:.2f}ms: "
+              f"{(profile['coverage'] > 0.5).sum()}/{len(profile['coverage'])} bins mostly cloudy")
+
+
+if __name__ == '__main__':
+    main()
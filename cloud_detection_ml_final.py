@@ -9,33 +9,41 @@ Usage:
     python3 cloud_detection_ml_final.py
     python3 cloud_detection_ml_final.py --threshold 0.3
     python3 cloud_detection_ml_final.py --output my_results/
+    python3 cloud_detection_ml_final.py --no-cube
+    python3 cloud_detection_ml_final.py --no-profile
+    python3 cloud_detection_ml_final.py --vector-tolerance 2  # coarser clouds_ml.geojson
+    python3 cloud_detection_ml_final.py --profile          # cProfile + tracemalloc
+    python3 cloud_detection_ml_final.py --profile torch    # + torch trace of generate_cloud_mask
 """
 
 import os
 import json
 import argparse
-import numpy as np
-from PIL import Image
-import requests
-from io import BytesIO
-import cv2
 from datetime import datetime
 
+import profiling
+
+# numpy, PIL, cv2, requests and torch are imported in the functions that use
+# them, so --help and argument errors return without loading them
+
 # Get script directory for relative paths
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-import torch
-import torchvision.transforms as transforms
-from torchvision.models import mobilenet_v3_small, MobileNet_V3_Small_Weights
-
 
 class CloudDetectorML:
     """ML-based cloud detector with city light filtering"""
 
-    def __init__(self, threshold=0.25, grid_size=20, patch_size=64):
+    # City-light penalty multipliers (see combine_features)
+    PENALTIES = {'orange': 0.3, 'textured': 0.5, 'off_color': 0.6, 'cloud_boost': 1.2}
+
+    def __init__(self, threshold=0.25, grid_size=20, patch_size=64, penalties=None):
         self.threshold = threshold
         self.grid_size = grid_size
         self.patch_size = patch_size
+        self.penalties = dict(self.PENALTIES, **(penalties or {}))
+
+        import torchvision.transforms as transforms
+        from torchvision.models import mobilenet_v3_small, MobileNet_V3_Small_Weights
 
         # Load model
         print('Loading MobileNetV3 model...')
@@ -69,20 +77,49 @@ class CloudDetectorML:
 
         return is_orange, is_textured, is_cloud_color
 
+    @profiling.torch_traced('generate_cloud_mask')
     def generate_cloud_mask(self, image):
-        """Generate cloud probability mask for an image"""
+        """Generate cloud probability mask for an image (PIL, RGB array or Frame)"""
+        return self.combine_features(self.patch_features(image))
+
+    def patch_features(self, image):
+        """
+        Per grid cell inputs of the probability map: the MobileNet activation
+        of the patch around the cell and the city-light tests of its center.
+
+        This is the expensive half of generate_cloud_mask (one forward pass
+        per cell); combine_features() turns it into a map for any penalty
+        setting, so threshold_sweep.py runs it once per frame.
+        """
+        import numpy as np
+        import torch
+        from PIL import Image
+        from frame import Frame
+
         if isinstance(image, np.ndarray):
-            img_array = image
-            image = Image.fromarray(image)
+            frame = Frame(rgb=image)
+        elif isinstance(image, Frame):
+            frame = image
         else:
-            img_array = np.array(image)
+            frame = Frame.from_pil(image)
+        # PIL view for the LANCZOS patch crops, array view for the statistics
+        img_array = frame.rgb
+        image = frame.pil()
 
         h, w = img_array.shape[:2]
-        prob_map = np.zeros((h, w), dtype=np.float32)
-        count_map = np.zeros((h, w), dtype=np.float32)
+        rows = len(range(0, h, self.grid_size))
+        cols = len(range(0, w, self.grid_size))
+        cells = {
+            'shape': (h, w),
+            'brightness': np.zeros((rows, cols)),
+            'activation': np.zeros((rows, cols)),
+            'is_orange': np.zeros((rows, cols), dtype=bool),
+            'is_textured': np.zeros((rows, cols), dtype=bool),
+            'is_cloud_color': np.zeros((rows, cols), dtype=bool),
+        }
 
-        for cy in range(0, h, self.grid_size):
-            for cx in range(0, w, self.grid_size):
+        for row, cy in enumerate(range(0, h, self.grid_size)):
+            for col, cx in enumerate(range(0, w, self.grid_size)):
                 half = self.patch_size // 2
                 x1 = max(0, cx - half)
                 y1 = max(0, cy - half)
@@ -109,27 +146,39 @@ class CloudDetectorML:
                     features = self.model(input_tensor)
                     activation = features.abs().mean().item()
 
-                # Calculate cloud probability
-                cloud_prob = brightness * (1 - min(activation / 10, 1))
+                cells['brightness'][row, col] = brightness
+                cells['activation'][row, col] = activation
+                cells['is_orange'][row, col] = is_orange
+                cells['is_textured'][row, col] = is_textured
+                cells['is_cloud_color'][row, col] = is_cloud_color
+
+        return cells
+
+    def combine_features(self, features, penalties=None):
+        """Probability map from patch_features(), with the detector's or the given penalties"""
+        import numpy as np
+        import cv2
 
-                # Apply city light penalties
-                if is_orange:
-                    cloud_prob *= 0.3
-                if is_textured and brightness > 0.2:
-                    cloud_prob *= 0.5
-                if not is_cloud_color and brightness > 0.3:
-                    cloud_prob *= 0.6
+        p = self.penalties if penalties is None else dict(self.PENALTIES, **penalties)
+        brightness = features['brightness']
+        is_textured = features['is_textured']
+        is_cloud_color = features['is_cloud_color']
 
-                # Boost cloud-like regions
-                if is_cloud_color and not is_textured:
-                    cloud_prob *= 1.2
+        # Calculate cloud probability
+        cloud_prob = brightness * (1 - np.minimum(features['activation'] / 10, 1))
 
-                y_end = min(cy + self.grid_size, h)
-                x_end = min(cx + self.grid_size, w)
-                prob_map[cy:y_end, cx:x_end] += cloud_prob
-                count_map[cy:y_end, cx:x_end] += 1
+        # Apply city light penalties
+        cloud_prob = np.where(features['is_orange'], cloud_prob * p['orange'], cloud_prob)
+        cloud_prob = np.where(is_textured & (brightness > 0.2), cloud_prob * p['textured'], cloud_prob)
+        cloud_prob = np.where(~is_cloud_color & (brightness > 0.3), cloud_prob * p['off_color'], cloud_prob)
 
-        prob_map = np.divide(prob_map, count_map, where=count_map > 0)
+        # Boost cloud-like regions
+        cloud_prob = np.where(is_cloud_color & ~is_textured, cloud_prob * p['cloud_boost'], cloud_prob)
+
+        # Each cell fills its grid_size square (cells tile the frame without overlap)
+        h, w = features['shape']
+        prob_map = np.repeat(np.repeat(cloud_prob.astype(np.float32), self.grid_size, axis=0),
+                             self.grid_size, axis=1)[:h, :w]
         prob_map = cv2.GaussianBlur(prob_map, (31, 31), 0)
 
         return prob_map
@@ -138,14 +187,12 @@ class CloudDetectorML:
         """Detect clouds at specific points (border crossings)"""
         prob_map = self.generate_cloud_mask(image)
 
-        results = []
-        for idx, pt in enumerate(points):
-            x, y = pt['x'], pt['y']
-            # Use small neighborhood
-            y1, y2 = max(0, y-3), min(prob_map.shape[0], y+3)
-            x1, x2 = max(0, x-3), min(prob_map.shape[1], x+3)
-            prob = prob_map[y1:y2, x1:x2].mean()
+        # Mean of a small (6x6) neighbourhood at every point in one pass
+        from point_sampler import points_xy, window_means
+        probs = window_means(prob_map, points_xy(points), radius=3)
 
+        results = []
+        for idx, (pt, prob) in enumerate(zip(points, probs)):
             results.append({
                 'index': idx,
                 'point': pt,
@@ -158,8 +205,13 @@ class CloudDetectorML:
 
 def fetch_noaa_image():
     """Fetch current border image from NOAA"""
+    import requests
+    from io import BytesIO
+    from PIL import Image
+
+    # CUMULUS_NOAA_URL: local exportImage stand-in under replay.py
     url = (
-        'https://satellitemaps.nesdis.noaa.gov/arcgis/rest/services/'
+        os.environ.get('CUMULUS_NOAA_URL', 'https://satellitemaps.nesdis.noaa.gov') + '/arcgis/rest/services/'
         'Most_Recent_MERGEDGC/ImageServer/exportImage?f=image&'
         'bbox=-13041000%2C3871000%2C-10845000%2C2961000&'
         'imageSR=102100&bboxSR=102100&size=1000%2C500'
@@ -173,45 +225,9 @@ def fetch_noaa_image():
 
 
 def create_visualization(image, prob_map, results, threshold):
-    """Create visualization with mask overlay and marked points at 2x resolution"""
-    # Upscale image to 2x for smoother graphics
-    scale = 2
-    img_array = np.array(image)
-    img_upscaled = cv2.resize(img_array, (img_array.shape[1] * scale, img_array.shape[0] * scale), interpolation=cv2.INTER_LANCZOS4)
-    img_bgr = cv2.cvtColor(img_upscaled, cv2.COLOR_RGB2BGR)
-
-    # Upscale prob_map and create cloud mask at 2x
-    prob_map_upscaled = cv2.resize(prob_map, (prob_map.shape[1] * scale, prob_map.shape[0] * scale), interpolation=cv2.INTER_LINEAR)
-    cloud_mask = (prob_map_upscaled > threshold).astype(np.uint8) * 255
-
-    # Create overlay with white color
-    mask_colored = np.zeros_like(img_bgr)
-    mask_colored[:, :, 0] = cloud_mask  # Blue
-    mask_colored[:, :, 1] = cloud_mask  # Green
-    mask_colored[:, :, 2] = cloud_mask  # Red
-
-    alpha = 0.15
-    overlay = img_bgr.copy()
-    mask_bool = cloud_mask > 0
-    overlay[mask_bool] = cv2.addWeighted(
-        img_bgr, 1-alpha, mask_colored, alpha, 0
-    )[mask_bool]
-
-    # Draw contours (thinner at 2x looks smoother)
-    contours, _ = cv2.findContours(
-        cloud_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-    )
-    cv2.drawContours(overlay, contours, -1, (255, 255, 255), 2)  # White in BGR
-
-    # Mark border crossing points with anti-aliased circles (scaled coordinates)
-    # Note: circles drawn at original coordinates to match where detection was performed
-    for r in results:
-        x, y = r['point']['x'] * scale, r['point']['y'] * scale
-        color = (255, 0, 0) if r['is_cloud'] else (0, 255, 0)
-        # Draw filled circle with anti-aliasing (scaled size)
-        cv2.circle(overlay, (x, y), 10, color, -1, cv2.LINE_AA)
-
-    return overlay, cloud_mask
+    """Create visualization with mask overlay and marked points at 2x resolution (see overlay.py)"""
+    from overlay import render_overlay
+    return render_overlay(image, prob_map, results, threshold)
 
 
 def main():
@@ -225,7 +241,37 @@ def main():
                         help='Border crossing points JSON')
     parser.add_argument('--minimal', action='store_true',
                         help='Only save overlay and original (skip mask and report)')
+    parser.add_argument('--cube', default=None,
+                        help='Probability-map time cube directory (default: <output>/prob_cube)')
+    parser.add_argument('--no-cube', action='store_true',
+                        help='Do not append the probability map to the time cube')
+    parser.add_argument('--cube-days', type=float, default=7,
+                        help='Keep this many days of probability maps in the cube (default: 7)')
+    parser.add_argument('--no-profile', action='store_true',
+                        help='Do not publish the along-border coverage profile')
+    parser.add_argument('--no-vector', action='store_true',
+                        help='Do not publish the cloud mask as polygons (clouds_ml.geojson)')
+    parser.add_argument('--vector-tolerance', type=float, default=1.0, metavar='PX',
+                        help='Polygon simplification tolerance in pixels (default: 1.0)')
+    parser.add_argument('--profile', nargs='?', const='cprofile', default=None, metavar='MODE',
+                        help='Profile this run: cprofile (cProfile + tracemalloc) or torch '
+                             '(also torch traces); files go to border_images/profiles/')
+    parser.add_argument('--overlay', choices=('eager', 'deferred'), default='eager',
+                        help='eager: render clouds_ml.jpg now; deferred: store the probability map '
+                             'and render on first use (see overlay.py)')
+    parser.add_argument('--keep-all', action='store_true',
+                        help='Skip the retention policy (never prune old results)')
+    parser.add_argument('--history-db', default=None,
+                        help='Detection history database (default: border_images/detection_history.db)')
+    parser.add_argument('--no-history', action='store_true',
+                        help='Do not record per-crossing results in the history database')
     args = parser.parse_args()
+    # Also on when CUMULUS_PROFILE is set (cumulus.py --profile exports it)
+    profiling.start('ml_detection', args.profile)
+
+    import numpy as np
+    import cv2
+    from frame import Frame, conversion_report
 
     os.makedirs(args.output, exist_ok=True)
 
@@ -236,27 +282,66 @@ def main():
     # Fetch image
     print('Fetching NOAA satellite image...')
     image = fetch_noaa_image()
+    # One shared buffer for the detector and the visualization (see frame.py)
+    frame = Frame.from_pil(image)
 
     # Run detection
     detector = CloudDetectorML(threshold=args.threshold)
     print(f'Running cloud detection (threshold={args.threshold})...')
-    results, prob_map = detector.detect_at_points(image, points)
-
-    # Create visualization
-    overlay, mask = create_visualization(image, prob_map, results, args.threshold)
+    results, prob_map = detector.detect_at_points(frame, points)
+
+    # Keep the full probability map for temporal queries (see prob_cube.py)
+    if not args.no_cube:
+        from prob_cube import ProbCube
+        cube = ProbCube(args.cube or os.path.join(args.output, 'prob_cube'))
+        frame_index = cube.append(prob_map)
+        print(f'Appended probability map to {cube.path} (frame {frame_index})')
+        dropped = cube.trim(max_age=args.cube_days * 86400)
+        if dropped:
+            print(f'Trimmed {dropped} frames older than {args.cube_days:g} days from the cube')
+
+    # Cloud coverage along the whole border line, for the web page (see border_profile.py)
+    if not args.no_profile:
+        import border_profile
+        profile = border_profile.compute(prob_map, args.threshold)
+        border_profile.publish(profile)
+        print(f'Border profile: {(profile["coverage"] > 0.5).sum()}/{len(profile["coverage"])} '
+              f'segments mostly cloudy')
+
+    # Cloud regions as simplified polygons, for the web page (see cloud_polygons.py)
+    if not args.no_vector:
+        import cloud_polygons
+        polygons = cloud_polygons.extract(prob_map, args.threshold, args.vector_tolerance)
+        geojson_bytes, _ = cloud_polygons.publish(polygons, args.threshold)
+        print(f'Cloud polygons: {len(polygons)} regions, '
+              f'{sum(len(ring) for rings in polygons for ring in rings)} vertices ({geojson_bytes / 1024:.1f}KB)')
 
     # Save results
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
 
     image.save(f'{args.output}/original_{timestamp}.jpg')
-    cv2.imwrite(f'{args.output}/overlay_{timestamp}.jpg', overlay)
 
-    # Also save to fixed location for web display
-    web_overlay_path = os.path.join(SCRIPT_DIR, 'public/images/clouds_ml.jpg')
-    cv2.imwrite(web_overlay_path, overlay)
+    if args.overlay == 'deferred':
+        # clouds_ml.jpg is rendered from this when first needed (overlay.ensure)
+        import overlay as overlay_renderer
+        overlay_renderer.save_pending(frame, prob_map, results, args.threshold)
+    else:
+        # Create visualization
+        overlay, mask = create_visualization(frame, prob_map, results, args.threshold)
+        cv2.imwrite(f'{args.output}/overlay_{timestamp}.jpg', overlay)
+
+        # Also save to fixed location for web display
+        web_overlay_path = os.path.join(SCRIPT_DIR, 'public/images/clouds_ml.jpg')
+        cv2.imwrite(web_overlay_path, overlay)
 
     clouds_detected = sum(1 for r in results if r['is_cloud'])
 
+    if not args.no_history:
+        import detection_history
+        conn = detection_history.connect(args.history_db or detection_history.DB_PATH)
+        detection_history.record_run(conn, 'ml', results, threshold=args.threshold)
+        conn.close()
+
     if not args.minimal:
         # cv2.imwrite(f'{args.output}/mask_{timestamp}.png', mask)
 
@@ -282,14 +367,24 @@ def main():
         with open(f'{args.output}/report_{timestamp}.json', 'w') as f:
             json.dump(report, f, indent=2)
 
+    # Prune old originals/overlays/reports (see retention.py for the policy)
+    if not args.keep_all:
+        import retention
+        written = [f'original_{timestamp}.jpg', f'overlay_{timestamp}.jpg', f'report_{timestamp}.json']
+        removed = retention.enforce(args.output, retention.ML_DETECTION_POLICY, new_files=written)
+        if removed:
+            print(f'Retention: removed {len(removed)} old files from {args.output}/')
+
     # Print summary
     print(f'\n{"="*50}')
     print(f'RESULTS - {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}')
     print(f'{"="*50}')
     print(f'Threshold: {args.threshold}')
     print(f'Clouds detected: {clouds_detected}/{len(results)}')
+    print(conversion_report())
     print(f'\nSaved to {args.output}/')
-    print(f'  - overlay_{timestamp}.jpg')
+    if args.overlay == 'eager':
+        print(f'  - overlay_{timestamp}.jpg')
     print(f'  - original_{timestamp}.jpg')
     if not args.minimal:
         # print(f'  - mask_{timestamp}.png')
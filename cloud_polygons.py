@@ -0,0 +1,188 @@
+"""
+Cloud regions as simplified polygons, for the web page.
+
+The thresholded probability map is traced with cv2.findContours
+(RETR_CCOMP: outer boundaries and their holes) and every ring simplified
+with Douglas-Peucker (cv2.approxPolyDP) at TOLERANCE_PX frame pixels.
+Rings under MIN_AREA_PX are dropped. A frame's cloud mask comes to a few
+hundred vertices instead of the 2000x1000 clouds_ml.jpg, and the browser
+can restyle it without a new raster.
+
+Published in two forms, both in public/images/:
+
+    clouds_ml.geojson    FeatureCollection of Polygons in lon/lat
+                         (RFC 7946 ring order), COORD_DECIMALS decimals
+    clouds_ml_px.json    the same rings quantized to integer display
+                         pixels (frontera.json space), each ring a flat
+                         [x0, y0, dx1, dy1, ...] list of deltas
+
+Pixels are display pixels (y compressed by 0.83 around y=250, as the
+frame and frontera.json are); geo.display_to_lat_lon undoes that.
+
+Usage:
+    import cloud_polygons
+    polygons = cloud_polygons.extract(prob_map, threshold=0.25)
+    cloud_polygons.publish(polygons, threshold=0.25)
+
+    python3 cloud_polygons.py --tolerance 1.5    # from clouds_ml_pending.npz or --cube
+"""
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+import geo
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+GEOJSON_PATH = os.path.join(SCRIPT_DIR, 'public', 'images', 'clouds_ml.geojson')
+PIXELS_PATH = os.path.join(SCRIPT_DIR, 'public', 'images', 'clouds_ml_px.json')
+
+# Douglas-Peucker tolerance, in frame pixels (~2.2km each)
+TOLERANCE_PX = 1.0
+# Smallest ring (outer or hole) kept, in square frame pixels
+MIN_AREA_PX = 4.0
+# lon/lat decimals in the GeoJSON (1e-4 deg ~ 11m, well under a pixel)
+COORD_DECIMALS = 4
+
+
+def extract(prob_map, threshold=0.25, tolerance=TOLERANCE_PX, min_area=MIN_AREA_PX):
+    """[[outer, hole, ...], ...] int32 (N, 2) rings in display pixels for prob_map > threshold"""
+    import cv2
+    mask = (prob_map > threshold).astype(np.uint8)
+    contours, hierarchy = cv2.findContours(mask, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+    if hierarchy is None:
+        return []
+
+    def simplify(contour):
+        if abs(cv2.contourArea(contour)) < min_area:
+            return None
+        ring = cv2.approxPolyDP(contour, tolerance, True).reshape(-1, 2) if tolerance > 0 else contour.reshape(-1, 2)
+        return ring if len(ring) >= 3 else None
+
+    polygons = []
+    # hierarchy rows: [next, previous, first child, parent]; children of a top-level contour are its holes
+    for i, (_, _, child, parent) in enumerate(hierarchy[0]):
+        if parent >= 0:
+            continue
+        outer = simplify(contours[i])
+        if outer is None:
+            continue
+        rings = [outer]
+        while child >= 0:
+            hole = simplify(contours[child])
+            if hole is not None:
+                rings.append(hole)
+            child = hierarchy[0][child][0]
+        polygons.append(rings)
+    return polygons
+
+
+def _signed_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+def to_geojson(polygons, threshold, timestamp=None, decimals=COORD_DECIMALS):
+    """FeatureCollection in lon/lat: outer rings counterclockwise, holes clockwise, closed"""
+    features = []
+    for rings in polygons:
+        coordinates = []
+        for k, ring in enumerate(rings):
+            lat, lon = geo.display_to_lat_lon(ring[:, 0], ring[:, 1])
+            lonlat = np.round(np.stack([lon, lat], axis=1), decimals)
+            if (_signed_area(lonlat) > 0) != (k == 0):
+                lonlat = lonlat[::-1]
+            coordinates.append(np.concatenate([lonlat, lonlat[:1]]).tolist())
+        features.append({
+            'type': 'Feature',
+            'properties': {'area_px': int(round(abs(_signed_area(rings[0].astype(np.float64))))),
+                           'holes': len(rings) - 1},
+            'geometry': {'type': 'Polygon', 'coordinates': coordinates},
+        })
+    return {
+        'type': 'FeatureCollection',
+        'timestamp': timestamp or time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'threshold': threshold,
+        'features': features,
+    }
+
+
+def quantize(polygons, threshold, size=geo.FRAME_SIZE, timestamp=None):
+    """Pixel rings as flat delta-encoded integer lists (first vertex absolute)"""
+    encoded = []
+    for rings in polygons:
+        encoded.append([np.diff(ring.astype(np.int64), axis=0, prepend=0).ravel().tolist() for ring in rings])
+    return {
+        'timestamp': timestamp or time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'threshold': threshold,
+        'size': list(size),
+        'polygons': encoded,
+    }
+
+
+def dequantize(data):
+    """Rings of a quantize() dict back as [[outer, hole, ...], ...] (N, 2) arrays"""
+    return [[np.cumsum(np.array(ring, dtype=np.int64).reshape(-1, 2), axis=0).astype(np.int32) for ring in rings]
+            for rings in data['polygons']]
+
+
+def _write(data, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def publish(polygons, threshold, geojson_path=GEOJSON_PATH, pixels_path=PIXELS_PATH, timestamp=None):
+    """Write the GeoJSON and the quantized pixel rings; (geojson bytes, pixel bytes)"""
+    timestamp = timestamp or time.strftime('%Y-%m-%dT%H:%M:%S')
+    _write(to_geojson(polygons, threshold, timestamp), geojson_path)
+    _write(quantize(polygons, threshold, timestamp=timestamp), pixels_path)
+    return os.path.getsize(geojson_path), os.path.getsize(pixels_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cloud mask as simplified polygons')
+    parser.add_argument('--cube', default=None,
+                        help='Probability cube directory: use its latest frame '
+                             '(default: public/images/clouds_ml_pending.npz)')
+    parser.add_argument('--threshold', '-t', type=float, default=None,
+                        help='Cloud threshold (default: the pending one, else 0.25)')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE_PX,
+                        help=f'Douglas-Peucker tolerance in pixels (default: {TOLERANCE_PX})')
+    parser.add_argument('--publish', action='store_true', help='Write the public/images files')
+    args = parser.parse_args()
+
+    threshold = args.threshold
+    if args.cube:
+        from prob_cube import ProbCube
+        cube = ProbCube(args.cube)
+        if not len(cube):
+            print('Cube is empty')
+            return
+        prob_map = np.asarray(cube.frames()[-1], dtype=np.float32)
+    else:
+        import overlay
+        with np.load(overlay.PENDING_PATH) as pending:
+            prob_map = pending['prob_map']
+            if threshold is None:
+                threshold = float(pending['threshold'])
+    threshold = 0.25 if threshold is None else threshold
+
+    start = time.perf_counter()
+    polygons = extract(prob_map, threshold, args.tolerance)
+    elapsed = time.perf_counter() - start
+    vertices = sum(len(ring) for rings in polygons for ring in rings)
+    geojson = json.dumps(to_geojson(polygons, threshold), separators=(',', ':'))
+    pixels = json.dumps(quantize(polygons, threshold), separators=(',', ':'))
+    print(f'{len(polygons)} polygons, {vertices} vertices at tolerance {args.tolerance}px '
+          f'in {elapsed * 1000:.1f}ms; GeoJSON {len(geojson) / 1024:.1f}KB, pixels {len(pixels) / 1024:.1f}KB')
+    if args.publish:
+        publish(polygons, threshold)
+        print(f'Wrote {GEOJSON_PATH} and {PIXELS_PATH}')
+
+
+if __name__ == '__main__':
+    main()
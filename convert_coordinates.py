@@ -1,57 +1,25 @@
 #!/usr/bin/python3
 import json
-import math
 
-# Our current bounding box in Web Mercator (EPSG:102100)
-# bprderBB=[-13041000,3871000,-10845000,2961000]
-bbox_west = -13041000
-bbox_north = 3871000  
-bbox_east = -10845000
-bbox_south = 2961000
-
-# Image dimensions
-img_width = 1000
-img_height = 500
-
-def lat_lon_to_web_mercator(lat, lon):
-    """Convert lat/lon to Web Mercator coordinates"""
-    x = lon * 20037508.34 / 180
-    y = math.log(math.tan((90 + lat) * math.pi / 360)) / (math.pi / 180)
-    y = y * 20037508.34 / 180
-    return x, y
-
-def web_mercator_to_pixel(x, y):
-    """Convert Web Mercator coordinates to pixel coordinates"""
-    # Calculate pixel position within our bounding box
-    pixel_x = int((x - bbox_west) / (bbox_east - bbox_west) * img_width)
-    pixel_y = int((bbox_north - y) / (bbox_north - bbox_south) * img_height)
-    
-    # Ensure coordinates are within image bounds
-    pixel_x = max(0, min(img_width - 1, pixel_x))
-    pixel_y = max(0, min(img_height - 1, pixel_y))
-    
-    return pixel_x, pixel_y
+# Projection to the 1000x500 border frame (BORDER_BBOX in Web Mercator), see geo.py
+from geo import lat_lon_to_web_mercator, web_mercator_to_pixel
 
 # Load the crossing coordinates
 with open('/home/morakana/cumulus/cumulus_2025/cumulus_reference/crossings.json', 'r') as f:
     crossings = json.load(f)
 
-# Convert to pixel coordinates
+# Convert all crossings to Web Mercator and pixel coordinates in one batch
+lats = [crossing['coordinates']['lat'] for crossing in crossings]
+lons = [crossing['coordinates']['lon'] for crossing in crossings]
+web_xs, web_ys = lat_lon_to_web_mercator(lats, lons)
+pixel_xs, pixel_ys = web_mercator_to_pixel(web_xs, web_ys)
+
 border_points = []
 
-for crossing in crossings:
-    lat = crossing['coordinates']['lat']
-    lon = crossing['coordinates']['lon']
-    
-    # Convert to Web Mercator
-    web_x, web_y = lat_lon_to_web_mercator(lat, lon)
-    
-    # Convert to pixel coordinates
-    pixel_x, pixel_y = web_mercator_to_pixel(web_x, web_y)
-    
+for crossing, lat, lon, web_x, web_y, pixel_x, pixel_y in zip(crossings, lats, lons, web_xs, web_ys, pixel_xs, pixel_ys):
     border_points.append({
-        "x": pixel_x,
-        "y": pixel_y,
+        "x": int(pixel_x),
+        "y": int(pixel_y),
         "name": crossing['name']
     })
     
@@ -1,34 +1,10 @@
 #!/usr/bin/python3
 import json
 import math
+import numpy as np
 
-# Our current bounding box in Web Mercator (EPSG:102100)
-bbox_west = -13041000
-bbox_north = 3871000  
-bbox_east = -10845000
-bbox_south = 2961000
-
-# Image dimensions
-img_width = 1000
-img_height = 500
-
-def lat_lon_to_web_mercator(lat, lon):
-    """Convert lat/lon to Web Mercator coordinates"""
-    x = lon * 20037508.34 / 180
-    y = math.log(math.tan((90 + lat) * math.pi / 360)) / (math.pi / 180)
-    y = y * 20037508.34 / 180
-    return x, y
-
-def web_mercator_to_pixel(x, y):
-    """Convert Web Mercator coordinates to pixel coordinates"""
-    pixel_x = int((x - bbox_west) / (bbox_east - bbox_west) * img_width)
-    pixel_y = int((bbox_north - y) / (bbox_north - bbox_south) * img_height)
-    
-    # Ensure coordinates are within image bounds
-    pixel_x = max(0, min(img_width - 1, pixel_x))
-    pixel_y = max(0, min(img_height - 1, pixel_y))
-    
-    return pixel_x, pixel_y
+# Projection to the 1000x500 border frame (BORDER_BBOX in Web Mercator), see geo.py
+from geo import lat_lon_to_web_mercator, web_mercator_to_pixel
 
 # Load the crossing coordinates (using the clean JSON file)
 with open('/home/morakana/cumulus/cumulus_2025/cumulus_reference/crossings.json', 'r') as f:
@@ -108,13 +84,10 @@ key_border_points = [
     (25.880, -97.473),   # Gulf of Mexico
 ]
 
-# Convert all border points to pixel coordinates
-border_pixels = []
-
-for lat, lon in key_border_points:
-    web_x, web_y = lat_lon_to_web_mercator(lat, lon)
-    pixel_x, pixel_y = web_mercator_to_pixel(web_x, web_y)
-    border_pixels.append({"x": pixel_x, "y": pixel_y})
+# Convert all border points to pixel coordinates in one batch
+lats, lons = np.array(key_border_points).T
+pixel_xs, pixel_ys = web_mercator_to_pixel(*lat_lon_to_web_mercator(lats, lons))
+border_pixels = [{"x": int(x), "y": int(y)} for x, y in zip(pixel_xs, pixel_ys)]
 
 # Add interpolated points between major points for smoother curve
 interpolated_points = []
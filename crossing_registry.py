@@ -0,0 +1,161 @@
+"""
+Compiled crossing registry: everything per crossing that used to be
+recomputed (or globbed) on every run, built once from frontera.json and
+cumulus_reference/crossings.json.
+
+public/images/crossing_registry.json
+    sources    mtimes of the two inputs (load() rebuilds when they change)
+    crossings  one entry per frontera.json point, same index:
+        index, name     crossings.json name (same order as frontera.json)
+        x, y            display pixel (frontera.json)
+        center          Web Mercator crop center (see geo.crop_center)
+        bbox            crop bbox, query   exportImage query after bbox=
+        window          [x1, y1, x2, y2] probability sampling window
+        file            current border_NN_*.jpg in public/images/crossings/
+
+cumulus.py looks entries up by index and updates 'file' when it saves a
+new crop, so it no longer globs for border_NN_*.jpg.
+
+Usage:
+    import crossing_registry
+    registry = crossing_registry.load()
+    entry = registry['crossings'][12]
+    crossing_registry.set_file(registry, 12, 'border_12_2025-08-22_05-00-03.jpg')
+    crossing_registry.save(registry)
+
+    python3 crossing_registry.py build
+    python3 crossing_registry.py show --index 12
+"""
+
+import os
+import re
+import json
+import argparse
+
+import geo
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+FRONTERA_PATH = os.path.join(SCRIPT_DIR, 'public', 'images', 'frontera.json')
+CROSSINGS_PATH = os.path.join(SCRIPT_DIR, 'cumulus_reference', 'crossings.json')
+CROSSINGS_DIR = os.path.join(SCRIPT_DIR, 'public', 'images', 'crossings')
+REGISTRY_PATH = os.path.join(SCRIPT_DIR, 'public', 'images', 'crossing_registry.json')
+
+# Half-size of the probability sampling window (detect_at_points uses 6x6)
+WINDOW_RADIUS = 3
+REGISTRY_VERSION = 1
+
+_CROP_FILE = re.compile(r'^border_(\d+)_.*\.jpg$')
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _current_files(crossings_dir):
+    """Newest border_NN_*.jpg per crossing index (one directory listing)"""
+    files = {}
+    try:
+        names = sorted(os.listdir(crossings_dir))
+    except OSError:
+        return files
+    for name in names:
+        m = _CROP_FILE.match(name)
+        if m:
+            # Sorted, so the last (newest timestamp) wins
+            files[int(m.group(1))] = name
+    return files
+
+
+def build(frontera_path=FRONTERA_PATH, crossings_path=CROSSINGS_PATH, crossings_dir=CROSSINGS_DIR):
+    """Compile the registry dict from frontera.json and crossings.json"""
+    with open(frontera_path) as f:
+        points = json.load(f)['points']
+    try:
+        with open(crossings_path) as f:
+            names = [c.get('name') for c in json.load(f)]
+    except (OSError, ValueError):
+        names = []
+
+    xy = [(p['x'], p['y']) for p in points]
+    cx, cy = geo.crop_center([p[0] for p in xy], [p[1] for p in xy])
+    bboxes = geo.crossing_crop_bboxes(xy)
+    files = _current_files(crossings_dir)
+    width, height = geo.FRAME_SIZE
+
+    entries = []
+    for i, (x, y) in enumerate(xy):
+        bbox = [float(v) for v in bboxes[i]]
+        entries.append({
+            'index': i,
+            'name': names[i] if i < len(names) else None,
+            'x': x,
+            'y': y,
+            'center': [float(cx[i]), float(cy[i])],
+            'bbox': bbox,
+            'query': geo.export_query(bbox, geo.CROSSING_CROP_SIZE),
+            'window': [max(0, x - WINDOW_RADIUS), max(0, y - WINDOW_RADIUS),
+                       min(width, x + WINDOW_RADIUS), min(height, y + WINDOW_RADIUS)],
+            'file': files.get(i),
+        })
+    return {
+        'version': REGISTRY_VERSION,
+        'sources': {'frontera': _mtime(frontera_path), 'crossings': _mtime(crossings_path)},
+        'crop_size': list(geo.CROSSING_CROP_SIZE),
+        'crossings': entries,
+    }
+
+
+def save(registry, path=REGISTRY_PATH):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(registry, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load(path=REGISTRY_PATH, frontera_path=FRONTERA_PATH, crossings_path=CROSSINGS_PATH,
+         crossings_dir=CROSSINGS_DIR):
+    """The registry, rebuilt and saved first if missing or older than its inputs"""
+    try:
+        with open(path) as f:
+            registry = json.load(f)
+        fresh = (registry.get('version') == REGISTRY_VERSION and registry.get('sources') ==
+                 {'frontera': _mtime(frontera_path), 'crossings': _mtime(crossings_path)})
+    except (OSError, ValueError):
+        fresh = False
+    if not fresh:
+        registry = build(frontera_path, crossings_path, crossings_dir)
+        save(registry, path)
+    return registry
+
+
+def set_file(registry, index, filename):
+    """Point a crossing at its newly saved crop (call save() afterwards)"""
+    registry['crossings'][index]['file'] = filename
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or inspect the compiled crossing registry')
+    parser.add_argument('--registry', default=REGISTRY_PATH, help='Registry file')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('build', help='Compile frontera.json + crossings.json')
+    show = sub.add_parser('show', help='Print registry entries')
+    show.add_argument('--index', '-i', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        registry = build()
+        save(registry, args.registry)
+        with_files = sum(1 for e in registry['crossings'] if e['file'])
+        print(f"Built {args.registry}: {len(registry['crossings'])} crossings, {with_files} with a current crop")
+    else:
+        registry = load(args.registry)
+        entries = registry['crossings'] if args.index is None else [registry['crossings'][args.index]]
+        for e in entries:
+            print(f"{e['index']:3d}  ({e['x']:3d}, {e['y']:3d})  {e['name'] or '-'}  {e['file'] or '-'}")
+
+
+if __name__ == '__main__':
+    main()
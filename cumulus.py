@@ -17,81 +17,49 @@ if os.path.exists(libdir):
 #
 # import imagehash
 import logging
-logging.basicConfig(level=logging.DEBUG)
+# INFO, not DEBUG: urllib3/PIL debug records cost time on every tick
+logging.basicConfig(level=logging.INFO)
 # print(imagehash.__file__)
-from PIL import Image,ImageDraw,ImageFont, ImageChops
-import traceback
-import dithering
+from PIL import Image
 
 from io import BytesIO
 
-# Duplicate detection functions (from remove_duplicates.py)
-def get_image_signature(img, max_dim=64):
-    """Get a small thumbnail signature for comparison. Accepts PIL Image or filepath.
-    Maintains aspect ratio - scales so largest dimension is max_dim."""
-    try:
-        if isinstance(img, str):
-            img = Image.open(img)
-        # Calculate new size maintaining aspect ratio
-        w, h = img.size
-        if w > h:
-            new_w = max_dim
-            new_h = max(1, int(h * max_dim / w))
-        else:
-            new_h = max_dim
-            new_w = max(1, int(w * max_dim / h))
-        # Convert to grayscale and resize maintaining aspect ratio
-        thumb = img.convert('L').resize((new_w, new_h), Image.LANCZOS)
-        return list(thumb.getdata())
-    except Exception as e:
-        print(f"Error getting image signature: {e}")
-        return None
-
-def compare_signatures(sig1, sig2):
-    """
-    Compare two image signatures.
-    Returns similarity as percentage (0-100).
-    100 = identical, 0 = completely different.
-    """
-    if sig1 is None or sig2 is None:
-        return 0
-    if len(sig1) != len(sig2):
-        # Different aspect ratios - not comparable
-        return 0
-    total_diff = sum(abs(a - b) for a, b in zip(sig1, sig2))
-    max_diff = 255 * len(sig1)
-    similarity = 100 * (1 - total_diff / max_diff)
-    return similarity
-
-def is_duplicate_image(new_img, existing_path, threshold=99.5):
-    """
-    Check if new_img is a duplicate of the image at existing_path.
-    Returns True if similarity >= threshold.
-    """
-    if not os.path.exists(existing_path):
-        return False
-    new_sig = get_image_signature(new_img)
-    existing_sig = get_image_signature(existing_path)
-    similarity = compare_signatures(new_sig, existing_sig)
-    if similarity >= threshold:
-        print(f"Duplicate detected: {similarity:.1f}% similar to {os.path.basename(existing_path)}")
-        return True
-    return False
-
-import cv2
-import time, datetime, sys, signal, urllib, requests, random, json, numpy, pytz
-import subprocess
+# Duplicate detection (see image_signature.py)
+from image_signature import is_duplicate_image
+
+# Only what the unchanged-frame early exit needs is imported here; cv2, numpy,
+# pytz, torch and the rendering modules load once the border frame changed.
+import time, datetime, json, requests
+import run_metrics
+import profiling
 
 #from StringIO import StringIO
 # Because the program will run form the crontab, we need to specify the absolute path
+# (CUMULUS_ROOT / CUMULUS_NOAA_URL let replay.py run it in a sandbox against a local exportImage stand-in)
+cumulus_root = os.environ.get('CUMULUS_ROOT', '/home/morakana/cumulus/cumulus_2025/')
+noaa_server = os.environ.get('CUMULUS_NOAA_URL', 'https://satellitemaps.nesdis.noaa.gov')
 img_save_name0="public/images/img0.jpg"
 img_save_name1="public/images/img1.jpg"
 # path_cumulus='public/images/'
-path_cumulus='/home/morakana/cumulus/cumulus_2025/public/images/'
+path_cumulus=cumulus_root + 'public/images/'
 jsonfile=open(path_cumulus+'frontera.json',)
 # jsonfile=open("public/images/frontera.json",)
 frontera=json.load(jsonfile)
 noaa_type="Most_Recent_MERGEDGC"
+# Dithering per e-paper output, any of dithering.DITHER_METHODS
+# ('floyd-steinberg', 'bayer2'..'bayer16', 'blue-noise', 'atkinson', 'stucki').
+# Ordered/blue-noise keep unchanged areas identical between frames.
+CONTINENTE_DITHER = 'floyd-steinberg'
+NUBES_FRONTERA_DITHER = 'floyd-steinberg'
+# Crossing selection strategy, any of selection.STRATEGIES ('greedy', 'farthest', 'poisson')
+SELECTION_STRATEGY = 'greedy'
+# clouds_ml.jpg: 'eager' renders it in the ML run, 'deferred' stores the probability
+# map and renders on first use (see overlay.py)
+ML_OVERLAY = 'eager'
+# Saved crossing images: sizes and formats encoded per crossing, listed in
+# selection.json (see renditions.py)
+CROSSING_RENDITIONS = ('thumb', 'mid', 'full')
+CROSSING_FORMATS = ('jpg', 'webp')
 # noaa_type="Most_Recent_ABIGC"
 
 # border_img="https://morakana.com/wp-content/uploads/2021/03/frontera1.jpg"
@@ -99,66 +67,111 @@ noaa_type="Most_Recent_MERGEDGC"
 # Extended border bounding box to cover entire US-Mexico border
 # From San Diego/Tijuana (-117.04°, 32.54°) to Brownsville/Matamoros (-97.47°, 25.88°)
 # Web Mercator coordinates: West: -13041000, East: -10845000, North: 3871000, South: 2961000
-border_img="https://satellitemaps.nesdis.noaa.gov/arcgis/rest/services/"+noaa_type+"/ImageServer/exportImage?f=image&bbox=-13041000%2C3871000%2C-10845000%2C2961000&imageSR=102100&bboxSR=102100&size=1000%2C500"
-bprderBB=[-13041000,3871000,-10845000,2961000]
-url_base="https://satellitemaps.nesdis.noaa.gov/arcgis/rest/services/"+noaa_type+"/ImageServer/exportImage?f=image&bbox="
+# (geo.BORDER_BBOX, which the crossing crops are computed from)
+border_img=noaa_server+"/arcgis/rest/services/"+noaa_type+"/ImageServer/exportImage?f=image&bbox=-13041000%2C3871000%2C-10845000%2C2961000&imageSR=102100&bboxSR=102100&size=1000%2C500"
+url_base=noaa_server+"/arcgis/rest/services/"+noaa_type+"/ImageServer/exportImage?f=image&bbox="
+
+# E-paper frames are fetched once per source at this portrait size and rendered
+# from it to every display size (880x528 here, 1360x480 for public/eink/).
+EPAPER_SOURCE_SIZE = (816, 1360)
+path_eink = cumulus_root + 'public/eink/'
+# Per-run stage timings: one JSON line per run, plus a node_exporter textfile
+path_metrics = cumulus_root + 'border_images/metrics/'
 
 # border_img="https://morakana.com/wp-content/uploads/2021/03/frontera1.jpg"
-satelites=["https://satellitemaps.nesdis.noaa.gov/arcgis/rest/services/Most_Recent_MERGEDGC/ImageServer/exportImage?f=image&bbox=-13961794%2C5951224%2C-3167246%2C-5132306&imageSR=102100&bboxSR=102100&size=528%2C880",
-"https://satellitemaps.nesdis.noaa.gov/arcgis/rest/services/"+noaa_type+"/ImageServer/exportImage?f=image&bbox=-12796986%2C435536%2C-7100695%2C962688&imageSR=102100&bboxSR=102100&size=528%2C880",
-"https://satellitemaps.nesdis.noaa.gov/arcgis/rest/services/Most_Recent_MERGEDGC/ImageServer/exportImage?f=image&bbox=-9644519.959372513%2C2504839.8345999033%2C-7296374.450452522%2C6418415.682799887&imageSR=102100&bboxSR=102100&size=528%2C880",
-"https://satellitemaps.nesdis.noaa.gov/arcgis/rest/services/Most_Recent_MERGEDGC/ImageServer/exportImage?f=image&bbox=-8535265.80489833%2C4550906.207736957%2C-7948229.427668332%2C5529300.169786953&imageSR=102100&bboxSR=102100&size=528%2C880",
-"https://satellitemaps.nesdis.noaa.gov/arcgis/rest/services/Most_Recent_MERGEDGC/ImageServer/exportImage?f=image&bbox=-12505099.305916186%2C-1674125.3758061416%2C-7808808.288076207%2C6153026.3205938265&imageSR=102100&bboxSR=102100&size=528%2C880"]
+satelites=[noaa_server+"/arcgis/rest/services/Most_Recent_MERGEDGC/ImageServer/exportImage?f=image&bbox=-13961794%2C5951224%2C-3167246%2C-5132306&imageSR=102100&bboxSR=102100&size="+str(EPAPER_SOURCE_SIZE[0])+"%2C"+str(EPAPER_SOURCE_SIZE[1]),
+noaa_server+"/arcgis/rest/services/"+noaa_type+"/ImageServer/exportImage?f=image&bbox=-12796986%2C435536%2C-7100695%2C962688&imageSR=102100&bboxSR=102100&size=528%2C880",
+noaa_server+"/arcgis/rest/services/Most_Recent_MERGEDGC/ImageServer/exportImage?f=image&bbox=-9644519.959372513%2C2504839.8345999033%2C-7296374.450452522%2C6418415.682799887&imageSR=102100&bboxSR=102100&size=528%2C880",
+noaa_server+"/arcgis/rest/services/Most_Recent_MERGEDGC/ImageServer/exportImage?f=image&bbox=-8535265.80489833%2C4550906.207736957%2C-7948229.427668332%2C5529300.169786953&imageSR=102100&bboxSR=102100&size=528%2C880",
+noaa_server+"/arcgis/rest/services/Most_Recent_MERGEDGC/ImageServer/exportImage?f=image&bbox=-12505099.305916186%2C-1674125.3758061416%2C-7808808.288076207%2C6153026.3205938265&imageSR=102100&bboxSR=102100&size=528%2C880"]
 # https://satellitemaps.nesdis.noaa.gov/arcgis/rest/services/Most_Recent_MERGEDGC/ImageServer/exportImage?f=image&bbox=-13050000%2C4050000%2C-10750000%2C2900000&imageSR=102100&bboxSR=102100&size=528%2C880
 
 
 
+def finish_metrics(outcome):
+    record = metrics.finish(outcome, jsonl_path=path_metrics + 'cumulus_runs.jsonl',
+                            prom_path=path_metrics + 'cumulus.prom')
+    print(metrics.report(record))
+
+# --profile / CUMULUS_PROFILE=1|torch: cProfile + tracemalloc for this run and
+# the ML subprocess, written at exit (see profiling.py); nothing when unset
+profiling.start('cumulus', profiling.requested(), cumulus_root + 'border_images/profiles/')
+metrics = run_metrics.RunMetrics('cumulus')
+
 try:
     logging.info(datetime.datetime.now())
     print ("trying")
-    response_0 = requests.get(satelites[0])
-    # response_1 = requests.get(satelites[2])
+    # Border frame first: when it is unchanged the run ends before anything else is fetched
+    metrics.begin('fetch_border')
     response_clouds = requests.get(border_img)
-
-    # Request images
-    # img_0 = Image.open(BytesIO(response_0.content)).convert('L').resize((480,800),Image.ANTIALIAS)
-    img_0 = Image.open(BytesIO(response_0.content)).resize((528,880),Image.ANTIALIAS)
-    # img_1 = Image.open(BytesIO(response_1.content)).convert('L').resize((480,800),Image.ANTIALIAS)
-    img_0=img_0.transpose(Image.ROTATE_180)
+    metrics.add('bytes_downloaded', len(response_clouds.content))
 
     # img_clouds = np.array(bytearray(response_clouds.read()), dtype=np.uint8)
     img_clouds = Image.open(BytesIO(response_clouds.content)).resize((1000,500),Image.ANTIALIAS).convert('RGB')
-    
+
     # Check if this image is similar to the previous one (using threshold-based comparison)
     previous_clouds_path = path_cumulus + "clouds_previous.jpg"
     current_clouds_path = path_cumulus + "clouds.jpg"
 
     # Compare with previous image if it exists
+    metrics.begin('duplicate_check')
     if os.path.exists(previous_clouds_path):
         if is_duplicate_image(img_clouds, previous_clouds_path, threshold=98.0):
             print("Border clouds image unchanged from previous - skipping processing (including ML detection)")
             # Update the previous image timestamp and exit
             img_clouds.save(previous_clouds_path)
+            # The BMPs on disk are still this frame's: keep render.json fresh for the Node server
+            try:
+                os.utime(path_eink + 'render.json')
+            except OSError:
+                pass
+            finish_metrics('unchanged')
             exit()
     
     # Save current image and copy as previous for next comparison
     img_clouds.save(current_clouds_path)
     img_clouds.save(previous_clouds_path)
-    
+
+    import subprocess
+    import cv2
+    import numpy
+    import pytz
+    import detection_history
+    from frame import Frame, conversion_report
+    import geo
+    import crossing_registry
+    import renditions
+
+    metrics.begin('fetch_continent')
+    response_0 = requests.get(satelites[0])
+    metrics.add('bytes_downloaded', len(response_0.content))
+    # response_1 = requests.get(satelites[2])
+
+    # Request images
+    # img_0 = Image.open(BytesIO(response_0.content)).convert('L').resize((480,800),Image.ANTIALIAS)
+    img_0_source = Image.open(BytesIO(response_0.content))
+    img_0 = img_0_source.resize((528,880),Image.ANTIALIAS)
+    # img_1 = Image.open(BytesIO(response_1.content)).convert('L').resize((480,800),Image.ANTIALIAS)
+    img_0=img_0.transpose(Image.ROTATE_180)
+
+    clouds_frame = Frame.from_pil(img_clouds)
     # clouds_cv = numpy.array(img_clouds)
-    clouds_cv = cv2.cvtColor(numpy.array(img_clouds), cv2.COLOR_RGB2BGR)
+    # Private copy: markers are drawn on it below
+    clouds_cv = clouds_frame.bgr(writable=True)
 
     # Run ML cloud detection FIRST to use its results for crossing selection
+    # (its CPU time shows up as the stage's child_cpu)
+    metrics.begin('ml_detection')
     ml_results = {}
-    ml_script = '/home/morakana/cumulus/cumulus_2025/cloud_detection_ml_final.py'
-    ml_output = '/home/morakana/cumulus/cumulus_2025/border_images/ml_detection'
+    ml_script = cumulus_root + 'cloud_detection_ml_final.py'
+    ml_output = cumulus_root + 'border_images/ml_detection'
 
     try:
         print("Running ML cloud detection...")
         env = os.environ.copy()
         env['PYTHONPATH'] = '/home/morakana/.local/lib/python3.8/site-packages:' + env.get('PYTHONPATH', '')
         result = subprocess.run(
-            ['python3', ml_script, '--output', ml_output],
+            ['python3', ml_script, '--output', ml_output, '--overlay', ML_OVERLAY],
             capture_output=True,
             text=True,
             timeout=300,
@@ -166,32 +179,33 @@ try:
         )
         if result.returncode == 0:
             print("ML detection completed successfully")
-            # Read the latest ML report to get per-crossing results
-            import glob
-            report_files = sorted(glob.glob(ml_output + '/report_*.json'))
-            if report_files:
-                with open(report_files[-1], 'r') as f:
-                    ml_report = json.load(f)
-                    for r in ml_report.get('results', []):
-                        ml_results[r['index']] = {
-                            'is_cloud': r['is_cloud'],
-                            'probability': r['probability']
-                        }
-                    print(f"ML: {ml_report.get('clouds_detected', 0)}/{ml_report.get('total_points', 0)} clouds detected")
+            # Read this run's per-crossing results from the history database
+            history_conn = detection_history.connect()
+            ml_results = detection_history.latest_results(history_conn, 'ml', max_age=600)
+            history_conn.close()
+            clouds_detected = sum(1 for r in ml_results.values() if r['is_cloud'])
+            print(f"ML: {clouds_detected}/{len(ml_results)} clouds detected")
         else:
             print("ML detection failed: " + result.stderr[:200])
     except Exception as ml_error:
         print("ML detection error: " + str(ml_error))
 
     # Build cloud_crossings using ML results (fallback to RGB if ML failed)
+    metrics.begin('sampling')
     cloud_crossings = []
+    point_rows = []
     use_ml = len(ml_results) > 0
     print(f"Using {'ML' if use_ml else 'RGB'} detection for crossing selection")
 
+    # Sample every point in one pass (see point_sampler.py); clouds_cv is BGR,
+    # and brightness / the all-channels threshold do not depend on the order
+    import point_sampler
+    frontera_xy = point_sampler.points_xy(frontera['points'])
+    rgb_samples = point_sampler.sample_rgb(clouds_cv, frontera_xy)
+    point_is_cloud = numpy.zeros(len(frontera_xy), dtype=bool)
+
     for index, pix in enumerate(frontera['points']):
-        # Get RGB values for visualization
-        p_c = clouds_cv[pix["y"], pix["x"]]
-        brightness = (int(p_c[0]) + int(p_c[1]) + int(p_c[2])) / 3
+        brightness = float(rgb_samples['brightness'][index])
 
         # Determine if cloud using ML results (or fallback to RGB)
         if use_ml and index in ml_results:
@@ -199,85 +213,59 @@ try:
             cloud_probability = ml_results[index]['probability']
         else:
             # Fallback to RGB threshold
-            limit = 130
-            is_cloud = p_c[0] >= limit and p_c[1] >= limit and p_c[2] >= limit
-            cloud_probability = max(0, (brightness - 100) / 155)
+            is_cloud = bool(rgb_samples['is_cloud'][index])
+            cloud_probability = float(rgb_samples['probability'][index])
 
+        point_rows.append({
+            'index': index,
+            'probability': cloud_probability,
+            'is_cloud': is_cloud,
+            'brightness': brightness
+        })
+
+        point_is_cloud[index] = is_cloud
         if is_cloud:
-            # Mark clouds with blue dots
-            cv2.circle(clouds_cv, (pix["x"], pix["y"]), 3, (255, 0, 0), -1)
             cloud_crossings.append({
                 'index': index,
                 'point': pix,
                 'probability': cloud_probability,
                 'brightness': brightness
             })
-        else:
-            # Mark clear skies with green dots
-            cv2.circle(clouds_cv, (pix["x"], pix["y"]), 3, (0, 255, 0), -1)
+
+    # Per-crossing crop bbox, exportImage query and current crop file,
+    # compiled once from frontera.json + crossings.json (see crossing_registry.py)
+    registry = crossing_registry.load(path_cumulus + 'crossing_registry.json',
+                                      frontera_path=path_cumulus + 'frontera.json',
+                                      crossings_dir=path_cumulus + 'crossings/')
+    registry_changed = False
+
+    # Mark clouds with blue dots, clear skies with green dots
+    point_sampler.draw_markers(clouds_cv, frontera_xy, 3,
+                               numpy.where(point_is_cloud[:, None], (255, 0, 0), (0, 255, 0)))
 
     print("Cloudy crossings found (ML-based): " + str(len(cloud_crossings)))
     
-    # Select crossings based on probability + geographic spread
-    selected_crossings = []
+    # Select crossings based on probability + geographic spread (see selection.py)
+    metrics.begin('selection')
+    import selection
     MIN_DISTANCE = 50  # Minimum pixel distance between selected crossings
     MAX_CROSSINGS = 9  # Maximum number of crossings to select
-
-    def get_distance(p1, p2):
-        """Calculate Euclidean distance between two crossing points"""
-        return ((p1['point']['x'] - p2['point']['x'])**2 +
-                (p1['point']['y'] - p2['point']['y'])**2) ** 0.5
-
-    def is_far_enough(candidate, selected_list, min_dist):
-        """Check if candidate is far enough from all already selected crossings"""
-        for selected in selected_list:
-            if get_distance(candidate, selected) < min_dist:
-                return False
-        return True
-
-    if len(cloud_crossings) > 0:
-        # Sort by probability (highest first)
-        cloud_crossings.sort(key=lambda x: x['probability'], reverse=True)
-
-        # Always select the highest probability crossing first
-        selected_crossings.append(cloud_crossings[0])
-
-        # For remaining selections, prioritize probability but enforce geographic spread
-        remaining = cloud_crossings[1:]
-
-        while len(selected_crossings) < MAX_CROSSINGS and remaining:
-            # Find the highest probability crossing that is far enough from selected ones
-            found = False
-            for candidate in remaining:
-                if is_far_enough(candidate, selected_crossings, MIN_DISTANCE):
-                    selected_crossings.append(candidate)
-                    remaining.remove(candidate)
-                    found = True
-                    break
-
-            if not found:
-                # No candidate far enough - reduce distance requirement or stop
-                # Try with half the distance
-                for candidate in remaining:
-                    if is_far_enough(candidate, selected_crossings, MIN_DISTANCE / 2):
-                        selected_crossings.append(candidate)
-                        remaining.remove(candidate)
-                        found = True
-                        break
-
-                if not found:
-                    # Still no candidate - just take the highest probability remaining
-                    if remaining:
-                        selected_crossings.append(remaining[0])
-                        remaining.pop(0)
-                    else:
-                        break
-
-    # Mark the first one (highest probability) for the website to display by default
+    # Last run's picks keep their slot unless a newcomer beats them by selection.SELECTION_MARGIN
+    previous_indices = selection.previous_selection(path_cumulus + "crossings/selection.json")
+    selected_crossings = selection.select_sticky(cloud_crossings, previous_indices, SELECTION_STRATEGY,
+                                                 margin=selection.SELECTION_MARGIN, max_count=MAX_CROSSINGS,
+                                                 min_distance=MIN_DISTANCE)
+    selection_churn = selection.churn(previous_indices, selected_crossings)
+    selection_churn.update(fetches=0, upscales=0, unchanged=0)
+
+    # Mark the highest real probability for the website to display by default (the
+    # sticky selection orders by boosted probability, so it need not be the first)
+    primary_crossing = None
     if selected_crossings:
-        selected_crossings[0]['is_primary'] = True
+        primary_crossing = max(selected_crossings, key=lambda c: c['probability'])
+        primary_crossing['is_primary'] = True
 
-    print(f"Selected {len(selected_crossings)} crossings for detailed analysis (spread: {MIN_DISTANCE}px min distance)")
+    print(f"Selected {len(selected_crossings)} crossings for detailed analysis ({SELECTION_STRATEGY}, spread: {MIN_DISTANCE}px min distance)")
     
     # Create crossings directory if it doesn't exist
     crossings_dir = path_cumulus + "crossings/"
@@ -291,6 +279,7 @@ try:
     }
 
     # Process each selected crossing
+    metrics.begin('crossings')
     for crossing in selected_crossings:
         pix = crossing['point']
         border_index = crossing['index']
@@ -298,28 +287,13 @@ try:
         # Mark selected crossing with larger red circle
         cv2.circle(clouds_cv,(pix["x"],pix["y"]),4,(0,0,255),-1)
         # Generate high-resolution zoomed image for this crossing.
-        # frontera.json pix["y"] is the 0.83-compressed (display) pixel; invert
-        # the compression to get the raw mercator-pixel before mapping back to
-        # geographic coords. The remaining * 0.95 is a separate empirical
-        # calibration of the zoom bbox center, kept intentionally.
-        raw_y = 250 + (pix["y"] - 250) / 0.83
-        abs_x = bprderBB[0] - (bprderBB[0] - bprderBB[2]) / 1000 * pix["x"]
-        abs_y = bprderBB[1] - (bprderBB[1] - bprderBB[3]) / 500 * raw_y * 0.95
-        
+        # frontera.json pix["y"] is the 0.83-compressed (display) pixel; the
+        # registry's crop bboxes (see geo.py) undo the compression and apply
+        # the empirical * 0.95 center calibration.
         # Native NOAA resolution (~0.009°/px ≈ 1km) at zoom=8
-        crossing_w = 272
-        crossing_h = 453
-        zoom = 8  # Higher zoom for more detail
-        crossing_map_w = (bprderBB[0] - bprderBB[2]) / zoom
-        crossing_map_h = crossing_map_w * (crossing_h / crossing_w)  # Maintain aspect ratio
-        
-        # Create bounding box centered on crossing
-        bbox_crossing = [
-            abs_x - crossing_map_w / 2,
-            abs_y - crossing_map_h / 2,
-            abs_x + crossing_map_w / 2,
-            abs_y + crossing_map_h / 2
-        ]
+        entry = registry['crossings'][border_index]
+        crossing_w, crossing_h = registry['crop_size']
+        bbox_crossing = entry['bbox']
         
         print(f"Processing border crossing {border_index}: probability={crossing['probability']:.3f}")
         print(f"BBOX: {bbox_crossing}")
@@ -329,15 +303,22 @@ try:
         
         try:
             # Request high-resolution image
-            crossing_query = f"{bbox_crossing[0]}%2C{bbox_crossing[1]}%2C{bbox_crossing[2]}%2C{bbox_crossing[3]}&imageSR=102100&bboxSR=102100&size={crossing_w}%2C{crossing_h}"
-            crossing_get = requests.get(url_base + crossing_query)
+            crossing_query = entry['query']
+            with metrics.stage('crossings.fetch'):
+                crossing_get = requests.get(url_base + crossing_query)
+            selection_churn['fetches'] += 1
+            metrics.add('bytes_downloaded', len(crossing_get.content))
             
             if crossing_get.status_code == 200:
                 crossing_image = Image.open(BytesIO(crossing_get.content)).resize((crossing_w, crossing_h), Image.ANTIALIAS).convert('RGB')
 
-                # Check for existing border images with same number
-                import glob
-                existing_files = glob.glob(crossings_dir + f"border_{border_index:02d}_*.jpg")
+                # Existing border image for this crossing, from the registry
+                # (globbing only when it has none or the file went away)
+                if entry['file'] and os.path.exists(crossings_dir + entry['file']):
+                    existing_files = [crossings_dir + entry['file']]
+                else:
+                    import glob
+                    existing_files = glob.glob(crossings_dir + f"border_{border_index:02d}_*.jpg")
 
                 # Check if new image is too similar to existing one (skip if duplicate)
                 if existing_files:
@@ -346,6 +327,7 @@ try:
                     latest_existing = existing_files[-1]
                     if is_duplicate_image(crossing_image, latest_existing, threshold=99.5):
                         print(f"Skipping border {border_index}: image unchanged from previous")
+                        selection_churn['unchanged'] += 1
                         # Still add existing image to metadata
                         selection_metadata['crossings'].append({
                             'filename': os.path.basename(latest_existing),
@@ -353,14 +335,20 @@ try:
                             'probability': crossing['probability'],
                             'is_primary': crossing.get('is_primary', False),
                             'x': pix['x'],
-                            'y': pix['y']
+                            'y': pix['y'],
+                            'renditions': renditions.existing(crossings_dir, latest_existing,
+                                                              CROSSING_RENDITIONS, CROSSING_FORMATS)
                         })
                         continue
 
-                    # Not a duplicate, delete old files before saving new one
-                    for old_file in existing_files:
+                    # Not a duplicate, delete old files before saving new one: every
+                    # border_NN_*.jpg, not just the registry's, so copies left by an
+                    # earlier failed delete or a rebuilt registry go too
+                    import glob
+                    for old_file in glob.glob(crossings_dir + f"border_{border_index:02d}_*.jpg"):
                         try:
                             os.remove(old_file)
+                            renditions.remove(crossings_dir, old_file)
                             print(f"Deleted old image: {os.path.basename(old_file)}")
                         except OSError as e:
                             print(f"Could not delete {old_file}: {e}")
@@ -368,15 +356,23 @@ try:
                 # Upscale with Real-ESRGAN x2 before saving
                 try:
                     from upscale import upscale_image
-                    crossing_image = upscale_image(crossing_image)
+                    with metrics.stage('crossings.upscale'):
+                        crossing_image = upscale_image(crossing_image)
+                    selection_churn['upscales'] += 1
                     print(f"Upscaled border {border_index} to {crossing_image.size}")
                 except Exception as upscale_err:
                     print(f"Upscale failed for border {border_index}, saving at native res: {upscale_err}")
 
-                # Save with requested filename format: border_XX_timestamp.jpg
+                # Save with requested filename format: border_XX_timestamp.jpg,
+                # plus the smaller sizes / WebP in crossings/renditions/
                 filename = f"border_{border_index:02d}_{timestamp}.jpg"
-                crossing_image.save(crossings_dir + filename)
+                with metrics.stage('crossings.encode'):
+                    crossing_renditions = renditions.save(crossing_image, crossings_dir, filename,
+                                                          CROSSING_RENDITIONS, CROSSING_FORMATS)
+                metrics.add('images_written', sum(k.endswith('_bytes') for r in crossing_renditions.values() for k in r))
                 print(f"Saved image: {filename}")
+                crossing_registry.set_file(registry, border_index, filename)
+                registry_changed = True
 
                 # Add to metadata
                 selection_metadata['crossings'].append({
@@ -385,13 +381,24 @@ try:
                     'probability': crossing['probability'],
                     'is_primary': crossing.get('is_primary', False),
                     'x': pix['x'],
-                    'y': pix['y']
+                    'y': pix['y'],
+                    'renditions': crossing_renditions
                 })
             else:
                 print(f"Failed to retrieve image for border {border_index}: HTTP {crossing_get.status_code}")
         except Exception as e:
             print(f"Error processing border {border_index}: {e}")
 
+    if registry_changed:
+        crossing_registry.save(registry, path_cumulus + 'crossing_registry.json')
+
+    print(f"Selection churn: kept {selection_churn['kept']}, added {selection_churn['added']}, "
+          f"dropped {selection_churn['dropped']}; {selection_churn['fetches']} fetches, "
+          f"{selection_churn['upscales']} upscales, {selection_churn['unchanged']} unchanged")
+    selection_metadata['churn'] = selection_churn
+    # Stage timings so far (the full record goes to path_metrics at the end)
+    selection_metadata['metrics'] = metrics.summary()
+
     # Save selection metadata for the website
     if selection_metadata['crossings']:
         metadata_file = crossings_dir + "selection.json"
@@ -399,30 +406,45 @@ try:
             json.dump(selection_metadata, f, indent=2)
         print(f"Saved selection metadata: {len(selection_metadata['crossings'])} crossings")
 
+    # Record this run (all points, with selection and saved filenames) in the history database
+    metrics.begin('history')
+    try:
+        saved = {c['border_index']: c['filename'] for c in selection_metadata['crossings']}
+        selected_indices = {c['index'] for c in selected_crossings}
+        for row in point_rows:
+            row['selected'] = row['index'] in selected_indices
+            row['filename'] = saved.get(row['index'])
+        history_conn = detection_history.connect()
+        detection_history.record_run(history_conn, 'cumulus', point_rows)
+        history_conn.close()
+    except Exception as history_err:
+        print(f"Could not record detection history: {history_err}")
+
     #In case of need for analysis, lets save the CV image with border crossings marked
+    metrics.begin('save_images')
     cv2.imwrite(path_cumulus+'clouds_cv.jpg',clouds_cv)
+    metrics.add('images_written')
     # Save image with timestamp showing border crossing analysis
     # cv2.imwrite(path_cumulus+'border_crossings_'+str(datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))+'.jpg',clouds_cv)
     
     # For backward compatibility, also create the original zoom image if any crossings were selected
     if selected_crossings:
-        # Use the first selected crossing for the legacy zoom image
-        first_crossing = selected_crossings[0]
-        pix = first_crossing['point']
-        abs_x = bprderBB[0] - (bprderBB[0] - bprderBB[2]) / 1000 * pix["x"]
-        abs_y = bprderBB[1] - (bprderBB[1] - bprderBB[3]) / 500 * pix["y"] * 0.95
-        
+        # Use the primary crossing for the legacy zoom image
+        pix = primary_crossing['point']
+        # The legacy zoom image has always centered on the compressed y
+        abs_x, abs_y = geo.crop_center(pix["x"], pix["y"], decompress=False)
+
         clouds_w = 528
         clouds_h = 880
-        zoom = 4
-        clouds_map_w = (bprderBB[0] - bprderBB[2]) / zoom
-        clouds_map_h = clouds_map_w * 1.667
-        bbox_clouds = [abs_x - clouds_map_w / 2, abs_y - clouds_map_h / 2, abs_x + clouds_map_w / 2, abs_y + clouds_map_h / 2]
-        
-        cloud_query = f"{bbox_clouds[0]}%2C{bbox_clouds[1]}%2C{bbox_clouds[2]}%2C{bbox_clouds[3]}&imageSR=102100&bboxSR=102100&size={clouds_w}%2C{clouds_h}"
+        bbox_clouds = geo.crop_bbox(abs_x, abs_y, geo.ZOOM_CLOUDS_ZOOM, geo.ZOOM_CLOUDS_ASPECT)
+
+        cloud_query = geo.export_query(bbox_clouds, EPAPER_SOURCE_SIZE)
         cloud_get = requests.get(url_base + cloud_query)
-        zoom_clouds = Image.open(BytesIO(cloud_get.content)).resize((clouds_w, clouds_h), Image.ANTIALIAS).convert('RGB')
+        metrics.add('bytes_downloaded', len(cloud_get.content))
+        zoom_source = Image.open(BytesIO(cloud_get.content)).convert('RGB')
+        zoom_clouds = zoom_source.resize((clouds_w, clouds_h), Image.ANTIALIAS)
         zoom_clouds.save(path_cumulus + "zoomclouds.jpg")
+        metrics.add('images_written')
     # Create directories if they don't exist
     import os
     import glob
@@ -434,30 +456,34 @@ try:
     if continente_files:
         if not is_duplicate_image(img_0, continente_files[-1], threshold=99.5):
             img_0.save(path_cumulus+"continente/"+str(datetime.datetime.now())+".jpg")
+            metrics.add('images_written')
             print("Saved new continente image")
         else:
             print("Skipping continente: image unchanged from previous")
     else:
         img_0.save(path_cumulus+"continente/"+str(datetime.datetime.now())+".jpg")
+        metrics.add('images_written')
         print("Saved first continente image")
 
     # Save frontera image only if different from previous
     frontera_files = sorted(glob.glob(path_cumulus+"frontera/*.jpg"))
-    # Convert clouds_cv to PIL for comparison
-    clouds_pil = Image.fromarray(cv2.cvtColor(clouds_cv, cv2.COLOR_BGR2RGB))
+    # Compare clouds_cv in place (gray view only, no PIL conversion)
     if frontera_files:
-        if not is_duplicate_image(clouds_pil, frontera_files[-1], threshold=99.5):
+        if not is_duplicate_image(Frame.from_bgr(clouds_cv), frontera_files[-1], threshold=99.5):
             cv2.imwrite(path_cumulus+"frontera/"+str(datetime.datetime.now())+'.jpg',clouds_cv)
+            metrics.add('images_written')
             print("Saved new frontera image")
         else:
             print("Skipping frontera: image unchanged from previous")
     else:
         cv2.imwrite(path_cumulus+"frontera/"+str(datetime.datetime.now())+'.jpg',clouds_cv)
+        metrics.add('images_written')
         print("Saved first frontera image")
 
     # Archive old images (older than 24h) to keep live folders small
+    metrics.begin('archive')
     import shutil
-    archive_base = '/home/morakana/cumulus/cumulus_archive/'
+    archive_base = os.environ.get('CUMULUS_ARCHIVE', '/home/morakana/cumulus/cumulus_archive/')
     archive_max_age_hours = 24
 
     for folder_name in ['continente', 'frontera']:
@@ -480,6 +506,15 @@ try:
             except Exception as archive_err:
                 print(f"Archive error for {fpath}: {archive_err}")
 
+    # Prune accumulated border_crossings_*.jpg snapshots (see retention.py)
+    import retention
+    try:
+        removed = retention.enforce(path_cumulus, retention.PUBLIC_IMAGES_POLICY)
+        if removed:
+            print(f"Retention: removed {len(removed)} old files from {path_cumulus}")
+    except Exception as retention_err:
+        print(f"Retention error for {path_cumulus}: {retention_err}")
+
     # Count archived files
     for folder_name in ['continente', 'frontera']:
         source_dir = path_cumulus + folder_name + '/'
@@ -492,91 +527,66 @@ try:
         if archived > 0:
             print(f"Archive {folder_name}: {remaining} live, {archived} archived")
 
-    continente_cv = cv2.cvtColor(numpy.array(img_0), cv2.COLOR_BGR2GRAY)
-
-    #adding data on images
-    continente_cv=cv2.rotate(continente_cv,cv2.ROTATE_180)
-    start_point=(0,858)
-    end_point=(528,880)
-    color = (0, 0, 0)
-    thickness = -1
-    continente_cv=cv2.rectangle(continente_cv, start_point, end_point, color, thickness)
-    text_position = (5,873)
-    cv2.putText(
-        continente_cv, #numpy array on which text is written
-        "Cumulus 2025- American Continent", #text
-        text_position, #position at which writing has to start
-        cv2.FONT_HERSHEY_SIMPLEX, #font family
-        0.5, #font size
-        (255, 255,255, 255), #font color
-        1, #font stroke
-        cv2.LINE_AA,
-        False)
-    continente_cv=cv2.rotate(continente_cv,cv2.ROTATE_180)
-
-    continente_cv=cv2.rotate(continente_cv,cv2.ROTATE_90_CLOCKWISE)
-    #resize for Testing
-    s=(880,528)
-    thresh = 128
-
-    continente_cv=cv2.resize(continente_cv,s,interpolation = cv2.INTER_AREA)
-    outMat_gray = dithering.dithering_gray(continente_cv.copy(), 1)
-    # outMat_BW = cv2.threshold(outMat_gray, thresh, 255, cv2.THRESH_BINARY)[1]
-
-
-    pilBW=Image.fromarray(outMat_gray,mode='L').convert('1')
-    pilBW.save(path_cumulus+'continente.bmp',bits=1,optimize=True)
-
-
-    # cv2.imwrite(path_cumulus+'continente.bmp', outMat_BW,[cv2.IMWRITE_PNG_BILEVEL, 9])
+    # Render every e-paper display from the one fetched frame per source
+    # (caption strip, rotation, dithering, 1-bit BMP + delta; see epaper_render.py)
+    metrics.begin('render')
+    from epaper_render import render_displays
+    os.makedirs(path_eink, exist_ok=True)
+    eink_ts = datetime.datetime.now(pytz.timezone('US/Eastern')).strftime("%Y-%m-%d %H:%M:%S")
+    # rendered_at: the mtime moves on unchanged runs too (see the duplicate check)
+    eink_render = {'timestamp': eink_ts, 'crossing_index': None, 'files': [],
+                   'rendered_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')}
+
+    continente_source = cv2.cvtColor(numpy.array(img_0_source), cv2.COLOR_BGR2GRAY)
+    import overlay
+    # Border overlay on the landscape-right, same aspect as the source (-> 240x480); in
+    # deferred mode drawn small from the pending state, without rendering clouds_ml.jpg
+    ml_overlay = overlay.inset(480, path_cumulus + 'clouds_ml.jpg', path_cumulus + 'clouds_ml_pending.npz')
+    border_inset = None
+    if ml_overlay is not None:
+        border_inset = cv2.rotate(ml_overlay, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    eink_render['files'] += render_displays(continente_source, [
+        {'size': (880, 528), 'path': path_cumulus + 'continente.bmp',
+         'caption': "Cumulus 2025- American Continent", 'dither': CONTINENTE_DITHER},
+        {'size': (1360, 480), 'path': path_eink + 'continent.bmp',
+         'caption': "American Continent    " + eink_ts, 'dither': CONTINENTE_DITHER,
+         'crop': (200 / 1360, 300 / 1360), 'inset': border_inset,
+         'side_caption': "Mexico - United States Border    " + eink_ts,
+         'info_bar': ("MORAKANA", "CUMULUS - " + eink_ts[:4])},
+    ])
 
     # Only create nubes_frontera.bmp if we have selected crossings (zoom_clouds exists)
     if selected_crossings:
-        nubes_frontera_cv=cv2.cvtColor(numpy.array(zoom_clouds), cv2.COLOR_BGR2GRAY)
-
-        #adding data on images
-        start_point=(0,858)
-        end_point=(528,880)
-        color = (0, 0, 0)
-        thickness = -1
-        nubes_frontera_cv=cv2.rectangle(nubes_frontera_cv, start_point, end_point, color, thickness)
-        text_position = (5,873)
-        # dt = datetime.datetime.now()
-        dt=datetime.datetime.now(pytz.timezone('US/Eastern'))
-        x = dt.strftime("%Y-%m-%d %H:%M:%S")
+        nubes_frontera_source = cv2.cvtColor(numpy.array(zoom_source), cv2.COLOR_BGR2GRAY)
         # message=" Clouds Crossing: "+str(abs_x/100000)+", "+str(abs_y/100000) +"    "+str(x)+" GMT"
-        message=" Clouds Crossing: "+str(abs_y/100000)+", "+str(abs_x/100000) +"    "+str(x)
-        cv2.putText(
-            nubes_frontera_cv, #numpy array on which text is written
-            message, #text
-            text_position, #position at which writing has to start
-            cv2.FONT_HERSHEY_SIMPLEX, #font family
-            0.5, #font size
-            (255, 255,255, 255), #font color
-            1, #font stroke
-            cv2.LINE_AA,
-            False)
-
-        nubes_frontera_cv=cv2.rotate(nubes_frontera_cv,cv2.ROTATE_90_CLOCKWISE)
-        nubes_frontera_cv=cv2.rotate(nubes_frontera_cv,cv2.ROTATE_180)
-
-        outMat_gray = dithering.dithering_gray(nubes_frontera_cv.copy(), 1)
-        # outMat_BW = cv2.threshold(outMat_gray, thresh, 255, cv2.THRESH_BINARY)[1]
-
-        #This creates a 8bit image (even that it's black and white), so let's convert
-        # it to a 1 bit image so it loads faster on the esp32.
-
-        pilBW=Image.fromarray(outMat_gray,mode='L').convert('1')
-        pilBW.save(path_cumulus+'nubes_frontera.bmp')
-        # cv2.imwrite(path_cumulus+'nubes_frontera.bmp', outMat_BW,[cv2.IMWRITE_PNG_BILEVEL, 9])
+        message=" Clouds Crossing: "+str(abs_y/100000)+", "+str(abs_x/100000) +"    "+eink_ts
+        # The 1360x480 display has always shown the crossing's real lat/lon
+        crossing_lat, crossing_lon = geo.display_to_lat_lon(pix["x"], pix["y"])
+        eink_message = f" Clouds Crossing: {crossing_lat:.3f}, {crossing_lon:.3f}    {eink_ts}"
+        eink_render['files'] += render_displays(nubes_frontera_source, [
+            {'size': (880, 528), 'path': path_cumulus + 'nubes_frontera.bmp',
+             'caption': message, 'dither': NUBES_FRONTERA_DITHER},
+            {'size': (1360, 480), 'path': path_eink + 'cloud.bmp',
+             'caption': eink_message, 'dither': NUBES_FRONTERA_DITHER, 'flip': True},
+        ])
+        eink_render['crossing_index'] = primary_crossing['index']
     else:
         print("No clouds detected - skipping nubes_frontera.bmp generation")
 
+    # Tells the Node server these BMPs are fresh, so it skips its own NOAA fetches
+    with open(path_eink + 'render.json', 'w') as f:
+        json.dump(eink_render, f, indent=2)
+
+    metrics.add('images_written', len(eink_render['files']))
+
     # ML detection already ran at the beginning - results used for crossing selection
+    print(conversion_report())
+    finish_metrics('ok')
 
 
 except IOError as e:
     logging.info(e)
+    finish_metrics('error')
 
 except KeyboardInterrupt:
     logging.info("ctrl + c:")
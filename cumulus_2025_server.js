@@ -4,7 +4,7 @@ const cors = require('cors');
 const { createServer } = require('http');
 const { Server } = require('socket.io');
 const chokidar = require('chokidar');
-const { generateContinenteBmp, generateCrossingBmp, getLedState } = require('./bmp_generator');
+const { generateContinenteBmp, generateCrossingBmp, getLedState, setSelectedCrossing } = require('./bmp_generator');
 
 const app = express();
 const server = createServer(app);
@@ -19,6 +19,39 @@ const PORT = process.env.PORT || 3000;
 // Enable CORS
 app.use(cors());
 
+// clouds_ml.jpg can be deferred: the ML run then stores only
+// clouds_ml_pending.npz and the overlay is rendered on the first request
+// after it changes (see overlay.py). Concurrent requests share one render.
+const ML_OVERLAY = path.join(__dirname, 'public', 'images', 'clouds_ml.jpg');
+const ML_OVERLAY_PENDING = path.join(__dirname, 'public', 'images', 'clouds_ml_pending.npz');
+let overlayRender = null;
+app.get('/public/images/clouds_ml.jpg', (req, res, next) => {
+    const fs = require('fs');
+    let pendingTime;
+    try {
+        pendingTime = fs.statSync(ML_OVERLAY_PENDING).mtimeMs;
+    } catch (err) {
+        return next();
+    }
+    const renderedTime = fs.existsSync(ML_OVERLAY) ? fs.statSync(ML_OVERLAY).mtimeMs : 0;
+    if (renderedTime >= pendingTime) {
+        return next();
+    }
+    if (!overlayRender) {
+        const { execFile } = require('child_process');
+        overlayRender = new Promise((resolve) => {
+            execFile('python3', [path.join(__dirname, 'overlay.py'), 'render'], (err) => {
+                if (err) {
+                    console.error('Overlay render failed:', err.message);
+                }
+                overlayRender = null;
+                resolve();
+            });
+        });
+    }
+    overlayRender.then(() => next());
+});
+
 // Serve static files
 app.use(express.static(__dirname));
 
@@ -313,6 +346,7 @@ function getCurrentImageList() {
 if (require('fs').existsSync(cloudsDir)) {
     const watcher = chokidar.watch(cloudsDir, {
         ignored: /^\./, // ignore dotfiles
+        depth: 0, // renditions/ (smaller sizes, WebP) is listed in selection.json instead
         persistent: true,
         ignoreInitial: true // don't emit events for existing files on startup
     });
@@ -433,8 +467,43 @@ if (require('fs').existsSync(fronteraDir)) {
 const BMP_INTERVAL_MS = 10 * 60 * 1000;
 const CROSSINGS_FOR_BMP = require('./cumulus_reference/crossings.json');
 
+// cumulus.py renders both BMPs from the frames it already fetched and writes
+// public/eink/render.json; while that is fresh we only mirror its output
+// instead of downloading the NOAA tiles a second time. Runs that find the
+// NOAA frame unchanged touch it, so it stays fresh overnight.
+const PYTHON_RENDER_JSON = path.join(EINK_DIR, 'render.json');
+
+function pythonRenderIsFresh() {
+    try {
+        const s = require('fs').statSync(PYTHON_RENDER_JSON);
+        return Date.now() - s.mtimeMs < BMP_INTERVAL_MS * 1.5;
+    } catch (e) {
+        return false;
+    }
+}
+
 async function regenerateBmps() {
     const fsp = require('fs').promises;
+    if (pythonRenderIsFresh()) {
+        // The LED state follows the crossing cumulus.py put on cloud.bmp
+        try {
+            const render = JSON.parse(await fsp.readFile(PYTHON_RENDER_JSON, 'utf8'));
+            if (render.crossing_index != null) {
+                const at = render.rendered_at || (await fsp.stat(PYTHON_RENDER_JSON)).mtime.toISOString();
+                setSelectedCrossing(render.crossing_index, new Date(at).toISOString());
+            }
+        } catch (e) {
+            console.error('[bmp] render.json error:', e.message);
+        }
+        try {
+            await fsp.copyFile(CONTINENT_BMP, LEGACY_CONTINENT_BMP);
+            await fsp.copyFile(CLOUD_BMP, LEGACY_CLOUD_BMP);
+            console.log('[bmp] using cumulus.py render (legacy mirror updated)');
+        } catch (e) {
+            console.error('[bmp] legacy mirror error:', e.message);
+        }
+        return;
+    }
     const t0 = Date.now();
     try {
         await generateContinenteBmp(CONTINENT_BMP);
@@ -0,0 +1,193 @@
+"""
+SQLite store of per-crossing detection history.
+
+Both the ML detector and cumulus.py record each run here, one row per
+crossing, so history questions are indexed queries instead of globbing and
+parsing report_*.json files.
+
+    runs        id, ts (epoch seconds), source ('ml', 'cumulus' or
+                'ml-backfill', see backfill.py), threshold
+    detections  run_id, ts, crossing_index, probability, is_cloud,
+                brightness, selected, filename
+
+Usage:
+    python3 detection_history.py cloudiest --days 7
+    python3 detection_history.py history --index 12 --days 2
+    python3 detection_history.py runs --limit 20
+    python3 detection_history.py --source ml-backfill cloudiest --days 30
+"""
+
+import os
+import time
+import sqlite3
+import argparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(SCRIPT_DIR, 'border_images', 'detection_history.db')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    source TEXT NOT NULL,
+    threshold REAL
+);
+CREATE TABLE IF NOT EXISTS detections (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    ts REAL NOT NULL,
+    crossing_index INTEGER NOT NULL,
+    probability REAL,
+    is_cloud INTEGER,
+    brightness REAL,
+    selected INTEGER NOT NULL DEFAULT 0,
+    filename TEXT,
+    PRIMARY KEY (run_id, crossing_index)
+);
+CREATE INDEX IF NOT EXISTS runs_source_ts ON runs(source, ts);
+CREATE INDEX IF NOT EXISTS detections_ts ON detections(ts);
+CREATE INDEX IF NOT EXISTS detections_crossing_ts ON detections(crossing_index, ts);
+"""
+
+
+def connect(path=DB_PATH):
+    """Open (and create if needed) the history database"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    # WAL lets the web side / CLI read while a run is writing
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA foreign_keys=ON')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def record_run(conn, source, rows, threshold=None, ts=None):
+    """
+    Record one run and its per-crossing rows in a single transaction.
+
+    rows: iterable of dicts with 'index' and any of 'probability', 'is_cloud',
+    'brightness', 'selected', 'filename'. Returns the new run id.
+    """
+    if ts is None:
+        ts = time.time()
+    with conn:
+        run_id = conn.execute(
+            'INSERT INTO runs (ts, source, threshold) VALUES (?, ?, ?)',
+            (ts, source, threshold)
+        ).lastrowid
+        conn.executemany(
+            'INSERT INTO detections (run_id, ts, crossing_index, probability, is_cloud,'
+            ' brightness, selected, filename) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [(run_id, ts, int(r['index']),
+              None if r.get('probability') is None else float(r['probability']),
+              None if r.get('is_cloud') is None else int(bool(r['is_cloud'])),
+              None if r.get('brightness') is None else float(r['brightness']),
+              int(bool(r.get('selected', False))),
+              r.get('filename'))
+             for r in rows]
+        )
+    return run_id
+
+
+def latest_results(conn, source='ml', max_age=None):
+    """
+    Per-crossing results of the most recent run from `source`.
+
+    Returns {crossing_index: {'is_cloud': bool, 'probability': float}}, or {}
+    if there is no run (or none newer than max_age seconds).
+    """
+    run = conn.execute(
+        'SELECT id, ts FROM runs WHERE source = ? ORDER BY ts DESC LIMIT 1', (source,)
+    ).fetchone()
+    if run is None or (max_age is not None and time.time() - run['ts'] > max_age):
+        return {}
+    return {
+        r['crossing_index']: {'is_cloud': bool(r['is_cloud']), 'probability': r['probability']}
+        for r in conn.execute(
+            'SELECT crossing_index, probability, is_cloud FROM detections WHERE run_id = ?',
+            (run['id'],)
+        )
+    }
+
+
+def cloudiest_crossings(conn, since, source='ml', limit=10):
+    """Crossings ranked by how often they were cloudy since `since` (epoch seconds)"""
+    return conn.execute(
+        'SELECT d.crossing_index, COUNT(*) AS runs, SUM(d.is_cloud) AS cloudy,'
+        ' AVG(d.is_cloud) AS cloud_rate, AVG(d.probability) AS mean_probability'
+        ' FROM detections d JOIN runs r ON r.id = d.run_id'
+        ' WHERE d.ts >= ? AND r.source = ?'
+        ' GROUP BY d.crossing_index ORDER BY cloud_rate DESC, mean_probability DESC LIMIT ?',
+        (since, source, limit)
+    ).fetchall()
+
+
+def crossing_history(conn, crossing_index, since, source='ml'):
+    """Time series of one crossing since `since` (epoch seconds), oldest first"""
+    return conn.execute(
+        'SELECT d.ts, d.probability, d.is_cloud, d.brightness, d.selected, d.filename'
+        ' FROM detections d JOIN runs r ON r.id = d.run_id'
+        ' WHERE d.crossing_index = ? AND d.ts >= ? AND r.source = ? ORDER BY d.ts',
+        (crossing_index, since, source)
+    ).fetchall()
+
+
+def recent_runs(conn, limit=20):
+    """Most recent runs with their cloud counts"""
+    return conn.execute(
+        'SELECT r.id, r.ts, r.source, r.threshold, COUNT(d.crossing_index) AS points,'
+        ' SUM(d.is_cloud) AS clouds, SUM(d.selected) AS selected'
+        ' FROM runs r LEFT JOIN detections d ON d.run_id = r.id'
+        ' GROUP BY r.id ORDER BY r.ts DESC LIMIT ?',
+        (limit,)
+    ).fetchall()
+
+
+def sources(conn):
+    """Distinct run sources recorded so far"""
+    return [r['source'] for r in conn.execute('SELECT DISTINCT source FROM runs ORDER BY source')]
+
+
+def _fmt_ts(ts):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query per-crossing detection history')
+    parser.add_argument('--db', default=DB_PATH, help='History database')
+    parser.add_argument('--source', default='ml',
+                        help="Which writer to query: 'ml', 'cumulus', 'ml-backfill', ... (default: ml)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    cloudiest = sub.add_parser('cloudiest', help='Crossings ranked by cloud rate')
+    cloudiest.add_argument('--days', type=float, default=7)
+    cloudiest.add_argument('--limit', type=int, default=10)
+    history = sub.add_parser('history', help='Time series of one crossing')
+    history.add_argument('--index', '-i', type=int, required=True)
+    history.add_argument('--days', type=float, default=1)
+    runs = sub.add_parser('runs', help='Most recent runs')
+    runs.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    known = sources(conn)
+    if args.command != 'runs' and known and args.source not in known:
+        parser.error(f"no runs from source {args.source!r} (recorded: {', '.join(known)})")
+    if args.command == 'cloudiest':
+        since = time.time() - args.days * 86400
+        for r in cloudiest_crossings(conn, since, args.source, args.limit):
+            print(f"{r['crossing_index']:3d}  cloudy {r['cloudy'] or 0}/{r['runs']}"
+                  f"  rate {r['cloud_rate'] or 0:.2f}  mean p {r['mean_probability'] or 0:.3f}")
+    elif args.command == 'history':
+        since = time.time() - args.days * 86400
+        for r in crossing_history(conn, args.index, since, args.source):
+            flags = ('cloud' if r['is_cloud'] else 'clear') + (' selected' if r['selected'] else '')
+            print(f"{_fmt_ts(r['ts'])}  p {r['probability'] or 0:.3f}  {flags}"
+                  + (f"  {r['filename']}" if r['filename'] else ''))
+    elif args.command == 'runs':
+        for r in recent_runs(conn, args.limit):
+            print(f"{r['id']:6d}  {_fmt_ts(r['ts'])}  {r['source']:11s}"
+                  f"  clouds {r['clouds'] or 0}/{r['points']}  selected {r['selected'] or 0}")
+
+
+if __name__ == '__main__':
+    main()
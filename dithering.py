@@ -1,6 +1,10 @@
+import os
 import cv2
 import numpy as np
 
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BLUE_NOISE_DIR = os.path.join(SCRIPT_DIR, 'models')
+
 
 def minmax(v):
     if v > 255:
@@ -10,7 +14,7 @@ def minmax(v):
     return v
 
 
-def dithering_gray(inMat, samplingF):
+def _dithering_gray_loop(inMat, samplingF):
     #https://en.wikipedia.org/wiki/Floyd–Steinberg_dithering
     #https://www.youtube.com/watch?v=0L2n8Tg2FwI&t=0s&list=WL&index=151
     #input is supposed as color
@@ -54,7 +58,7 @@ def dithering_gray(inMat, samplingF):
 
 
 
-def dithering_color(inMat, samplingF):
+def _dithering_color_loop(inMat, samplingF):
     #https://en.wikipedia.org/wiki/Floyd–Steinberg_dithering
     #https://www.youtube.com/watch?v=0L2n8Tg2FwI&t=0s&list=WL&index=151
     #input is supposed as color
@@ -115,3 +119,290 @@ def dithering_color(inMat, samplingF):
 
     # return the thresholded image
     return inMat
+
+
+
+# --- Vectorized error diffusion ---
+#
+# Floyd-Steinberg is sequential, but pixel (y, x) only depends on (y, x-1) and
+# (y-1, x-1..x+1). All pixels on the line x + 2*y = t are therefore
+# independent, so the image is swept in w + 2*h anti-diagonal steps, each one
+# a handful of numpy operations over every row at once.
+#
+# The result matches the per-pixel loops above exactly: same pixel range
+# (x in [1, w-2], y in [0, h-2]), same float64 arithmetic, and the clip +
+# truncation to uint8 after every single error contribution. Within one step
+# the row-below contributions (SW/S/SE) are applied before the right-hand one
+# (E), which is the order the scanline loop applies them in when two pixels of
+# the same step hit the same target.
+
+def _error_diffusion(inMat, samplingF):
+    h = inMat.shape[0]
+    w = inMat.shape[1]
+    if h < 2 or w < 3:
+        return inMat
+
+    channels = inMat.shape[2] if inMat.ndim == 3 else 1
+    work = inMat.reshape(h * w, channels).astype(np.float64)
+    step = 255 / samplingF
+
+    def spread(targets, quant_error, weight):
+        work[targets] = np.floor(np.clip(work[targets] + quant_error * weight / 16.0, 0, 255))
+
+    # t = x + 2*y over x in [1, w-2], y in [0, h-2]
+    for t in range(1, (w - 2) + 2 * (h - 2) + 1):
+        y_lo = max(0, (t - (w - 2) + 1) // 2)
+        y_hi = min(h - 2, (t - 1) // 2)
+        if y_lo > y_hi:
+            continue
+        ys = np.arange(y_lo, y_hi + 1)
+        idx = ys * w + (t - 2 * ys)
+
+        old_p = work[idx]
+        new_p = np.round(samplingF * old_p / 255.0) * step
+        work[idx] = np.floor(new_p)
+        quant_error = old_p - new_p
+
+        spread(idx + w - 1, quant_error, 3)
+        spread(idx + w, quant_error, 5)
+        spread(idx + w + 1, quant_error, 1)
+        spread(idx + 1, quant_error, 7)
+
+    inMat[...] = work.reshape(inMat.shape)
+    return inMat
+
+
+def dithering_gray(inMat, samplingF):
+    """Floyd-Steinberg dither a single-channel image in place (vectorized)"""
+    return _error_diffusion(inMat, samplingF)
+
+
+def dithering_color(inMat, samplingF):
+    """Floyd-Steinberg dither each channel of a 3-channel image in place (vectorized)"""
+    return _error_diffusion(inMat, samplingF)
+
+
+# --- Ordered (threshold-map) dithering ---
+#
+# Every output pixel only compares against a tiled threshold map, so these run
+# in one vectorized pass, and a pixel whose gray level did not change keeps its
+# output between frames (fewer pixels for the e-paper to refresh).
+
+def bayer_matrix(n):
+    """n x n Bayer index matrix (n a power of two), values 0..n*n-1"""
+    if n < 2 or n & (n - 1):
+        raise ValueError(f'Bayer matrix size must be a power of two >= 2, got {n}')
+    m = np.array([[0, 2], [3, 1]])
+    while m.shape[0] < n:
+        m = np.block([[4 * m, 4 * m + 2], [4 * m + 3, 4 * m + 1]])
+    return m
+
+
+def _threshold_dither(inMat, ranks, samplingF):
+    """Quantize to samplingF+1 levels, choosing up/down by a tiled rank map"""
+    h, w = inMat.shape[:2]
+    th, tw = ranks.shape
+    thresholds = (ranks + 0.5) / ranks.size
+    tiled = np.tile(thresholds, (h // th + 1, w // tw + 1))[:h, :w]
+    if inMat.ndim == 3:
+        tiled = tiled[:, :, None]
+    scaled = inMat.astype(np.float32) * (samplingF / 255.0)
+    levels = np.floor(scaled + (1 - tiled))
+    inMat[...] = np.clip(levels * (255 / samplingF), 0, 255)
+    return inMat
+
+
+def dithering_ordered(inMat, samplingF=1, size=8):
+    """Bayer ordered dither (size 2, 4, 8 or 16), in place"""
+    return _threshold_dither(inMat, bayer_matrix(size), samplingF)
+
+
+_blue_noise_masks = {}
+
+
+def _void_and_cluster(size, sigma=1.5, seed=0):
+    """Rank map of a blue-noise pattern (Ulichney's void-and-cluster), 0..size*size-1"""
+    n = size * size
+    rng = np.random.default_rng(seed)
+    # Toroidal Gaussian filter, applied in the frequency domain
+    d = np.minimum(np.arange(size), size - np.arange(size))
+    kernel_f = np.fft.rfft2(np.exp(-(d[:, None] ** 2 + d[None, :] ** 2) / (2 * sigma ** 2)))
+
+    def energy(pattern):
+        return np.fft.irfft2(np.fft.rfft2(pattern) * kernel_f, s=(size, size)).ravel()
+
+    def tightest_cluster(pattern):
+        return int(np.argmax(np.where(pattern.ravel(), energy(pattern), -np.inf)))
+
+    def largest_void(pattern):
+        return int(np.argmin(np.where(pattern.ravel(), np.inf, energy(pattern))))
+
+    # Initial pattern: 10% random minority pixels, relaxed until stable
+    pattern = np.zeros((size, size), dtype=bool)
+    pattern.flat[rng.choice(n, n // 10, replace=False)] = True
+    while True:
+        cluster = tightest_cluster(pattern)
+        pattern.flat[cluster] = False
+        void = largest_void(pattern)
+        pattern.flat[void] = True
+        if void == cluster:
+            break
+
+    ranks = np.zeros(n, dtype=np.int32)
+    ones = int(pattern.sum())
+    work = pattern.copy()
+    for rank in range(ones - 1, -1, -1):
+        cluster = tightest_cluster(work)
+        work.flat[cluster] = False
+        ranks[cluster] = rank
+    work = pattern.copy()
+    for rank in range(ones, n):
+        void = largest_void(work)
+        work.flat[void] = True
+        ranks[void] = rank
+    return ranks.reshape(size, size)
+
+
+def blue_noise_mask(size=64):
+    """
+    Blue-noise rank map, cached in memory and in models/blue_noise_<size>.npy.
+
+    Generating one takes a few seconds, so it is only done the first time.
+    """
+    if size in _blue_noise_masks:
+        return _blue_noise_masks[size]
+    path = os.path.join(BLUE_NOISE_DIR, f'blue_noise_{size}.npy')
+    try:
+        mask = np.load(path)
+    except (OSError, ValueError):
+        mask = _void_and_cluster(size)
+        try:
+            os.makedirs(BLUE_NOISE_DIR, exist_ok=True)
+            np.save(path, mask)
+        except OSError as e:
+            print(f'Could not cache blue-noise mask: {e}')
+    _blue_noise_masks[size] = mask
+    return mask
+
+
+def dithering_blue_noise(inMat, samplingF=1, size=64):
+    """Blue-noise threshold-mask dither, in place"""
+    return _threshold_dither(inMat, blue_noise_mask(size), samplingF)
+
+
+# --- Serpentine diffusion variants ---
+#
+# Kernels as (dx, dy, weight) relative to the current pixel for a left-to-right
+# row; odd rows run right-to-left with dx mirrored. Contributions to the
+# current row are applied pixel by pixel, contributions to the rows below once
+# per row with numpy. Sequential by nature, so slower than the variants above.
+
+ATKINSON_KERNEL = ([(1, 0, 1), (2, 0, 1), (-1, 1, 1), (0, 1, 1), (1, 1, 1), (0, 2, 1)], 8)
+STUCKI_KERNEL = ([(1, 0, 8), (2, 0, 4),
+                  (-2, 1, 2), (-1, 1, 4), (0, 1, 8), (1, 1, 4), (2, 1, 2),
+                  (-2, 2, 1), (-1, 2, 2), (0, 2, 4), (1, 2, 2), (2, 2, 1)], 42)
+
+
+def _serpentine_diffusion(inMat, samplingF, kernel, serpentine=True):
+    weights, divisor = kernel
+    h = inMat.shape[0]
+    w = inMat.shape[1]
+    work = inMat.astype(np.float64)
+    step = 255 / samplingF
+    forward = [(dx, wt / divisor) for dx, dy, wt in weights if dy == 0]
+    below = [(dx, dy, wt / divisor) for dx, dy, wt in weights if dy > 0]
+
+    for y in range(h):
+        flip = serpentine and y % 2 == 1
+        row = work[y, ::-1] if flip else work[y]
+        values = row.tolist()
+        errors = [0.0] * w
+        for x in range(w):
+            old_p = values[x]
+            new_p = min(255.0, max(0.0, round(samplingF * old_p / 255.0) * step))
+            values[x] = new_p
+            quant_error = old_p - new_p
+            errors[x] = quant_error
+            for dx, wt in forward:
+                if x + dx < w:
+                    values[x + dx] += quant_error * wt
+        row[:] = values
+
+        errors = np.array(errors)
+        for dx, dy, wt in below:
+            if y + dy >= h or abs(dx) >= w:
+                continue
+            target = work[y + dy, ::-1] if flip else work[y + dy]
+            if dx >= 0:
+                target[dx:] += errors[:w - dx] * wt
+            else:
+                target[:dx] += errors[-dx:] * wt
+
+    inMat[...] = np.clip(work, 0, 255)
+    return inMat
+
+
+def dithering_atkinson(inMat, samplingF=1, serpentine=True):
+    """Atkinson error diffusion (6/8 of the error kept), single channel, in place"""
+    return _serpentine_diffusion(inMat, samplingF, ATKINSON_KERNEL, serpentine)
+
+
+def dithering_stucki(inMat, samplingF=1, serpentine=True):
+    """Stucki error diffusion, single channel, in place"""
+    return _serpentine_diffusion(inMat, samplingF, STUCKI_KERNEL, serpentine)
+
+
+# Names accepted by dither() (and the CONTINENTE_DITHER / NUBES_FRONTERA_DITHER
+# settings in cumulus.py)
+DITHER_METHODS = {
+    'floyd-steinberg': lambda m, s: dithering_gray(m, s),
+    'bayer2': lambda m, s: dithering_ordered(m, s, 2),
+    'bayer4': lambda m, s: dithering_ordered(m, s, 4),
+    'bayer8': lambda m, s: dithering_ordered(m, s, 8),
+    'bayer16': lambda m, s: dithering_ordered(m, s, 16),
+    'blue-noise': lambda m, s: dithering_blue_noise(m, s),
+    'atkinson': lambda m, s: dithering_atkinson(m, s),
+    'stucki': lambda m, s: dithering_stucki(m, s),
+}
+
+
+def dither(inMat, method='floyd-steinberg', samplingF=1):
+    """Dither a gray image in place with one of DITHER_METHODS"""
+    if method not in DITHER_METHODS:
+        raise ValueError(f'Unknown dithering method {method!r}, '
+                         f'expected one of {", ".join(DITHER_METHODS)}')
+    return DITHER_METHODS[method](inMat, samplingF)
+
+
+if __name__ == '__main__':
+    # Correctness check against the per-pixel loops, plus a benchmark:
+    #   python3 dithering.py [image]
+    import os
+    import sys
+    import time
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        script_dir, 'crossing_images', 'crossing_01.jpg')
+    color = cv2.resize(cv2.imread(path), (880, 528), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(color, cv2.COLOR_BGR2GRAY)
+
+    for name, fast, loop, img in (('gray', dithering_gray, _dithering_gray_loop, gray),
+                                  ('color', dithering_color, _dithering_color_loop, color)):
+        start = time.perf_counter()
+        expected = loop(img.copy(), 1)
+        loop_s = time.perf_counter() - start
+        start = time.perf_counter()
+        got = fast(img.copy(), 1)
+        fast_s = time.perf_counter() - start
+        match = np.array_equal(expected, got)
+        print(f'{name:5s} {img.shape}: loop {loop_s:.2f}s, vectorized {fast_s * 1000:.0f}ms '
+              f'({loop_s / fast_s:.0f}x), identical: {match}')
+        if not match:
+            sys.exit(1)
+
+    for method in DITHER_METHODS:
+        if method == 'floyd-steinberg':
+            continue
+        start = time.perf_counter()
+        dither(gray.copy(), method)
+        print(f'{method:15s} {(time.perf_counter() - start) * 1000:7.0f}ms')
@@ -0,0 +1,211 @@
+"""
+E-paper output helpers.
+
+Writes dithered gray arrays as 1-bit BMPs directly with numpy.packbits,
+instead of Image.fromarray(...).convert('1').save(...). The bytes match what
+PIL produced for these files (and what the ESP32 firmware parses): 14-byte
+file header, 40-byte BITMAPINFOHEADER, 2-entry palette (0 = black,
+1 = white), MSB-first pixels, bottom-up rows padded to 4 bytes.
+
+With delta=True the previous BMP at the same path is XORed with the new
+one and the changed regions are written next to it, so a device that already
+shows the previous frame can fetch and partially refresh only those:
+
+    continente.delta       'EPD1' header + packed bytes of each dirty rectangle
+    continente.delta.json  rectangles, their offsets in .delta, base/new CRCs
+
+Rectangles are in top-down image coordinates, aligned to whole bytes (8
+pixels) horizontally and to DELTA_ROW_ALIGN rows vertically.
+
+Usage:
+    from epaper import write_bmp_1bit
+    write_bmp_1bit(dithered_gray, 'public/images/continente.bmp')   # 880x528
+    write_bmp_1bit(dithered_gray, 'continente_1360x480.bmp')        # 1360x480
+    write_bmp_1bit(dithered_gray, 'public/images/continente.bmp', delta=True)
+"""
+
+import os
+import json
+import zlib
+import struct
+import numpy as np
+
+BMP_HEADER_SIZE = 14 + 40 + 8
+# PIL's default 96 dpi, in pixels per metre
+BMP_PPM = 3780
+
+DELTA_MAGIC = b'EPD1'
+# Vertical granularity of dirty rectangles (rows)
+DELTA_ROW_ALIGN = 8
+# Unchanged byte columns tolerated inside one rectangle before splitting it
+DELTA_MERGE_GAP = 4
+# Beyond this many rectangles (or coverage) a full refresh is cheaper
+DELTA_MAX_RECTS = 16
+DELTA_MAX_COVERAGE = 0.6
+
+
+def pack_rows(gray):
+    """
+    Threshold (>= 128 is white) and pack a (h, w) array into 1-bit rows.
+
+    Returns a (h, row_bytes) uint8 array, top-down, each row padded to a
+    multiple of 4 bytes as BMP requires.
+    """
+    gray = np.asarray(gray)
+    if gray.ndim != 2:
+        raise ValueError(f'Expected a single-channel image, got shape {gray.shape}')
+    h, w = gray.shape
+    packed = np.packbits(gray >= 128, axis=1, bitorder='big')
+    row_bytes = (packed.shape[1] + 3) & ~3
+    if row_bytes != packed.shape[1]:
+        packed = np.pad(packed, ((0, 0), (0, row_bytes - packed.shape[1])))
+    return packed
+
+
+def bmp_header(w, h):
+    """File header, info header and black/white palette for a w x h 1-bit BMP"""
+    row_bytes = (((w + 7) // 8) + 3) & ~3
+    image_size = row_bytes * h
+    return (
+        struct.pack('<2sIHHI', b'BM', BMP_HEADER_SIZE + image_size, 0, 0, BMP_HEADER_SIZE)
+        + struct.pack('<IiiHHIIiiII', 40, w, h, 1, 1, 0, image_size,
+                      BMP_PPM, BMP_PPM, 2, 2)
+        + bytes([0, 0, 0, 0, 255, 255, 255, 0])
+    )
+
+
+def encode_bmp_1bit(gray):
+    """1-bit BMP file contents for a dithered (h, w) gray array"""
+    packed = pack_rows(gray)
+    h, w = np.asarray(gray).shape
+    # BMP rows are stored bottom-up
+    return bmp_header(w, h) + packed[::-1].tobytes()
+
+
+def read_bmp_rows(path):
+    """Packed top-down rows of a 1-bit BMP written by encode_bmp_1bit, or None"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < BMP_HEADER_SIZE or data[:2] != b'BM':
+        return None
+    w, h = struct.unpack_from('<ii', data, 18)
+    bits, = struct.unpack_from('<H', data, 28)
+    offset, = struct.unpack_from('<I', data, 10)
+    row_bytes = (((w + 7) // 8) + 3) & ~3
+    if bits != 1 or h <= 0 or len(data) < offset + row_bytes * h:
+        return None
+    rows = np.frombuffer(data, dtype=np.uint8, count=row_bytes * h, offset=offset)
+    return rows.reshape(h, row_bytes)[::-1]
+
+
+def _write_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def dirty_rects(old_rows, new_rows, width):
+    """
+    Merged rectangles covering every changed byte between two packed frames.
+
+    Returns a list of (x_byte, y, w_bytes, h) in top-down row coordinates.
+    """
+    changed = (old_rows != new_rows)[:, :(width + 7) // 8]
+    h, n_bytes = changed.shape
+    rects = []
+    open_rects = []
+    for y0 in range(0, h, DELTA_ROW_ALIGN):
+        band = changed[y0:y0 + DELTA_ROW_ALIGN].any(axis=0)
+        cols = np.flatnonzero(band)
+        # Column runs in this band, bridging small unchanged gaps
+        runs = []
+        for c in cols:
+            if runs and c - runs[-1][1] <= DELTA_MERGE_GAP:
+                runs[-1][1] = c
+            else:
+                runs.append([c, c])
+        band_h = min(DELTA_ROW_ALIGN, h - y0)
+        next_open = []
+        for c0, c1 in runs:
+            # Extend an open rectangle from the band above when spans overlap
+            for rect in open_rects:
+                if rect[0] <= c1 + DELTA_MERGE_GAP and c0 <= rect[0] + rect[2] - 1 + DELTA_MERGE_GAP:
+                    open_rects.remove(rect)
+                    x0 = min(rect[0], c0)
+                    x1 = max(rect[0] + rect[2] - 1, c1)
+                    rect = [x0, rect[1], x1 - x0 + 1, y0 + band_h - rect[1]]
+                    break
+            else:
+                rect = [c0, y0, c1 - c0 + 1, band_h]
+            next_open.append(rect)
+        rects.extend(open_rects)
+        open_rects = next_open
+    rects.extend(open_rects)
+    return [tuple(int(v) for v in r) for r in sorted(rects, key=lambda r: (r[1], r[0]))]
+
+
+def write_delta(old_rows, new_rows, width, height, path):
+    """
+    Write <path>.delta and <path>.delta.json describing new_rows relative to old_rows.
+
+    Falls back to a single full-frame rectangle when there is no usable base
+    frame or the change is too large for a partial refresh to pay off.
+    """
+    n_bytes = (width + 7) // 8
+    full = old_rows is None or old_rows.shape != new_rows.shape
+    rects = [] if full else dirty_rects(old_rows, new_rows, width)
+    coverage = sum(r[2] * r[3] for r in rects) / float(n_bytes * height)
+    if not full and (len(rects) > DELTA_MAX_RECTS or coverage > DELTA_MAX_COVERAGE):
+        full = True
+    if full:
+        rects = [(0, 0, n_bytes, height)]
+
+    payload = [DELTA_MAGIC + struct.pack('<HHH', width, height, len(rects))]
+    offset = len(payload[0]) + 8 * len(rects)
+    listing = []
+    for x_byte, y, w_bytes, h in rects:
+        payload[0] += struct.pack('<HHHH', x_byte, y, w_bytes, h)
+    for x_byte, y, w_bytes, h in rects:
+        block = np.ascontiguousarray(new_rows[y:y + h, x_byte:x_byte + w_bytes]).tobytes()
+        listing.append({'x': x_byte * 8, 'y': y, 'w': min(w_bytes * 8, width - x_byte * 8), 'h': h,
+                        'x_byte': x_byte, 'w_bytes': w_bytes,
+                        'offset': offset, 'length': len(block)})
+        payload.append(block)
+        offset += len(block)
+
+    data = b''.join(payload)
+    _write_atomic(path + '.delta', data)
+    info = {
+        'width': width,
+        'height': height,
+        'full': full,
+        'base_crc32': None if old_rows is None else zlib.crc32(old_rows.tobytes()),
+        'crc32': zlib.crc32(new_rows.tobytes()),
+        'bytes': len(data),
+        'rects': listing,
+    }
+    _write_atomic(path + '.delta.json', json.dumps(info, indent=1).encode())
+    return info
+
+
+def write_bmp_1bit(gray, path, delta=False):
+    """
+    Write a dithered (h, w) gray array as a 1-bit BMP.
+
+    Written to a temporary file and renamed, so a device fetching the BMP
+    never sees a half-written file. With delta=True the change against the
+    BMP previously at path is also written (see write_delta) and its
+    description returned; otherwise returns the number of bytes written.
+    """
+    packed = pack_rows(gray)
+    h, w = np.asarray(gray).shape
+    old_rows = read_bmp_rows(path) if delta else None
+    data = bmp_header(w, h) + packed[::-1].tobytes()
+    if delta:
+        info = write_delta(old_rows, packed, w, h, path)
+    _write_atomic(path, data)
+    return info if delta else len(data)
@@ -0,0 +1,152 @@
+"""
+E-paper rendering stage: one fetched frame per source -> every display size.
+
+A source is the portrait gray frame as NOAA returns it (e.g. 816x1360). Each
+display entry crops/resizes it to its own portrait size, rotates it once to
+landscape, pastes a caption strip, dithers and writes the 1-bit BMP (plus a
+delta, see epaper.py).
+
+The caption is drawn once on a small black strip and rotated on its own,
+instead of drawing on the full frame between rotations. The strip is opaque
+and the text stays inside it, so the result is the same as drawing on the
+frame.
+
+Display entries are dicts:
+    size     (width, height) of the landscape panel, e.g. (880, 528) or (1360, 480)
+    path     output BMP path
+    caption  caption text (optional)
+    dither   dithering method name (see dithering.DITHER_METHODS)
+    crop     (top, bottom) fractions of the source to drop (optional)
+    flip     rotate the source 180 degrees before rendering (optional)
+    inset    gray image placed at the landscape-right edge, past the caption (optional)
+    side_caption  caption on a strip at the landscape-right edge, past the inset (optional)
+    info_bar      (bottom_text, top_text) on a black bar over the landscape-left edge (optional)
+
+The side caption and info bar are the strips the Node renderer drew on the
+1360x480 continent frame: "Mexico - United States Border" next to the border
+inset, and MORAKANA / CUMULUS - <year> on the left. Their text reads bottom
+to top.
+
+Usage:
+    from epaper_render import render_displays
+    render_displays(source_gray, [{'size': (880, 528), 'path': 'continente.bmp',
+                                   'caption': 'Cumulus 2025- American Continent'}])
+"""
+
+import cv2
+import numpy as np
+
+import dithering
+import epaper
+
+CAPTION_H = 22
+CAPTION_BASELINE = 15
+CAPTION_X = 5
+
+# Info bar (Node's 17px text on a 32px bar)
+INFO_W = 32
+INFO_SCALE = 0.7
+INFO_BASELINE = 23
+INFO_TOP_MARGIN = 13
+INFO_BOTTOM_MARGIN = 17
+# Side caption: text ends this far below the top edge
+SIDE_CAPTION_MARGIN = 15
+
+_caption_strips = {}
+
+
+def caption_strip(text, width):
+    """CAPTION_H x width white-on-black strip with text, as cumulus.py drew it"""
+    key = (text, width)
+    if key not in _caption_strips:
+        strip = np.zeros((CAPTION_H, width), dtype=np.uint8)
+        cv2.putText(strip, text, (CAPTION_X, CAPTION_BASELINE), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.5, (255, 255, 255, 255), 1, cv2.LINE_AA, False)
+        if len(_caption_strips) > 16:
+            _caption_strips.clear()
+        _caption_strips[key] = strip
+    return _caption_strips[key]
+
+
+def vertical_strip(width, length, texts, scale=0.5, baseline=CAPTION_BASELINE):
+    """
+    length x width black strip with white text reading bottom to top.
+
+    texts are (text, anchor, margin): anchor 'start' puts the start of the
+    text margin px above the bottom, 'end' its end margin px below the top.
+    """
+    key = (width, length, tuple(texts), scale, baseline)
+    if key not in _caption_strips:
+        # Drawn horizontally, then rotated: the left end becomes the bottom
+        strip = np.zeros((width, length), dtype=np.uint8)
+        for text, anchor, margin in texts:
+            (text_w, _), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, 1)
+            x = margin if anchor == 'start' else length - margin - text_w
+            cv2.putText(strip, text, (x, baseline), cv2.FONT_HERSHEY_SIMPLEX,
+                        scale, (255, 255, 255, 255), 1, cv2.LINE_AA, False)
+        if len(_caption_strips) > 16:
+            _caption_strips.clear()
+        _caption_strips[key] = cv2.rotate(strip, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return _caption_strips[key]
+
+
+def render_panel(source_gray, size, caption=None, crop=None, inset=None, flip=False,
+                 side_caption=None, info_bar=None):
+    """
+    Landscape (height, width) gray panel for one display.
+
+    The portrait source is rotated 90 degrees counter-clockwise, which is the
+    net rotation cumulus.py has always applied to both e-paper images.
+    """
+    width, height = size
+    inset_w = 0 if inset is None else inset.shape[1]
+    side_w = CAPTION_H if side_caption else 0
+    # Portrait content size: landscape height becomes the portrait width
+    portrait_w, portrait_h = height, width - inset_w - side_w
+
+    content = source_gray
+    if flip:
+        content = content[::-1, ::-1]
+    if crop:
+        top = int(round(crop[0] * content.shape[0]))
+        bottom = content.shape[0] - int(round(crop[1] * content.shape[0]))
+        content = content[top:bottom]
+    if content.shape[:2] != (portrait_h, portrait_w):
+        content = cv2.resize(content, (portrait_w, portrait_h), interpolation=cv2.INTER_AREA)
+    elif not content.flags['C_CONTIGUOUS']:
+        content = np.ascontiguousarray(content)
+
+    panel = np.empty((height, width), dtype=np.uint8)
+    panel[:, :portrait_h] = cv2.rotate(content, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    if caption:
+        # Portrait rows [h-22, h) land on landscape columns [h-22, h)
+        strip = caption_strip(caption, portrait_w)
+        panel[:, portrait_h - CAPTION_H:portrait_h] = cv2.rotate(strip, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    if inset_w:
+        if inset.shape[0] != height:
+            inset = cv2.resize(inset, (inset_w, height), interpolation=cv2.INTER_AREA)
+        panel[:, portrait_h:portrait_h + inset_w] = inset
+    if side_caption:
+        panel[:, width - side_w:] = vertical_strip(side_w, height, [(side_caption, 'end', SIDE_CAPTION_MARGIN)])
+    if info_bar:
+        bottom_text, top_text = info_bar
+        panel[:, :INFO_W] = vertical_strip(INFO_W, height, [(bottom_text, 'start', INFO_BOTTOM_MARGIN),
+                                                            (top_text, 'end', INFO_TOP_MARGIN)],
+                                           INFO_SCALE, INFO_BASELINE)
+    return panel
+
+
+def render_displays(source_gray, displays, delta=True):
+    """Render, dither and write every display from one source frame"""
+    written = []
+    for display in displays:
+        panel = render_panel(source_gray, display['size'], display.get('caption'),
+                             display.get('crop'), display.get('inset'), display.get('flip', False),
+                             display.get('side_caption'), display.get('info_bar'))
+        dithered = dithering.dither(panel, display.get('dither', 'floyd-steinberg'))
+        info = epaper.write_bmp_1bit(dithered, display['path'], delta=delta)
+        if delta:
+            print(f"{display['path']}: {'full' if info['full'] else len(info['rects'])} delta, "
+                  f"{info['bytes']} bytes")
+        written.append(display['path'])
+    return written
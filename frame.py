@@ -0,0 +1,158 @@
+"""
+One image buffer shared between PIL, cv2, numpy and torch.
+
+A Frame owns a single uint8 array (RGB from PIL, or BGR from cv2) and hands
+out views of it, caching anything it has to compute. Copies only happen when
+a consumer really needs a different layout (a contiguous BGR buffer for cv2 drawing, a PIL
+image, a float tensor); each one is counted so a run can report how many
+conversions it did and how many bytes they copied.
+
+Usage:
+    from frame import Frame, conversion_report
+    frame = Frame.from_pil(img)
+    frame.rgb            # (h, w, 3) array, no copy for PIL-built frames
+    frame.bgr()          # contiguous BGR, cached (writable=True for a private copy)
+    frame.gray()         # cached single-channel array
+    frame.crop(box)      # Frame over a view of the same buffer
+    frame.tensor()       # (1, 3, h, w) float32 torch tensor in [0, 1]
+    print(conversion_report())
+"""
+
+from collections import Counter
+
+import numpy as np
+from PIL import Image
+
+_conversions = Counter()
+_bytes_copied = Counter()
+
+
+def _count(kind, nbytes):
+    _conversions[kind] += 1
+    _bytes_copied[kind] += int(nbytes)
+
+
+def conversion_stats():
+    """{'conversions': {kind: n}, 'bytes_copied': {kind: bytes}, 'total_bytes': n}"""
+    return {
+        'conversions': dict(_conversions),
+        'bytes_copied': dict(_bytes_copied),
+        'total_bytes': sum(_bytes_copied.values()),
+    }
+
+
+def conversion_report():
+    """One-line summary of the conversions done so far in this process"""
+    stats = conversion_stats()
+    parts = [f"{kind} x{n} ({stats['bytes_copied'][kind] / 1e6:.1f}MB)"
+             for kind, n in sorted(stats['conversions'].items())]
+    return f"Frame conversions: {', '.join(parts) or 'none'}; {stats['total_bytes'] / 1e6:.1f}MB copied"
+
+
+def reset_stats():
+    _conversions.clear()
+    _bytes_copied.clear()
+
+
+class Frame:
+    """Single uint8 image buffer (RGB or BGR order) with lazily computed, cached views"""
+
+    def __init__(self, rgb=None, bgr=None):
+        base = rgb if rgb is not None else bgr
+        if base is None or base.ndim != 3 or base.shape[2] != 3 or base.dtype != np.uint8:
+            raise ValueError('Frame expects an (h, w, 3) uint8 array')
+        self._rgb = rgb
+        self._bgr = bgr
+        self._cache = {}
+
+    @classmethod
+    def from_pil(cls, img):
+        """Frame from a PIL image (one copy out of PIL's internal storage)"""
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        rgb = np.asarray(img)
+        _count('pil->numpy', rgb.nbytes)
+        frame = cls(rgb=rgb)
+        frame._cache['pil'] = img
+        return frame
+
+    @classmethod
+    def from_bgr(cls, bgr):
+        """Frame over a cv2 BGR array, without copying it"""
+        return cls(bgr=bgr)
+
+    @property
+    def shape(self):
+        return (self._rgb if self._rgb is not None else self._bgr).shape
+
+    @property
+    def size(self):
+        """(width, height), as PIL reports it"""
+        return self.shape[1], self.shape[0]
+
+    @property
+    def rgb(self):
+        """RGB array; a copy only if the frame was built from BGR"""
+        if self._rgb is None:
+            self._rgb = np.ascontiguousarray(self._bgr[:, :, ::-1])
+            _count('bgr->rgb', self._rgb.nbytes)
+        return self._rgb
+
+    def bgr(self, writable=False):
+        """
+        Contiguous BGR array for cv2, cached.
+
+        The cached array must not be drawn on; writable=True returns a
+        private copy instead.
+        """
+        if self._bgr is None:
+            self._bgr = np.ascontiguousarray(self._rgb[:, :, ::-1])
+            _count('rgb->bgr', self._bgr.nbytes)
+        if writable:
+            _count('bgr copy', self._bgr.nbytes)
+            return self._bgr.copy()
+        return self._bgr
+
+    def gray(self):
+        """Single-channel luminance (ITU-R 601), from whichever order is held"""
+        if 'gray' not in self._cache:
+            import cv2
+            if self._rgb is not None:
+                gray = cv2.cvtColor(np.ascontiguousarray(self._rgb), cv2.COLOR_RGB2GRAY)
+            else:
+                gray = cv2.cvtColor(np.ascontiguousarray(self._bgr), cv2.COLOR_BGR2GRAY)
+            _count('gray', gray.nbytes)
+            self._cache['gray'] = gray
+        return self._cache['gray']
+
+    def pil(self):
+        """PIL image of the frame (PIL always stores its own copy)"""
+        if 'pil' not in self._cache:
+            self._cache['pil'] = Image.fromarray(np.ascontiguousarray(self.rgb), 'RGB')
+            _count('numpy->pil', self.rgb.nbytes)
+        return self._cache['pil']
+
+    def crop(self, box):
+        """Frame over the (left, upper, right, lower) box, sharing this buffer"""
+        left, upper, right, lower = box
+        if self._rgb is not None:
+            return Frame(rgb=self._rgb[upper:lower, left:right])
+        return Frame(bgr=self._bgr[upper:lower, left:right])
+
+    def tensor(self):
+        """(1, 3, h, w) float32 tensor in [0, 1]; the only copy is the float conversion"""
+        if 'tensor' not in self._cache:
+            import torch
+            chw = np.ascontiguousarray(self.rgb.transpose(2, 0, 1), dtype=np.float32)
+            self._cache['tensor'] = torch.from_numpy(chw).unsqueeze(0).div_(255.0)
+            _count('numpy->tensor', self._cache['tensor'].numel() * 4)
+        return self._cache['tensor']
+
+    @classmethod
+    def from_tensor(cls, tensor):
+        """Frame from a (1, 3, h, w) or (3, h, w) float tensor in [0, 1]"""
+        if tensor.dim() == 4:
+            tensor = tensor.squeeze(0)
+        rgb = tensor.clamp(0, 1).mul(255.0).round().byte().permute(1, 2, 0).contiguous().numpy()
+        _count('tensor->numpy', rgb.nbytes)
+        return cls(rgb=rgb)
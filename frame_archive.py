@@ -0,0 +1,88 @@
+"""
+Archived border frames: the 1000x500 JPEGs that backfill.py re-scores and
+replay.py / noaa_stub.py serve, found under any mix of directories.
+
+A frame's time comes from its name, in either format the pipeline writes:
+
+    border_2025-08-19_12-58-06.jpg           border_images/, cumulus_archive/
+    2025-08-19 12:58:06.123456.jpg           public/images/frontera/
+    original_20250819_125806.jpg             border_images/ml_detection/
+
+and from its mtime otherwise. Frames are returned oldest first. The ML
+script's original_*.jpg is its own download of a frame that cumulus.py
+also archived, seconds to minutes apart. An original_ within
+DEDUPE_WINDOW of another frame is dropped, and so is any frame with the
+same timestamp as one already found, so a walk over border_images/
+yields each frame once.
+
+Usage:
+    import frame_archive
+    for ts, path in frame_archive.find_frames(['border_images'], since=..., until=...):
+        ...
+"""
+
+import os
+import re
+import bisect
+import datetime
+
+import geo
+
+# An ML original_*.jpg this close to another frame is the same NOAA frame
+DEDUPE_WINDOW = 300
+
+_FRAME_TIME = re.compile(r'(\d{4}-\d{2}-\d{2})[ _T](\d{2})[-:](\d{2})[-:](\d{2})')
+_ML_FRAME_TIME = re.compile(r'original_(\d{8})_(\d{6})')
+
+
+def frame_time(path):
+    """Epoch seconds of a frame, from its filename or else its mtime"""
+    name = os.path.basename(path)
+    m = _FRAME_TIME.search(name)
+    if m:
+        return datetime.datetime.strptime(' '.join(m.groups()), '%Y-%m-%d %H %M %S').timestamp()
+    m = _ML_FRAME_TIME.search(name)
+    if m:
+        return datetime.datetime.strptime(''.join(m.groups()), '%Y%m%d%H%M%S').timestamp()
+    return os.path.getmtime(path)
+
+
+def _is_ml_copy(path):
+    return os.path.basename(path).startswith('original_')
+
+
+def find_frames(paths, since=None, until=None, dedupe_window=DEDUPE_WINDOW):
+    """[(ts, path)] of the distinct 1000x500 JPEG frames under paths within [since, until), oldest first"""
+    from PIL import Image
+    found = []
+    for path in paths:
+        if os.path.isfile(path):
+            candidates = [path]
+        else:
+            candidates = sorted(os.path.join(root, name) for root, _, names in os.walk(path)
+                                for name in names if name.lower().endswith(('.jpg', '.jpeg')))
+        for candidate in candidates:
+            ts = frame_time(candidate)
+            if (since is not None and ts < since) or (until is not None and ts >= until):
+                continue
+            try:
+                with Image.open(candidate) as img:
+                    if img.size != geo.FRAME_SIZE:
+                        continue
+            except OSError:
+                continue
+            found.append((ts, os.path.abspath(candidate)))
+
+    # Same timestamp: keep the first found; ML copies: drop near any archived frame
+    archived = sorted(ts for ts, path in found if not _is_ml_copy(path))
+    frames, seen = [], set()
+    for ts, path in found:
+        if ts in seen:
+            continue
+        if _is_ml_copy(path) and dedupe_window:
+            i = bisect.bisect_left(archived, ts - dedupe_window)
+            if i < len(archived) and archived[i] <= ts + dedupe_window:
+                continue
+        seen.add(ts)
+        frames.append((ts, path))
+    return sorted(frames)
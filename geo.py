@@ -0,0 +1,291 @@
+"""
+Projections between lat/lon, Web Mercator (EPSG:102100), border-frame
+pixels and the display compression, shared by every script.
+
+All functions take scalars or numpy arrays (vectorized; scalars in give
+plain Python numbers out, so results can go straight into JSON).
+
+    lat/lon  <->  Web Mercator  <->  frame pixel (1000x500 over BORDER_BBOX)
+                                          <->  display pixel (frontera.json)
+
+Display pixels are frame pixels with y compressed by 0.83 around y=250, to
+match NOAA's squeezed tile; frontera.json and the web page use them.
+
+Crossing crops are centered on a display pixel: the compression is undone
+and the y offset scaled by the empirical CROP_Y_CALIBRATION (0.95) before
+mapping back to Web Mercator. The arithmetic is kept in the same order as
+cumulus.py always used, so the exportImage queries are unchanged.
+
+Usage:
+    import geo
+    x, y = geo.lat_lon_to_web_mercator(lats, lons)
+    px, py = geo.web_mercator_to_pixel(x, y)
+    bboxes = geo.crossing_crop_bboxes(xy)             # (N, 4), one per crossing
+    query = geo.export_query(bboxes[i], geo.CROSSING_CROP_SIZE)
+
+    python3 geo.py    # round-trip checks
+"""
+
+import numpy as np
+
+# Half the Web Mercator world width, in metres
+MERCATOR_EXTENT = 20037508.34
+
+# Border frame: [west, north, east, south] in Web Mercator, rendered at FRAME_SIZE
+BORDER_BBOX = (-13041000, 3871000, -10845000, 2961000)
+FRAME_SIZE = (1000, 500)
+
+# frontera.json / web y compression around y=250
+DISPLAY_Y_SCALE = 0.83
+DISPLAY_Y_CENTER = 250
+# Empirical calibration of the crop center's y, applied after decompression
+CROP_Y_CALIBRATION = 0.95
+
+# Crossing crops: native NOAA resolution (~1km/px) at zoom 8
+CROSSING_CROP_SIZE = (272, 453)
+CROSSING_ZOOM = 8
+# Legacy zoomclouds image of the primary crossing
+ZOOM_CLOUDS_ZOOM = 4
+ZOOM_CLOUDS_ASPECT = 1.667
+
+# Key points along the actual US-Mexico border (approximate), (lat, lon) west to
+# east; they follow the border geography including the Rio Grande curve
+BORDER_LAT_LON = [
+    # California coast to Arizona
+    (32.534, -117.126),  # Pacific coast
+    (32.534, -117.023),  # San Diego/Tijuana area
+    (32.557, -116.944),  # Otay Mesa area
+    (32.571, -116.627),  # Tecate
+    (32.650, -115.950),  # Curve through mountains
+    (32.671, -115.498),  # Calexico area
+    (32.719, -114.721),  # Andrade
+
+    # Arizona border (more mountainous, irregular)
+    (32.488, -114.777),  # San Luis
+    (32.200, -114.450),  # Curve south
+    (31.879, -112.816),  # Lukeville area
+    (31.600, -112.200),  # Mountain curves
+    (31.489, -111.545),  # Sasabe
+    (31.333, -110.989),  # Nogales area
+    (31.334, -109.948),  # Naco
+    (31.345, -109.546),  # Douglas
+
+    # New Mexico border (shorter, mountainous)
+    (31.335, -108.530),  # Antelope Wells
+    (31.470, -108.200),  # Mountain curve
+    (31.780, -107.720),  # Curve north
+    (31.827, -107.640),  # Columbus area
+    (31.815, -106.572),  # Santa Teresa
+
+    # Texas border (follows Rio Grande river - big curve)
+    (31.759, -106.487),  # El Paso area
+    (31.440, -106.080),  # Tornillo area
+    (31.299, -105.847),  # Fort Hancock
+    (30.900, -105.200),  # River curve southeast
+    (30.400, -104.700),  # River continues
+    (29.560, -104.410),  # Presidio/Ojinaga
+    (29.350, -103.800),  # River curve
+    (29.132, -102.969),  # Big Bend area
+    (29.200, -102.400),  # River curve north
+    (29.468, -101.049),  # Amistad Dam area
+    (29.361, -100.901),  # Del Rio
+    (29.100, -100.600),  # River curve
+    (28.709, -100.508),  # Eagle Pass
+    (28.400, -100.200),  # River continues
+    (27.950, -99.800),   # River curve
+    (27.600, -99.530),   # Laredo area
+    (27.200, -99.200),   # River southeast
+    (26.800, -98.900),   # River curve
+    (26.561, -99.142),   # Falcon Dam area
+    (26.405, -99.016),   # Roma area
+    (26.378, -98.816),   # Rio Grande City
+    (26.270, -98.565),   # Los Ebanos
+    (26.174, -98.314),   # Anzalduas
+    (26.096, -98.267),   # Hidalgo/McAllen
+    (26.071, -98.204),   # Pharr
+    (26.081, -98.049),   # Donna
+    (26.093, -97.957),   # Progreso
+    (26.041, -97.738),   # Los Indios
+    (25.963, -97.520),   # Brownsville area
+    (25.880, -97.473),   # Gulf coast
+]
+
+
+def _out(a):
+    a = np.asarray(a)
+    return a.item() if a.ndim == 0 else a
+
+
+def lat_lon_to_web_mercator(lat, lon):
+    """Convert lat/lon (degrees) to Web Mercator coordinates"""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    x = lon * MERCATOR_EXTENT / 180
+    y = np.log(np.tan((90 + lat) * np.pi / 360)) / (np.pi / 180)
+    y = y * MERCATOR_EXTENT / 180
+    return _out(x), _out(y)
+
+
+def web_mercator_to_lat_lon(x, y):
+    """Convert Web Mercator coordinates to lat/lon (degrees)"""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    lon = x * 180 / MERCATOR_EXTENT
+    lat = np.arctan(np.exp(y * 180 / MERCATOR_EXTENT * np.pi / 180)) * 360 / np.pi - 90
+    return _out(lat), _out(lon)
+
+
+def web_mercator_to_frame(x, y, bbox=BORDER_BBOX, size=FRAME_SIZE):
+    """Web Mercator to (fractional) frame pixel"""
+    west, north, east, south = bbox
+    px = (np.asarray(x, dtype=np.float64) - west) / (east - west) * size[0]
+    py = (north - np.asarray(y, dtype=np.float64)) / (north - south) * size[1]
+    return _out(px), _out(py)
+
+
+def frame_to_web_mercator(px, py, bbox=BORDER_BBOX, size=FRAME_SIZE):
+    """Frame pixel to Web Mercator"""
+    west, north, east, south = bbox
+    x = west - (west - east) / size[0] * np.asarray(px, dtype=np.float64)
+    y = north - (north - south) / size[1] * np.asarray(py, dtype=np.float64)
+    return _out(x), _out(y)
+
+
+def web_mercator_to_pixel(x, y, bbox=BORDER_BBOX, size=FRAME_SIZE):
+    """Web Mercator to integer frame pixel, truncated and clipped to the frame"""
+    px, py = web_mercator_to_frame(x, y, bbox, size)
+    px = np.clip(np.trunc(px).astype(np.int64), 0, size[0] - 1)
+    py = np.clip(np.trunc(py).astype(np.int64), 0, size[1] - 1)
+    return _out(px), _out(py)
+
+
+def compress_y(y):
+    """Frame y to display y (frontera.json)"""
+    return _out(DISPLAY_Y_CENTER + (np.asarray(y, dtype=np.float64) - DISPLAY_Y_CENTER) * DISPLAY_Y_SCALE)
+
+
+def decompress_y(y):
+    """Display y (frontera.json) to frame y"""
+    return _out(DISPLAY_Y_CENTER + (np.asarray(y, dtype=np.float64) - DISPLAY_Y_CENTER) / DISPLAY_Y_SCALE)
+
+
+def lat_lon_to_display(lat, lon):
+    """Lat/lon to (fractional) display pixel, as frontera.json stores crossings"""
+    px, py = web_mercator_to_frame(*lat_lon_to_web_mercator(lat, lon))
+    return px, compress_y(py)
+
+
+def display_to_lat_lon(px, py):
+    """Display pixel back to lat/lon"""
+    return web_mercator_to_lat_lon(*frame_to_web_mercator(px, decompress_y(py)))
+
+
+def crop_center(px, py, decompress=True, bbox=BORDER_BBOX, size=FRAME_SIZE):
+    """
+    Web Mercator center of a crop around a display pixel.
+
+    decompress=False keeps the compressed y, as the legacy zoomclouds image
+    always has.
+    """
+    west, north, east, south = bbox
+    if decompress:
+        py = decompress_y(py)
+    x = west - (west - east) / size[0] * np.asarray(px, dtype=np.float64)
+    y = north - (north - south) / size[1] * np.asarray(py, dtype=np.float64) * CROP_Y_CALIBRATION
+    return _out(x), _out(y)
+
+
+def crop_bbox(cx, cy, zoom, aspect, bbox=BORDER_BBOX):
+    """[x0, y0, x1, y1] of a crop 1/zoom of the frame wide, height = width * aspect"""
+    map_w = (bbox[0] - bbox[2]) / zoom
+    map_h = map_w * aspect
+    cx = np.asarray(cx, dtype=np.float64)
+    cy = np.asarray(cy, dtype=np.float64)
+    return _out(np.stack([cx - map_w / 2, cy - map_h / 2, cx + map_w / 2, cy + map_h / 2], axis=-1))
+
+
+def crossing_crop_bboxes(xy, decompress=True):
+    """(N, 4) crossing crop bboxes for an (N, 2) array of display pixels"""
+    xy = np.asarray(xy)
+    w, h = CROSSING_CROP_SIZE
+    cx, cy = crop_center(xy[..., 0], xy[..., 1], decompress)
+    return crop_bbox(cx, cy, CROSSING_ZOOM, h / w)
+
+
+def export_query(bbox, size):
+    """exportImage query string (after bbox=) for a Web Mercator bbox and pixel size"""
+    b = [float(v) for v in bbox]
+    return f"{b[0]}%2C{b[1]}%2C{b[2]}%2C{b[3]}&imageSR=102100&bboxSR=102100&size={size[0]}%2C{size[1]}"
+
+
+if __name__ == '__main__':
+    # Round-trip checks against the scalar code this module replaced
+    import os
+    import sys
+    import json
+    import math
+
+    failures = []
+
+    def check(name, ok):
+        print(f"{name}: {'ok' if ok else 'FAILED'}")
+        if not ok:
+            failures.append(name)
+
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(-80, 80, 10000)
+    lon = rng.uniform(-180, 180, 10000)
+    back = web_mercator_to_lat_lon(*lat_lon_to_web_mercator(lat, lon))
+    check('lat/lon -> mercator -> lat/lon', np.allclose(back[0], lat, atol=1e-9) and np.allclose(back[1], lon, atol=1e-9))
+
+    px, py = rng.uniform(0, 1000, 1000), rng.uniform(0, 500, 1000)
+    back = web_mercator_to_frame(*frame_to_web_mercator(px, py))
+    check('frame -> mercator -> frame', np.allclose(back[0], px) and np.allclose(back[1], py))
+    check('compress -> decompress', np.allclose(decompress_y(compress_y(py)), py))
+    back = lat_lon_to_display(*display_to_lat_lon(px, py))
+    check('display -> lat/lon -> display', np.allclose(back[0], px) and np.allclose(back[1], py))
+
+    def old_lat_lon_to_web_mercator(lat, lon):
+        x = lon * 20037508.34 / 180
+        y = math.log(math.tan((90 + lat) * math.pi / 360)) / (math.pi / 180)
+        return x, y * 20037508.34 / 180
+
+    def old_web_mercator_to_pixel(x, y):
+        pixel_x = int((x - BORDER_BBOX[0]) / (BORDER_BBOX[2] - BORDER_BBOX[0]) * 1000)
+        pixel_y = int((BORDER_BBOX[1] - y) / (BORDER_BBOX[1] - BORDER_BBOX[3]) * 500)
+        return max(0, min(999, pixel_x)), max(0, min(499, pixel_y))
+
+    old = [old_web_mercator_to_pixel(*old_lat_lon_to_web_mercator(a, b)) for a, b in zip(lat[:2000], lon[:2000])]
+    new = np.stack(web_mercator_to_pixel(*lat_lon_to_web_mercator(lat[:2000], lon[:2000])), axis=1)
+    scalar = web_mercator_to_pixel(*lat_lon_to_web_mercator(32.54333, -117.02972))
+    check('pixels match the scalar scripts', np.array_equal(np.array(old), new)
+          and all(type(v) is int for v in scalar))
+
+    # Crop queries must be byte-identical to what cumulus.py built per crossing
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(script_dir, 'public', 'images', 'frontera.json')) as f:
+        points = json.load(f)['points']
+    bprderBB = list(BORDER_BBOX)
+    bboxes = crossing_crop_bboxes([(p['x'], p['y']) for p in points])
+    same = True
+    for pix, bbox in zip(points, bboxes):
+        raw_y = 250 + (pix["y"] - 250) / 0.83
+        abs_x = bprderBB[0] - (bprderBB[0] - bprderBB[2]) / 1000 * pix["x"]
+        abs_y = bprderBB[1] - (bprderBB[1] - bprderBB[3]) / 500 * raw_y * 0.95
+        crossing_map_w = (bprderBB[0] - bprderBB[2]) / 8
+        crossing_map_h = crossing_map_w * (453 / 272)
+        old_bbox = [abs_x - crossing_map_w / 2, abs_y - crossing_map_h / 2,
+                    abs_x + crossing_map_w / 2, abs_y + crossing_map_h / 2]
+        old_query = f"{old_bbox[0]}%2C{old_bbox[1]}%2C{old_bbox[2]}%2C{old_bbox[3]}&imageSR=102100&bboxSR=102100&size=272%2C453"
+        same = same and export_query(bbox, CROSSING_CROP_SIZE) == old_query
+    check(f'{len(points)} crossing crop queries unchanged', same)
+
+    # frontera.json is crossings.json projected to display pixels
+    with open(os.path.join(script_dir, 'cumulus_reference', 'crossings.json')) as f:
+        crossings = json.load(f)
+    dx, dy = lat_lon_to_display([c['coordinates']['lat'] for c in crossings],
+                                [c['coordinates']['lon'] for c in crossings])
+    err = np.hypot(dx - [p['x'] for p in points], dy - [p['y'] for p in points])
+    check(f'frontera.json within 1px of crossings.json (max {err.max():.2f}px)', err.max() < 1.0)
+
+    sys.exit(1 if failures else 0)
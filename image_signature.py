@@ -0,0 +1,75 @@
+"""
+Duplicate-frame detection by thumbnail signature (from remove_duplicates.py).
+
+A signature is the grayscale thumbnail (largest side max_dim, aspect kept)
+as a flat list of pixel values; two frames are duplicates when their mean
+absolute difference is within (100 - threshold)% of full scale. Only PIL is
+needed, so cumulus.py can run the unchanged-frame check before loading
+anything heavier.
+
+Usage:
+    from image_signature import is_duplicate_image
+    if is_duplicate_image(img, previous_path, threshold=98.0): ...
+"""
+
+import os
+
+from PIL import Image
+
+
+def get_image_signature(img, max_dim=64):
+    """Get a small thumbnail signature for comparison. Accepts PIL Image, Frame or filepath.
+    Maintains aspect ratio - scales so largest dimension is max_dim."""
+    try:
+        if isinstance(img, str):
+            img = Image.open(img)
+        elif not isinstance(img, Image.Image):
+            # frame.Frame: its cached gray view, no RGB round trip
+            img = Image.fromarray(img.gray(), 'L')
+        # Calculate new size maintaining aspect ratio
+        w, h = img.size
+        if w > h:
+            new_w = max_dim
+            new_h = max(1, int(h * max_dim / w))
+        else:
+            new_h = max_dim
+            new_w = max(1, int(w * max_dim / h))
+        # Convert to grayscale and resize maintaining aspect ratio
+        thumb = img.convert('L').resize((new_w, new_h), Image.LANCZOS)
+        return list(thumb.getdata())
+    except Exception as e:
+        print(f"Error getting image signature: {e}")
+        return None
+
+
+def compare_signatures(sig1, sig2):
+    """
+    Compare two image signatures.
+    Returns similarity as percentage (0-100).
+    100 = identical, 0 = completely different.
+    """
+    if sig1 is None or sig2 is None:
+        return 0
+    if len(sig1) != len(sig2):
+        # Different aspect ratios - not comparable
+        return 0
+    total_diff = sum(abs(a - b) for a, b in zip(sig1, sig2))
+    max_diff = 255 * len(sig1)
+    similarity = 100 * (1 - total_diff / max_diff)
+    return similarity
+
+
+def is_duplicate_image(new_img, existing_path, threshold=99.5):
+    """
+    Check if new_img is a duplicate of the image at existing_path.
+    Returns True if similarity >= threshold.
+    """
+    if not os.path.exists(existing_path):
+        return False
+    new_sig = get_image_signature(new_img)
+    existing_sig = get_image_signature(existing_path)
+    similarity = compare_signatures(new_sig, existing_sig)
+    if similarity >= threshold:
+        print(f"Duplicate detected: {similarity:.1f}% similar to {os.path.basename(existing_path)}")
+        return True
+    return False
@@ -0,0 +1,191 @@
+"""
+Local stand-in for NOAA's ArcGIS exportImage endpoint, serving crops of
+archived border frames so the pipeline can run offline.
+
+A request's bbox (Web Mercator, either corner order, as ArcGIS accepts)
+is mapped onto the current 1000x500 frame over geo.BORDER_BBOX and
+resampled to the requested size; whatever lies outside the frame is
+black. Crossing crops therefore get the same pixels NOAA's coarser zoom
+levels would, and the continent frame gets the border strip in place.
+
+Frames are archived border frames (border_images/, cumulus_archive/
+frontera/<month>/, public/images/frontera/): the 1000x500 JPEGs found
+under the given paths, each frame once, in time order (see
+frame_archive.py). The replay driver (replay.py) moves
+through them with StubServer.set_frame(); standalone, GET /_replay/next
+advances one frame.
+
+Latency and failures are injected per request, from a seeded RNG:
+    latency   fixed delay in seconds, plus uniform jitter
+    fail_rate fraction of requests answered 503 (NOAA's busy response)
+
+Usage:
+    stub = StubServer(find_frames(['border_images']), latency=0.2, fail_rate=0.05)
+    stub.start()                      # background thread
+    os.environ['CUMULUS_NOAA_URL'] = stub.url
+    stub.set_frame(3)
+    stub.stop()
+
+    python3 noaa_stub.py border_images/ --port 8765 --latency 0.2
+"""
+
+import os
+import io
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from PIL import Image
+
+import geo
+from frame_archive import find_frames as find_archived_frames
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+JPEG_QUALITY = 90
+
+
+def find_frames(paths):
+    """Paths of the distinct 1000x500 frames under the given files/directories, oldest first"""
+    return [path for _, path in find_archived_frames(paths)]
+
+
+def parse_export_query(query):
+    """(bbox, size) of an exportImage query string; bbox normalized to [west, south, east, north]"""
+    params = {k.lower(): v[0] for k, v in parse_qs(query).items()}
+    x0, y0, x1, y1 = (float(v) for v in params['bbox'].split(','))
+    width, height = (int(float(v)) for v in params.get('size', '400,400').split(','))
+    return [min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)], (width, height)
+
+
+def render_export(frame, bbox, size):
+    """Resample the part of a border frame under bbox to size (black outside the frame)"""
+    west, south, east, north = bbox
+    left, top = geo.web_mercator_to_frame(west, north)
+    right, bottom = geo.web_mercator_to_frame(east, south)
+    return frame.transform(size, Image.EXTENT, (left, top, right, bottom),
+                           resample=Image.BILINEAR, fillcolor=(0, 0, 0))
+
+
+class StubServer:
+    """exportImage stand-in over a sequence of archived frames"""
+
+    def __init__(self, frames, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 fail_rate=0.0, seed=0):
+        if not frames:
+            raise ValueError('No 1000x500 frames to serve')
+        self.frames = list(frames)
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._frame = None
+        self.set_frame(0)
+        self.stats = {'requests': 0, 'failures': 0, 'bytes': 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def set_frame(self, index):
+        """Serve frames[index] from now on"""
+        with Image.open(self.frames[index]) as img:
+            frame = img.convert('RGB')
+        with self._lock:
+            self.index = index
+            self._frame = frame
+
+    def _draw(self):
+        """Per-request (delay, fail) from the seeded RNG"""
+        with self._lock:
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            fail = self._rng.random() < self.fail_rate
+        return delay, fail
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == '/_replay/next':
+                    stub.set_frame((stub.index + 1) % len(stub.frames))
+                    return self._send(200, 'text/plain', f'{stub.index}\n'.encode())
+                if not url.path.endswith('/exportImage'):
+                    return self._send(404, 'text/plain', b'not found\n')
+
+                delay, fail = stub._draw()
+                if delay:
+                    time.sleep(delay)
+                with stub._lock:
+                    stub.stats['requests'] += 1
+                    stub.stats['failures'] += fail
+                    frame = stub._frame
+                if fail:
+                    return self._send(503, 'text/plain', b'injected failure\n')
+                try:
+                    bbox, size = parse_export_query(url.query)
+                except (KeyError, ValueError) as e:
+                    return self._send(400, 'text/plain', f'bad request: {e}\n'.encode())
+                buf = io.BytesIO()
+                render_export(frame, bbox, size).save(buf, 'JPEG', quality=JPEG_QUALITY)
+                body = buf.getvalue()
+                with stub._lock:
+                    stub.stats['bytes'] += len(body)
+                self._send(200, 'image/jpeg', body)
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local NOAA exportImage stand-in over archived frames')
+    parser.add_argument('frames', nargs='*', default=[os.path.join(SCRIPT_DIR, 'border_images')],
+                        help='Frame files or directories (default: border_images/)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='Delay per request, seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra uniform delay, seconds')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of requests answered 503')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    stub = StubServer(find_frames(args.frames), args.host, args.port, args.latency, args.jitter,
+                      args.fail_rate, args.seed)
+    print(f'Serving {len(stub.frames)} frames at {stub.url} (GET /_replay/next to advance)')
+    print(f'  CUMULUS_NOAA_URL={stub.url} python3 cumulus.py')
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
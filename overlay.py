@@ -0,0 +1,173 @@
+"""
+Cloud overlay rendering for clouds_ml.jpg (the ML detector's web image).
+
+Same picture create_visualization always drew: the frame at 2x, masked
+pixels blended 15% toward white, white contours around the mask and a
+red/green anti-aliased dot per crossing. Cheaper to get there:
+
+    - the blend is computed over the mask's bounding box only and copied
+      back through the mask with cv2.copyTo (no boolean gather/scatter)
+    - the RGB->BGR swap happens before the 2x LANCZOS resize (a channel
+      permutation commutes with it), on a quarter of the pixels
+
+Deferred mode: the detector stores only what the overlay needs
+(public/images/clouds_ml_pending.npz, uncompressed: frame, probability
+map, points, threshold) and the JPEG is rendered on first use. The web
+server runs `python3 overlay.py render` when clouds_ml.jpg is requested;
+ensure() renders when the pending state is newer than the JPEG, so an
+unchanged frame is never re-rendered. cumulus.py's e-paper inset doesn't
+need the 2x JPEG: inset() draws it at 1x from the pending state and
+shrinks that.
+
+Usage:
+    overlay, mask = render_overlay(frame, prob_map, results, threshold)
+    save_pending(frame, prob_map, results, threshold)    # deferred
+    ensure()                                             # render if pending is newer
+    gray = inset(480)                                    # small gray overlay, either mode
+
+    python3 overlay.py render [--force]
+"""
+
+import os
+import argparse
+
+import cv2
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+OVERLAY_PATH = os.path.join(SCRIPT_DIR, 'public', 'images', 'clouds_ml.jpg')
+PENDING_PATH = os.path.join(SCRIPT_DIR, 'public', 'images', 'clouds_ml_pending.npz')
+
+SCALE = 2
+ALPHA = 0.15
+# Point radius and contour width at SCALE; other scales get them in proportion
+POINT_RADIUS = 10
+CONTOUR_WIDTH = 2
+
+
+def _rgb(image):
+    """RGB array of a Frame, PIL image or array"""
+    rgb = getattr(image, 'rgb', None)
+    return rgb if isinstance(rgb, np.ndarray) else np.asarray(image)
+
+
+def upscaled_base(rgb, scale=SCALE):
+    """BGR frame at scale x (LANCZOS4)"""
+    bgr = cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+    if scale == 1:
+        return bgr
+    return cv2.resize(bgr, (rgb.shape[1] * scale, rgb.shape[0] * scale), interpolation=cv2.INTER_LANCZOS4)
+
+
+def render_overlay(image, prob_map, results, threshold, scale=SCALE, alpha=ALPHA):
+    """(overlay BGR, cloud mask) at scale x; results as detect_at_points returns them"""
+    overlay = upscaled_base(_rgb(image), scale)
+
+    # Upscale prob_map and create cloud mask at 2x
+    prob_map_upscaled = prob_map if scale == 1 else cv2.resize(
+        prob_map, (prob_map.shape[1] * scale, prob_map.shape[0] * scale), interpolation=cv2.INTER_LINEAR)
+    cloud_mask = (prob_map_upscaled > threshold).astype(np.uint8) * 255
+
+    # Blend toward white only inside the mask's bounding box, and copy back
+    # through the mask (same arithmetic as addWeighted over the whole frame)
+    x, y, w, h = cv2.boundingRect(cloud_mask)
+    if w and h:
+        roi = overlay[y:y + h, x:x + w]
+        blended = cv2.addWeighted(roi, 1 - alpha, np.full_like(roi, 255), alpha, 0)
+        cv2.copyTo(blended, cloud_mask[y:y + h, x:x + w], roi)
+
+    # Draw contours (thinner at 2x looks smoother)
+    contours, _ = cv2.findContours(cloud_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    cv2.drawContours(overlay, contours, -1, (255, 255, 255), max(1, CONTOUR_WIDTH * scale // SCALE))  # White in BGR
+
+    # Mark border crossing points with anti-aliased circles (scaled coordinates)
+    radius = max(1, POINT_RADIUS * scale // SCALE)
+    for r in results:
+        x, y = r['point']['x'] * scale, r['point']['y'] * scale
+        color = (255, 0, 0) if r['is_cloud'] else (0, 255, 0)
+        cv2.circle(overlay, (x, y), radius, color, -1, cv2.LINE_AA)
+
+    return overlay, cloud_mask
+
+
+def save_pending(image, prob_map, results, threshold, path=PENDING_PATH):
+    """Store what render_overlay needs, to render later with ensure()"""
+    xy = np.array([(r['point']['x'], r['point']['y']) for r in results], dtype=np.int32).reshape(-1, 2)
+    is_cloud = np.array([bool(r['is_cloud']) for r in results], dtype=bool)
+    tmp_path = path + '.tmp.npz'
+    # Uncompressed: deflating the float map cost more than the overlay it defers
+    np.savez(tmp_path, rgb=_rgb(image), prob_map=prob_map, xy=xy, is_cloud=is_cloud,
+             threshold=np.float64(threshold))
+    os.replace(tmp_path, path)
+
+
+def _load_pending(path, scale=SCALE):
+    with np.load(path) as pending:
+        results = [{'point': {'x': int(x), 'y': int(y)}, 'is_cloud': bool(c)}
+                   for (x, y), c in zip(pending['xy'], pending['is_cloud'])]
+        overlay, _ = render_overlay(pending['rgb'], pending['prob_map'], results, float(pending['threshold']),
+                                    scale=scale)
+    return overlay
+
+
+def render_pending(path=PENDING_PATH, overlay_path=OVERLAY_PATH):
+    """Render the pending overlay to overlay_path"""
+    overlay = _load_pending(path)
+    tmp_path = overlay_path + '.tmp.jpg'
+    cv2.imwrite(tmp_path, overlay)
+    os.replace(tmp_path, overlay_path)
+    return overlay_path
+
+
+def ensure(overlay_path=OVERLAY_PATH, pending_path=PENDING_PATH, force=False):
+    """Render the overlay if the pending state is newer; True when it rendered"""
+    try:
+        pending_mtime = os.path.getmtime(pending_path)
+    except OSError:
+        return False
+    if not force and os.path.exists(overlay_path) and os.path.getmtime(overlay_path) >= pending_mtime:
+        return False
+    render_pending(pending_path, overlay_path)
+    return True
+
+
+def inset(width, overlay_path=OVERLAY_PATH, pending_path=PENDING_PATH):
+    """
+    Gray overlay `width` px wide (INTER_AREA), or None when there is none.
+
+    Drawn at 1x from the pending state when that is newer than the JPEG
+    (deferred mode), else read from the JPEG, so neither mode renders the
+    2x overlay just to shrink it.
+    """
+    try:
+        pending_mtime = os.path.getmtime(pending_path)
+    except OSError:
+        pending_mtime = None
+    if pending_mtime is not None and not (os.path.exists(overlay_path)
+                                          and os.path.getmtime(overlay_path) >= pending_mtime):
+        gray = cv2.cvtColor(_load_pending(pending_path, scale=1), cv2.COLOR_BGR2GRAY)
+    else:
+        gray = cv2.imread(overlay_path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            return None
+    height = round(width * gray.shape[0] / gray.shape[1])
+    return cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render the deferred cloud overlay')
+    sub = parser.add_subparsers(dest='command', required=True)
+    render = sub.add_parser('render', help='Render clouds_ml.jpg if the pending state is newer')
+    render.add_argument('--force', action='store_true', help='Render even if up to date')
+    render.add_argument('--pending', default=PENDING_PATH)
+    render.add_argument('--output', default=OVERLAY_PATH)
+    args = parser.parse_args()
+
+    if ensure(args.output, args.pending, args.force):
+        print(f'Rendered {args.output}')
+    else:
+        print(f'{args.output} is up to date')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Batched sampling and marker drawing for the frontera.json points.
+
+Points are handled as one (N, 2) int array of (x, y) pixels instead of a
+Python loop per point, so the per-run cost stays flat when frontera.json
+grows from 51 crossings to thousands of densified border points.
+
+    xy = points_xy(frontera['points'])
+    samples = sample_rgb(clouds_cv, xy)           # pixel, brightness, RGB flags
+    probs = window_means(prob_map, xy, radius=3)  # 6x6 neighbourhood means
+    draw_markers(clouds_cv, xy, 3, np.where(mask[:, None], (255, 0, 0), (0, 255, 0)))
+
+Neighbourhood means gather each point's window with one fancy index over
+(N, 2r, 2r) offsets, clipped at the map edges. Markers are pasted from a
+filled-circle stamp rendered once per radius with cv2.circle, so they are
+the same pixels cv2.circle draws at each point. With one color per point,
+overlapping markers stack in point order (the last point wins), as a
+cv2.circle loop over the points would draw them.
+"""
+
+import cv2
+import numpy as np
+
+# RGB fallback: a point is cloudy when all three channels reach this
+RGB_CLOUD_LIMIT = 130
+
+_stamps = {}
+
+
+def points_xy(points):
+    """(N, 2) int array of (x, y) from frontera.json point dicts"""
+    if len(points) == 0:
+        return np.zeros((0, 2), dtype=np.intp)
+    return np.array([(p['x'], p['y']) for p in points], dtype=np.intp)
+
+
+def sample_rgb(img, xy, limit=RGB_CLOUD_LIMIT):
+    """
+    Pixels of a 3-channel image at xy, with the RGB cloud heuristic.
+
+    Returns a dict of arrays: 'pixel' (N, 3), 'brightness' (channel mean),
+    'is_cloud' (every channel >= limit) and 'probability' ((brightness -
+    100) / 155, floored at 0), matching what cumulus.py computed per point.
+    """
+    pixel = img[xy[:, 1], xy[:, 0]]
+    brightness = pixel.astype(np.int32).sum(axis=1) / 3
+    return {
+        'pixel': pixel,
+        'brightness': brightness,
+        'is_cloud': (pixel >= limit).all(axis=1),
+        'probability': np.maximum(0, (brightness - 100) / 155),
+    }
+
+
+def window_means(values, xy, radius=3):
+    """
+    Mean of values[y-radius:y+radius, x-radius:x+radius] (clipped) at each point.
+
+    Same windows as the slices detect_at_points took; NaN where a window is
+    empty (a point outside the map).
+    """
+    h, w = values.shape[:2]
+    offsets = np.arange(-radius, radius)
+    ys = xy[:, 1, None, None] + offsets[None, :, None]
+    xs = xy[:, 0, None, None] + offsets[None, None, :]
+    inside = (ys >= 0) & (ys < h) & (xs >= 0) & (xs < w)
+    gathered = values[np.clip(ys, 0, h - 1), np.clip(xs, 0, w - 1)].astype(np.float64)
+    total = np.where(inside, gathered, 0).sum(axis=(1, 2))
+    count = inside.sum(axis=(1, 2))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def _stamp(radius):
+    """(dy, dx) offsets of a filled cv2.circle of this radius"""
+    if radius not in _stamps:
+        size = 2 * radius + 1
+        mask = np.zeros((size, size), dtype=np.uint8)
+        cv2.circle(mask, (radius, radius), radius, 1, -1)
+        dy, dx = np.nonzero(mask)
+        _stamps[radius] = (dy - radius, dx - radius)
+    return _stamps[radius]
+
+
+def draw_markers(img, xy, radius, color):
+    """
+    Filled circles at every point, in place (like cv2.circle(..., -1) per point).
+
+    color is one color, or an (N, channels) array with one color per point,
+    drawn in point order.
+    """
+    if len(xy) == 0:
+        return img
+    dy, dx = _stamp(radius)
+    ys = (xy[:, 1, None] + dy[None, :]).ravel()
+    xs = (xy[:, 0, None] + dx[None, :]).ravel()
+    inside = (ys >= 0) & (ys < img.shape[0]) & (xs >= 0) & (xs < img.shape[1])
+    color = np.asarray(color)
+    if color.ndim < 2:
+        img[ys[inside], xs[inside]] = color
+        return img
+    # Last point covering a pixel wins; fancy-index assignment has no defined order
+    flat = (ys * img.shape[1] + xs)[inside]
+    point = np.repeat(np.arange(len(xy)), len(dy))[inside]
+    _, first_reversed = np.unique(flat[::-1], return_index=True)
+    last = len(flat) - 1 - first_reversed
+    img.reshape(img.shape[0] * img.shape[1], -1)[flat[last]] = color[point[last]].reshape(len(last), -1)
+    return img
+
+
+if __name__ == '__main__':
+    # Check against the per-point loops and benchmark:  python3 point_sampler.py
+    import sys
+    import time
+
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, (500, 1000, 3), dtype=np.uint8)
+    prob_map = rng.random((500, 1000), dtype=np.float32)
+    failures = 0
+    for n in (51, 5000):
+        xy = np.stack([rng.integers(0, 1000, n), rng.integers(0, 500, n)], axis=1)
+
+        start = time.perf_counter()
+        loop_bright, loop_means = [], []
+        loop_img = img.copy()
+        for x, y in xy:
+            p_c = img[y, x]
+            loop_bright.append((int(p_c[0]) + int(p_c[1]) + int(p_c[2])) / 3)
+            loop_means.append(prob_map[max(0, y - 3):min(500, y + 3), max(0, x - 3):min(1000, x + 3)].mean())
+            cv2.circle(loop_img, (int(x), int(y)), 3, (255, 0, 0), -1)
+        loop_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        fast_img = img.copy()
+        samples = sample_rgb(fast_img, xy)
+        means = window_means(prob_map, xy)
+        draw_markers(fast_img, xy, 3, (255, 0, 0))
+        fast_s = time.perf_counter() - start
+
+        # Per-point colors: overlapping markers stack in point order
+        is_cloud = rng.random(n) < 0.5
+        colors = np.where(is_cloud[:, None], (255, 0, 0), (0, 255, 0))
+        order_img, order_loop = img.copy(), img.copy()
+        for (x, y), c in zip(xy, colors):
+            cv2.circle(order_loop, (int(x), int(y)), 3, tuple(int(v) for v in c), -1)
+        draw_markers(order_img, xy, 3, colors)
+
+        ok = (np.array_equal(samples['brightness'], loop_bright)
+              and np.allclose(means, loop_means, atol=1e-6)
+              and np.array_equal(fast_img, loop_img)
+              and np.array_equal(order_img, order_loop))
+        failures += not ok
+        print(f'n={n:5d}: loop {loop_s * 1000:.1f}ms, batched {fast_s * 1000:.1f}ms, '
+              f'{"identical" if ok else "MISMATCH"}')
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,300 @@
+"""
+Memory-mapped time cube of ML cloud probability maps.
+
+Every detection run appends its full prob_map (float16) to a flat binary file,
+with the run time appended to a parallel timestamp index. Archived runs can
+then be queried without re-running the model.
+
+A 1000x500 frame is 1 MB, so the ML script trims the cube after each append
+(trim(): frames older than max_age, or beyond max_frames). Trimming rewrites
+the kept frames, so it only runs once TRIM_SLACK of the limit is over it,
+not on every append.
+
+Layout (inside the cube directory):
+    meta.json    frame shape and dtype
+    cube.f16     frames, back to back (n * h * w float16)
+    times.f64    one epoch timestamp (float64) per frame
+
+Usage:
+    from prob_cube import ProbCube
+    cube = ProbCube('border_images/ml_detection/prob_cube')
+    cube.append(prob_map)
+    cube.trim(max_age=7 * 86400)
+    freq = cube.cloud_frequency(threshold=0.25, since=time.time() - 7 * 86400)
+
+    python3 prob_cube.py border_images/ml_detection/prob_cube info
+    python3 prob_cube.py border_images/ml_detection/prob_cube series --index 12
+    python3 prob_cube.py border_images/ml_detection/prob_cube rolling --index 12 --window 6
+"""
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CUBE_DTYPE = np.float16
+TIME_DTYPE = np.float64
+# trim() waits until this fraction of the limit (frames or age) is over it
+TRIM_SLACK = 0.1
+# Frames copied per read/write while trimming
+TRIM_CHUNK = 64
+
+
+class ProbCube:
+    """Append-only, memory-mapped (time, y, x) cube of probability maps"""
+
+    def __init__(self, path):
+        self.path = path
+        self.meta_path = os.path.join(path, 'meta.json')
+        self.data_path = os.path.join(path, 'cube.f16')
+        self.times_path = os.path.join(path, 'times.f64')
+        self.shape = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.shape = tuple(json.load(f)['shape'])
+
+    def __len__(self):
+        """Number of complete frames (a torn append is ignored)"""
+        if self.shape is None or not os.path.exists(self.data_path):
+            return 0
+        frame_bytes = self.shape[0] * self.shape[1] * np.dtype(CUBE_DTYPE).itemsize
+        n_frames = os.path.getsize(self.data_path) // frame_bytes
+        n_times = os.path.getsize(self.times_path) // np.dtype(TIME_DTYPE).itemsize \
+            if os.path.exists(self.times_path) else 0
+        return min(n_frames, n_times)
+
+    def append(self, prob_map, timestamp=None):
+        """Append one probability map; timestamp defaults to now (epoch seconds)"""
+        prob_map = np.asarray(prob_map)
+        if prob_map.ndim != 2:
+            raise ValueError(f'prob_map must be 2-D, got shape {prob_map.shape}')
+        if timestamp is None:
+            timestamp = time.time()
+
+        if self.shape is None:
+            os.makedirs(self.path, exist_ok=True)
+            self.shape = tuple(int(s) for s in prob_map.shape)
+            with open(self.meta_path, 'w') as f:
+                json.dump({'shape': list(self.shape),
+                           'dtype': np.dtype(CUBE_DTYPE).name}, f)
+        elif tuple(prob_map.shape) != self.shape:
+            raise ValueError(f'prob_map shape {prob_map.shape} does not match cube {self.shape}')
+
+        # Drop any half-written frame left by an interrupted run before appending
+        n = len(self)
+        frame_bytes = self.shape[0] * self.shape[1] * np.dtype(CUBE_DTYPE).itemsize
+        for path, size in ((self.data_path, n * frame_bytes),
+                           (self.times_path, n * np.dtype(TIME_DTYPE).itemsize)):
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+
+        with open(self.data_path, 'ab') as f:
+            f.write(np.ascontiguousarray(prob_map, dtype=CUBE_DTYPE).tobytes())
+        with open(self.times_path, 'ab') as f:
+            f.write(np.array([timestamp], dtype=TIME_DTYPE).tobytes())
+        return n
+
+    def trim(self, max_frames=None, max_age=None, now=None, slack=TRIM_SLACK):
+        """
+        Drop the oldest frames beyond max_frames or older than max_age seconds.
+
+        Returns the number of frames dropped. Nothing is rewritten until the
+        excess reaches `slack` of the limit, so a cube at steady state is
+        compacted every few runs rather than copied on every append.
+        """
+        n = len(self)
+        if n == 0 or (max_frames is None and max_age is None):
+            return 0
+        t = self.times()
+        drop = 0
+        if max_frames is not None and n > max_frames * (1 + slack):
+            drop = n - max_frames
+        if max_age is not None:
+            now = time.time() if now is None else now
+            if t[0] < now - max_age * (1 + slack):
+                drop = max(drop, int(np.searchsorted(t, now - max_age, side='left')))
+        if drop == 0:
+            return 0
+
+        # Copy the kept frames to temporary files, then swap them in
+        frames = self.frames()
+        data_tmp, times_tmp = self.data_path + '.tmp', self.times_path + '.tmp'
+        with open(data_tmp, 'wb') as f:
+            for start in range(drop, n, TRIM_CHUNK):
+                f.write(np.ascontiguousarray(frames[start:min(n, start + TRIM_CHUNK)]).tobytes())
+        with open(times_tmp, 'wb') as f:
+            f.write(t[drop:].tobytes())
+        del frames
+        os.replace(data_tmp, self.data_path)
+        os.replace(times_tmp, self.times_path)
+        return drop
+
+    def times(self):
+        """Timestamps of all frames (epoch seconds)"""
+        n = len(self)
+        if n == 0:
+            return np.zeros(0, dtype=TIME_DTYPE)
+        return np.fromfile(self.times_path, dtype=TIME_DTYPE, count=n)
+
+    def frames(self):
+        """Read-only (n, h, w) memmap over all frames"""
+        n = len(self)
+        if n == 0:
+            return np.zeros((0,) + (self.shape or (0, 0)), dtype=CUBE_DTYPE)
+        return np.memmap(self.data_path, dtype=CUBE_DTYPE, mode='r',
+                         shape=(n,) + self.shape)
+
+    def select(self, since=None, until=None):
+        """Frame indices whose timestamp lies in [since, until)"""
+        t = self.times()
+        keep = np.ones(len(t), dtype=bool)
+        if since is not None:
+            keep &= t >= since
+        if until is not None:
+            keep &= t < until
+        return np.flatnonzero(keep)
+
+    def cloud_frequency(self, threshold=0.25, since=None, until=None, chunk=64):
+        """Per-pixel fraction of frames above threshold, as a float32 (h, w) map"""
+        idx = self.select(since, until)
+        counts = np.zeros(self.shape or (0, 0), dtype=np.uint32)
+        if len(idx) == 0:
+            return counts.astype(np.float32)
+        frames = self.frames()
+        # Work in chunks so only a slice of the cube is paged in at a time
+        for start in range(0, len(idx), chunk):
+            block = frames[idx[start:start + chunk]]
+            counts += (block > threshold).sum(axis=0, dtype=np.uint32)
+        return counts / np.float32(len(idx))
+
+    def point_series(self, points, radius=3, since=None, until=None):
+        """
+        Time series of mean probability around each point.
+
+        Uses the same [y-r:y+r, x-r:x+r] window as CloudDetectorML.detect_at_points.
+        Returns (times, values) with values shaped (n_frames, n_points).
+        """
+        idx = self.select(since, until)
+        values = np.zeros((len(idx), len(points)), dtype=np.float32)
+        if len(idx) == 0:
+            return self.times()[idx], values
+        frames = self.frames()
+        h, w = self.shape
+        for j, pt in enumerate(points):
+            x, y = pt['x'], pt['y']
+            y1, y2 = max(0, y - radius), min(h, y + radius)
+            x1, x2 = max(0, x - radius), min(w, x + radius)
+            window = frames[idx, y1:y2, x1:x2].astype(np.float32)
+            values[:, j] = window.reshape(len(idx), -1).mean(axis=1)
+        return self.times()[idx], values
+
+    def rolling_mean(self, window=6, since=None, until=None, points=None, radius=3, out=None):
+        """
+        Trailing mean over `window` consecutive selected frames, one per frame.
+
+        With points: (times, values) with values shaped (n_frames, n_points),
+        a cumsum over point_series. Without: (times, maps) with maps shaped
+        (n_frames, h, w) float32, from a running sum that reads each frame
+        twice at most; pass out (e.g. np.lib.format.open_memmap) for long
+        spans. The first window - 1 entries average the frames so far.
+        """
+        if window < 1:
+            raise ValueError(f'window must be at least 1, got {window}')
+        if points is not None:
+            t, values = self.point_series(points, radius, since, until)
+            csum = np.cumsum(values, axis=0, dtype=np.float64)
+            csum[window:] -= csum[:-window].copy()
+            counts = np.minimum(np.arange(1, len(t) + 1), window)
+            return t, (csum / counts[:, None]).astype(np.float32)
+        idx = self.select(since, until)
+        if out is None:
+            out = np.zeros((len(idx),) + (self.shape or (0, 0)), dtype=np.float32)
+        if len(idx) == 0:
+            return self.times()[idx], out
+        frames = self.frames()
+        acc = np.zeros(self.shape, dtype=np.float64)
+        for i, frame_index in enumerate(idx):
+            acc += frames[frame_index]
+            if i >= window:
+                acc -= frames[idx[i - window]]
+            out[i] = acc / min(i + 1, window)
+        return self.times()[idx], out
+
+    def recent_mean(self, window=6, since=None, until=None):
+        """Mean of the last `window` selected frames as a float32 (h, w) map"""
+        idx = self.select(since, until)[-window:]
+        if len(idx) == 0:
+            return np.zeros(self.shape or (0, 0), dtype=np.float32)
+        return self.frames()[idx].astype(np.float32).mean(axis=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query the probability-map time cube')
+    parser.add_argument('cube', help='Cube directory')
+    parser.add_argument('--since-hours', type=float, default=None,
+                        help='Only use frames from the last N hours')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('info', help='Frame count, shape and time span')
+    trim = sub.add_parser('trim', help='Drop old frames now (no slack)')
+    trim.add_argument('--max-frames', type=int, default=None)
+    trim.add_argument('--max-days', type=float, default=None)
+    freq = sub.add_parser('frequency', help='Save per-pixel cloud frequency as .npy')
+    freq.add_argument('--threshold', '-t', type=float, default=0.25)
+    freq.add_argument('--out', default='cloud_frequency.npy')
+    series = sub.add_parser('series', help='Print the time series at one crossing')
+    series.add_argument('--index', '-i', type=int, required=True)
+    series.add_argument('--points', '-p',
+                        default=os.path.join(SCRIPT_DIR, 'public/images/frontera.json'))
+    rolling = sub.add_parser('rolling', help='Rolling mean: at one crossing, or every pixel saved as .npy')
+    rolling.add_argument('--window', '-w', type=int, default=6, help='Frames per window (default: 6)')
+    rolling.add_argument('--index', '-i', type=int, default=None,
+                         help='Crossing to print (default: save the (t, h, w) maps to --out)')
+    rolling.add_argument('--points', '-p',
+                         default=os.path.join(SCRIPT_DIR, 'public/images/frontera.json'))
+    rolling.add_argument('--out', default='rolling_mean.npy')
+    args = parser.parse_args()
+
+    cube = ProbCube(args.cube)
+    since = time.time() - args.since_hours * 3600 if args.since_hours else None
+
+    if args.command == 'info':
+        t = cube.times()
+        print(f'Frames: {len(cube)}  shape: {cube.shape}')
+        if len(t):
+            print(f'From {time.ctime(t[0])} to {time.ctime(t[-1])}')
+    elif args.command == 'trim':
+        max_age = args.max_days * 86400 if args.max_days is not None else None
+        dropped = cube.trim(args.max_frames, max_age, slack=0)
+        print(f'Dropped {dropped} frames, {len(cube)} left')
+    elif args.command == 'frequency':
+        freq_map = cube.cloud_frequency(args.threshold, since=since)
+        np.save(args.out, freq_map)
+        print(f'Saved {args.out} (mean frequency {freq_map.mean():.3f})')
+    elif args.command == 'series':
+        with open(args.points) as f:
+            points = json.load(f)['points']
+        t, values = cube.point_series([points[args.index]], since=since)
+        for ts, v in zip(t, values[:, 0]):
+            print(f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))}  {v:.3f}')
+    elif args.command == 'rolling':
+        if args.index is not None:
+            with open(args.points) as f:
+                points = json.load(f)['points']
+            t, values = cube.rolling_mean(args.window, since=since, points=[points[args.index]])
+            for ts, v in zip(t, values[:, 0]):
+                print(f'{time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))}  {v:.3f}')
+        else:
+            n = len(cube.select(since))
+            out = np.lib.format.open_memmap(args.out, mode='w+', dtype=np.float32,
+                                            shape=(n,) + (cube.shape or (0, 0)))
+            cube.rolling_mean(args.window, since=since, out=out)
+            out.flush()
+            print(f'Saved {args.out} ({n} frames, window {args.window})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+On-demand profiling for cumulus.py and cloud_detection_ml_final.py.
+
+Off unless asked for, with --profile on the command line or CUMULUS_PROFILE
+in the environment. cumulus.py exports the setting, so the ML subprocess
+of a profiled run is profiled too:
+
+    CUMULUS_PROFILE=1       cProfile + tracemalloc
+    CUMULUS_PROFILE=torch   also a torch.profiler trace of every
+                            generate_cloud_mask / upscale_image call
+
+Each profiled process writes on exit, to CUMULUS_PROFILE_DIR (default
+border_images/profiles/):
+
+    <name>_<timestamp>.prof               cProfile stats (pstats, snakeviz)
+    <name>_<timestamp>_alloc.txt          tracemalloc peak and top allocation sites
+    <name>_<timestamp>_<label>_<n>.json   torch traces (chrome://tracing, Perfetto)
+
+When off, start() returns None after one environment lookup and
+torch_traced() functions make one extra call and a None check; cProfile,
+tracemalloc and torch.profiler are never imported.
+
+Usage:
+    import profiling
+    profiling.start('cumulus', profiling.requested())    # dumps at exit
+
+    @profiling.torch_traced('upscale_image')
+    def upscale_image(img): ...
+
+    python3 -m pstats border_images/profiles/cumulus_20250822_050003.prof
+"""
+
+import os
+import sys
+import time
+import functools
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+ENV_VAR = 'CUMULUS_PROFILE'
+DIR_ENV_VAR = 'CUMULUS_PROFILE_DIR'
+DEFAULT_DIR = os.path.join(SCRIPT_DIR, 'border_images', 'profiles')
+MODES = ('cprofile', 'torch')
+
+# Allocation sites listed in the _alloc.txt file, and frames kept per trace
+ALLOC_TOP = 30
+TRACEMALLOC_FRAMES = 1
+
+_session = None
+
+
+def _mode(value):
+    """Normalized profile mode for a flag/env value, or None when off"""
+    if value is None:
+        return None
+    value = str(value).strip().lower()
+    if value in ('', '0', 'off', 'false', 'no'):
+        return None
+    return value if value in MODES else 'cprofile'
+
+
+def requested(argv=None):
+    """Profile mode from --profile [MODE] / --profile=MODE in argv, else from CUMULUS_PROFILE"""
+    argv = sys.argv[1:] if argv is None else argv
+    for i, arg in enumerate(argv):
+        if arg == '--profile':
+            # Same forms the ML script's argparse accepts: a mode may follow as the next token
+            if i + 1 < len(argv) and argv[i + 1].strip().lower() in MODES:
+                return argv[i + 1].strip().lower()
+            return 'cprofile'
+        if arg.startswith('--profile='):
+            return _mode(arg.split('=', 1)[1])
+    return _mode(os.environ.get(ENV_VAR))
+
+
+class _Session:
+    def __init__(self, name, mode, out_dir):
+        import cProfile
+        self.name = name
+        self.mode = mode
+        self.prefix = os.path.join(out_dir, f"{name}_{time.strftime('%Y%m%d_%H%M%S')}")
+        self.profile = cProfile.Profile()
+        self.traces = {}
+
+    def trace(self, label, fn, args, kwargs):
+        import torch.profiler
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self.traces[label] = n = self.traces.get(label, 0) + 1
+        with torch.profiler.profile(activities=activities, record_shapes=True) as prof:
+            result = fn(*args, **kwargs)
+        path = f'{self.prefix}_{label}_{n}.json'
+        prof.export_chrome_trace(path)
+        print(f'Torch trace written: {path}')
+        return result
+
+
+def start(name, mode=None, out_dir=None):
+    """
+    Start profiling this process when mode (or CUMULUS_PROFILE) asks for it.
+
+    Results are written by stop(), which runs at interpreter exit (also
+    after exit() / sys.exit()). Returns None when profiling is off.
+    CUMULUS_PROFILE_DIR, when set, overrides out_dir.
+    """
+    global _session
+    mode = _mode(mode) or _mode(os.environ.get(ENV_VAR))
+    if mode is None or _session is not None:
+        return _session
+    import atexit
+    import tracemalloc
+    out_dir = os.environ.get(DIR_ENV_VAR) or out_dir or DEFAULT_DIR
+    os.makedirs(out_dir, exist_ok=True)
+    # Inherited by child processes (cumulus.py runs the ML script as one)
+    os.environ[ENV_VAR] = mode
+    os.environ[DIR_ENV_VAR] = out_dir
+    _session = _Session(name, mode, out_dir)
+    atexit.register(stop)
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    _session.profile.enable()
+    return _session
+
+
+def stop():
+    """Stop profiling and write the .prof and _alloc.txt files; returns their prefix"""
+    global _session
+    session, _session = _session, None
+    if session is None:
+        return None
+    import tracemalloc
+    session.profile.disable()
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    session.profile.dump_stats(session.prefix + '.prof')
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+    ])
+    stats = snapshot.statistics('lineno')
+    with open(session.prefix + '_alloc.txt', 'w') as f:
+        f.write(f'{session.name}: traced memory {current / 1e6:.1f}MB at exit, peak {peak / 1e6:.1f}MB\n')
+        f.write(f'Top {ALLOC_TOP} allocation sites still held at exit:\n')
+        for stat in stats[:ALLOC_TOP]:
+            frame = stat.traceback[0]
+            f.write(f'{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {frame.filename}:{frame.lineno}\n')
+    print(f'Profile written: {session.prefix}.prof, {session.prefix}_alloc.txt')
+    return session.prefix
+
+
+def torch_traced(label):
+    """Decorator: record a torch.profiler trace of each call when CUMULUS_PROFILE=torch"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _session is None or _session.mode != 'torch':
+                return fn(*args, **kwargs)
+            return _session.trace(label, fn, args, kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,190 @@
+"""
+Multi-resolution renditions of the saved crossing images.
+
+Every upscaled crossing (544x906) used to be saved once, as a full-size
+default-quality JPEG that every client downloaded, thumbnails and phones
+included. save() now encodes a set of renditions from the in-memory
+image in one pass:
+
+    thumb   136px wide    thumbnails / the all-crossings grid
+    mid     272px wide    phones (the native NOAA resolution)
+    full    544px wide    the upscaled image
+
+each as progressive JPEG and/or WebP at a per-size quality (FORMATS).
+The full JPEG is still the canonical crossings/border_NN_<ts>.jpg that
+the duplicate check, the registry and the web server read. The others go
+to crossings/renditions/ as <stem>.<rendition>.<ext>, outside the
+border_*.jpg listings. The resizes happen once per size, and the encodes
+run on a small thread pool (Pillow's encoders release the GIL).
+
+cumulus.py lists the result per crossing in selection.json:
+
+    "renditions": {"thumb": {"width": 136, "height": 226,
+                             "jpg": "renditions/border_12_<ts>.thumb.jpg", "jpg_bytes": 5878, ...},
+                   "full": {"width": 544, "height": 906, "jpg": "border_12_<ts>.jpg", ...}}
+
+Paths are relative to public/images/crossings/.
+
+Usage:
+    import renditions
+    listing = renditions.save(image, crossings_dir, filename)
+    listing = renditions.existing(crossings_dir, filename)   # for an unchanged crossing
+    renditions.remove(crossings_dir, filename)
+
+    python3 renditions.py crossing_images/crossing_01.jpg    # sizes and timings
+"""
+
+import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+RENDITIONS_DIR = 'renditions'
+
+# Rendition -> width in pixels (None: the image as given); heights keep the aspect
+RENDITIONS = {'thumb': 136, 'mid': 272, 'full': None}
+DEFAULT_RENDITIONS = ('thumb', 'mid', 'full')
+DEFAULT_FORMATS = ('jpg', 'webp')
+
+# Format -> rendition -> Pillow save options, tuned on the crossing images:
+# the full JPEG matches the old default-quality file in size, progressive;
+# WebP is ~40% smaller at the same look. WebP method 4 is the speed/size knee.
+FORMATS = {
+    'jpg': {
+        'thumb': {'format': 'JPEG', 'quality': 70, 'progressive': True, 'optimize': True},
+        'mid': {'format': 'JPEG', 'quality': 78, 'progressive': True, 'optimize': True},
+        'full': {'format': 'JPEG', 'quality': 80, 'progressive': True, 'optimize': True},
+    },
+    'webp': {
+        'thumb': {'format': 'WEBP', 'quality': 70, 'method': 4},
+        'mid': {'format': 'WEBP', 'quality': 75, 'method': 4},
+        'full': {'format': 'WEBP', 'quality': 75, 'method': 4},
+    },
+}
+
+_pool = None
+
+
+def _executor():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=min(4, os.cpu_count() or 1), thread_name_prefix='renditions')
+    return _pool
+
+
+def _stem(filename):
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def path_for(filename, rendition, fmt):
+    """Path of a rendition relative to the crossings directory"""
+    if rendition == 'full' and fmt == 'jpg':
+        return os.path.basename(filename)
+    return f'{RENDITIONS_DIR}/{_stem(filename)}.{rendition}.{fmt}'
+
+
+def _size(image_size, width):
+    if width is None or width >= image_size[0]:
+        return image_size
+    return width, max(1, round(image_size[1] * width / image_size[0]))
+
+
+def _encode(image, path, options):
+    tmp_path = path + '.tmp'
+    image.save(tmp_path, **options)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def save(image, crossings_dir, filename, renditions=DEFAULT_RENDITIONS, formats=DEFAULT_FORMATS):
+    """Encode every rendition of a PIL RGB image; the selection.json listing"""
+    from PIL import Image
+    os.makedirs(os.path.join(crossings_dir, RENDITIONS_DIR), exist_ok=True)
+    listing, jobs = {}, []
+    for name in dict.fromkeys(tuple(renditions) + ('full',)):
+        size = _size(image.size, RENDITIONS[name])
+        resized = image if size == image.size else image.resize(size, Image.LANCZOS)
+        listing[name] = {'width': size[0], 'height': size[1]}
+        # The full JPEG is always written: it is the canonical border_NN_<ts>.jpg
+        for fmt in dict.fromkeys(tuple(formats) + (('jpg',) if name == 'full' else ())):
+            rel = path_for(filename, name, fmt)
+            listing[name][fmt] = rel
+            jobs.append((name, fmt, _executor().submit(_encode, resized, os.path.join(crossings_dir, rel),
+                                                        FORMATS[fmt][name])))
+    for name, fmt, job in jobs:
+        listing[name][fmt + '_bytes'] = job.result()
+    return listing
+
+
+def existing(crossings_dir, filename, renditions=DEFAULT_RENDITIONS, formats=DEFAULT_FORMATS):
+    """The listing of renditions already on disk for a saved crossing image"""
+    listing = {}
+    for name in renditions:
+        entry = {}
+        for fmt in formats:
+            rel = path_for(filename, name, fmt)
+            try:
+                entry[fmt + '_bytes'] = os.path.getsize(os.path.join(crossings_dir, rel))
+            except OSError:
+                continue
+            entry[fmt] = rel
+        if entry:
+            listing[name] = entry
+    if 'full' in listing:
+        from PIL import Image
+        with Image.open(os.path.join(crossings_dir, os.path.basename(filename))) as img:
+            width, height = img.size
+        for name, entry in listing.items():
+            entry['width'], entry['height'] = _size((width, height), RENDITIONS[name])
+    return listing
+
+
+def remove(crossings_dir, filename):
+    """Delete the renditions of a crossing image (not the canonical JPEG); the paths removed"""
+    removed = []
+    for name in RENDITIONS:
+        for fmt in FORMATS:
+            rel = path_for(filename, name, fmt)
+            if rel == os.path.basename(filename):
+                continue
+            try:
+                os.remove(os.path.join(crossings_dir, rel))
+                removed.append(rel)
+            except OSError:
+                pass
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Encode the crossing renditions of an image and report sizes')
+    parser.add_argument('image', help='Crossing image (e.g. crossing_images/crossing_01.jpg)')
+    parser.add_argument('--output', default=None, help='Directory to write to (default: a temporary one)')
+    parser.add_argument('--formats', default=','.join(DEFAULT_FORMATS), help='Comma-separated: jpg, webp')
+    parser.add_argument('--repeat', '-n', type=int, default=3)
+    args = parser.parse_args()
+
+    import shutil
+    import tempfile
+    from PIL import Image
+    image = Image.open(args.image).convert('RGB')
+    out_dir = args.output or tempfile.mkdtemp(prefix='renditions_')
+    filename = os.path.basename(args.image)
+    formats = tuple(args.formats.split(','))
+    try:
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            listing = save(image, out_dir, filename, formats=formats)
+            times.append(time.perf_counter() - start)
+        print(f'{image.size[0]}x{image.size[1]} -> {len(listing) * len(formats)} files in '
+              f'{min(times) * 1000:.1f}ms (best of {args.repeat})')
+        for name, entry in listing.items():
+            sizes = '  '.join(f"{fmt} {entry[fmt + '_bytes'] / 1024:6.1f}KB" for fmt in formats)
+            print(f"{name:6s} {entry['width']:4d}x{entry['height']:<4d} {sizes}")
+    finally:
+        if not args.output:
+            shutil.rmtree(out_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""
+Offline replay benchmark: runs the full cumulus.py pipeline over a recorded
+sequence of border frames against the local exportImage stand-in
+(noaa_stub.py), and reports per-stage timings against a stored baseline.
+
+Each run is a real `python3 cumulus.py` in a throwaway sandbox
+(CUMULUS_ROOT), with CUMULUS_NOAA_URL pointing at the stub, so the ML
+subprocess, upscaling, rendering and file writes all happen as in cron.
+Stage timings come from the run's own metrics line (see run_metrics.py).
+
+The sandbox holds copies of the scripts and of frontera.json /
+crossings.json; models/ and the border band cache are
+linked or copied in so the first run doesn't pay for downloads. The
+first --warmup runs are excluded from the statistics.
+
+    replay_baseline.json    per-stage median wall times (--save-baseline)
+
+A stage regresses when its median exceeds the baseline by more than
+--tolerance (fraction) and --min-delta seconds; the exit status is 1
+when anything regressed.
+
+Usage:
+    python3 replay.py                                    # border_images/, report only
+    python3 replay.py --limit 10 --latency 0.3 --fail-rate 0.05
+    python3 replay.py --save-baseline                    # record replay_baseline.json
+    python3 replay.py /home/morakana/cumulus/cumulus_archive/frontera/2025-08 --output replay.json
+"""
+
+import os
+import sys
+import json
+import time
+import glob
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from noaa_stub import StubServer, find_frames
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(SCRIPT_DIR, 'replay_baseline.json')
+# Copied into the sandbox next to the scripts
+SANDBOX_DATA = [
+    os.path.join('public', 'images', 'frontera.json'),
+    os.path.join('cumulus_reference', 'crossings.json'),
+    os.path.join('border_images', 'border_band.npz'),
+]
+RUN_TIMEOUT = 600
+
+
+def make_sandbox(root):
+    """Lay out a CUMULUS_ROOT with the scripts and reference data"""
+    for path in glob.glob(os.path.join(SCRIPT_DIR, '*.py')):
+        shutil.copy2(path, root)
+    for rel in SANDBOX_DATA:
+        src = os.path.join(SCRIPT_DIR, rel)
+        if os.path.exists(src):
+            os.makedirs(os.path.join(root, os.path.dirname(rel)), exist_ok=True)
+            shutil.copy2(src, os.path.join(root, rel))
+    if os.path.isdir(os.path.join(SCRIPT_DIR, 'models')):
+        os.symlink(os.path.join(SCRIPT_DIR, 'models'), os.path.join(root, 'models'))
+    for rel in (('public', 'images'), ('public', 'eink'), ('border_images',)):
+        os.makedirs(os.path.join(root, *rel), exist_ok=True)
+
+
+def last_metrics(path, seen):
+    """The metrics record cumulus.py appended after `seen` lines, or None"""
+    try:
+        with open(path) as f:
+            lines = f.readlines()
+    except OSError:
+        return None, seen
+    if len(lines) <= seen:
+        return None, len(lines)
+    return json.loads(lines[-1]), len(lines)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def summarize(runs):
+    """Per-stage median / p95 wall times over the measured runs"""
+    stages = {}
+    for run in runs:
+        for name, wall in run['stages'].items():
+            stages.setdefault(name, []).append(wall)
+    walls = [run['wall'] for run in runs]
+    return {
+        'runs': len(runs),
+        'wall': {'median': statistics.median(walls), 'p95': percentile(walls, 0.95)} if walls else None,
+        'stages': {name: {'median': round(statistics.median(v), 4), 'p95': round(percentile(v, 0.95), 4),
+                          'runs': len(v)}
+                   for name, v in sorted(stages.items())},
+    }
+
+
+def compare(summary, baseline, tolerance, min_delta):
+    """[(stage, baseline, current)] for stages slower than the baseline allows"""
+    regressions = []
+    current = dict(summary['stages'])
+    if summary['wall']:
+        current['total'] = summary['wall']
+    for name, base in baseline.get('stages', {}).items():
+        if name not in current:
+            continue
+        now = current[name]['median']
+        if now > base * (1 + tolerance) and now - base > min_delta:
+            regressions.append((name, base, now))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay archived frames through cumulus.py against a local NOAA stand-in')
+    parser.add_argument('frames', nargs='*', default=[os.path.join(SCRIPT_DIR, 'border_images')],
+                        help='Frame files or directories (default: border_images/)')
+    parser.add_argument('--limit', type=int, default=None, help='Replay at most this many frames')
+    parser.add_argument('--warmup', type=int, default=1, help='Leading runs left out of the statistics')
+    parser.add_argument('--latency', type=float, default=0.0, help='Stub delay per request, seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Stub extra uniform delay, seconds')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of stub requests answered 503')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='Baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='Store this replay as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown per stage (fraction)')
+    parser.add_argument('--min-delta', type=float, default=0.05, help='Ignore slowdowns below this, seconds')
+    parser.add_argument('--output', default=None, help='Write the full results as JSON')
+    parser.add_argument('--keep', action='store_true', help='Keep the sandbox directory')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Echo each run\'s output')
+    args = parser.parse_args()
+
+    frames = find_frames(args.frames)[:args.limit]
+    if not frames:
+        sys.exit('No 1000x500 frames found')
+
+    root = tempfile.mkdtemp(prefix='cumulus_replay_') + os.sep
+    make_sandbox(root)
+    stub = StubServer(frames, latency=args.latency, jitter=args.jitter,
+                      fail_rate=args.fail_rate, seed=args.seed).start()
+    env = dict(os.environ, CUMULUS_ROOT=root, CUMULUS_NOAA_URL=stub.url,
+               CUMULUS_ARCHIVE=os.path.join(root, 'archive') + os.sep)
+    env.pop('CUMULUS_PROFILE', None)
+    metrics_path = os.path.join(root, 'border_images', 'metrics', 'cumulus_runs.jsonl')
+    print(f'Replaying {len(frames)} frames through {root} (stub {stub.url})')
+
+    runs, outcomes, seen = [], {}, 0
+    start = time.perf_counter()
+    try:
+        for i, frame_path in enumerate(frames):
+            stub.set_frame(i)
+            run_start = time.perf_counter()
+            proc = subprocess.run([sys.executable, os.path.join(root, 'cumulus.py')], cwd=root, env=env,
+                                  capture_output=True, text=True, timeout=RUN_TIMEOUT)
+            elapsed = time.perf_counter() - run_start
+            record, seen = last_metrics(metrics_path, seen)
+            outcome = record['outcome'] if record else f'crashed ({proc.returncode})'
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            print(f'{i + 1:4d}/{len(frames)} {os.path.basename(frame_path)}: {outcome}, {elapsed:.2f}s')
+            if args.verbose or not record:
+                print(proc.stdout[-2000:] + proc.stderr[-2000:])
+            if record and i >= args.warmup:
+                runs.append({'frame': frame_path, 'outcome': outcome, 'wall': record['wall'],
+                             'process_wall': round(elapsed, 4),
+                             'stages': {name: s['wall'] for name, s in record['stages'].items()},
+                             'counters': record['counters']})
+    finally:
+        stub.stop()
+        total = time.perf_counter() - start
+        if args.keep:
+            print(f'Sandbox kept: {root}')
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    summary = summarize(runs)
+    print(f"\n{len(frames)} runs in {total:.1f}s ({len(frames) / total * 60:.1f} frames/min); outcomes: {outcomes}")
+    print(f"Stub: {stub.stats['requests']} requests, {stub.stats['failures']} failed, "
+          f"{stub.stats['bytes'] / 1e6:.1f}MB served")
+    print(f"{'stage':20s} {'median':>9s} {'p95':>9s}")
+    for name, s in summary['stages'].items():
+        print(f"{name:20s} {s['median']:8.3f}s {s['p95']:8.3f}s")
+    if summary['wall']:
+        print(f"{'total':20s} {summary['wall']['median']:8.3f}s {summary['wall']['p95']:8.3f}s")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(summary, baseline, args.tolerance, args.min_delta)
+        for name, base, now in regressions:
+            print(f'REGRESSION {name}: {base:.3f}s -> {now:.3f}s ({(now / base - 1) * 100:+.0f}%)')
+        if not regressions:
+            print(f'No regressions against {args.baseline} (tolerance {args.tolerance:.0%})')
+
+    results = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'frames': len(frames),
+               'seconds': round(total, 2), 'frames_per_min': round(len(frames) / total * 60, 2),
+               'outcomes': outcomes, 'stub': stub.stats, 'summary': summary, 'runs': runs,
+               'regressions': [{'stage': n, 'baseline': b, 'current': c} for n, b, c in regressions]}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        stages = {name: s['median'] for name, s in summary['stages'].items()}
+        if summary['wall']:
+            stages['total'] = summary['wall']['median']
+        with open(args.baseline, 'w') as f:
+            json.dump({'timestamp': results['timestamp'], 'frames': len(frames), 'stages': stages}, f, indent=2)
+        print(f'Baseline saved: {args.baseline}')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+Retention manager for the output directories that grow every run.
+
+Each directory has a policy (max age, max bytes, max file count and
+time-bucket thinning) and a small manifest (.retention.json) of the files it
+tracks, so enforcing a policy does not need to stat every file each time.
+When the directory mtime still matches the manifest, the manifest is used
+as is. When it changed (the caller's new files, a run that crashed before
+enforce, another process), the names are re-listed and only the ones the
+manifest doesn't know are stat'ed, plus the new_files the caller wrote. A
+missing or malformed manifest, or --rescan, means a full scan.
+
+Usage:
+    import retention
+    retention.enforce(output_dir, retention.ML_DETECTION_POLICY, new_files=[...])
+
+    python3 retention.py               # enforce every default policy
+    python3 retention.py --dry-run     # only report what would be removed
+"""
+
+import os
+import json
+import time
+import fnmatch
+import argparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_NAME = '.retention.json'
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Thinning tiers are (max_age_seconds, bucket_seconds), youngest first: within
+# a tier only the newest file of each bucket survives (bucket 0 keeps all).
+# Files older than the last tier are covered by max_age.
+ML_DETECTION_POLICY = {
+    'patterns': ['original_*.jpg', 'overlay_*.jpg', 'report_*.json'],
+    'max_age': 90 * DAY,
+    'max_bytes': 2 * 1024 ** 3,
+    'max_files': None,
+    'thinning': [(DAY, 0), (7 * DAY, HOUR), (90 * DAY, DAY)],
+    'keep_latest': 1,
+}
+
+PUBLIC_IMAGES_POLICY = {
+    'patterns': ['border_crossings_*.jpg'],
+    'max_age': 7 * DAY,
+    'max_bytes': 500 * 1024 ** 2,
+    'max_files': 200,
+    'thinning': [(DAY, 0), (7 * DAY, HOUR)],
+    'keep_latest': 1,
+}
+
+DEFAULT_POLICIES = {
+    os.path.join(SCRIPT_DIR, 'border_images', 'ml_detection'): ML_DETECTION_POLICY,
+    os.path.join(SCRIPT_DIR, 'public', 'images'): PUBLIC_IMAGES_POLICY,
+}
+
+
+def _matches(name, policy):
+    return any(fnmatch.fnmatch(name, p) for p in policy['patterns'])
+
+
+def _load_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(manifest, dict) or not isinstance(manifest.get('files'), dict)
+            or not isinstance(manifest.get('dir_mtime_ns'), int)):
+        return None
+    return manifest
+
+
+def _save_manifest(directory, files):
+    # Rewritten in place (no temp file + rename) so saving it does not itself
+    # bump the directory mtime; a torn write just forces a rescan next time.
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        open(path, 'w').close()
+    manifest = {'dir_mtime_ns': os.stat(directory).st_mtime_ns, 'files': files}
+    with open(path, 'w') as f:
+        json.dump(manifest, f)
+
+
+def _scan(directory, policy):
+    files = {}
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_file() and _matches(entry.name, policy):
+                st = entry.stat()
+                files[entry.name] = [st.st_mtime, st.st_size]
+    return files
+
+
+def _reconcile(directory, policy, known, fresh):
+    """Re-list names; stat only those not in known, or in fresh (just written)"""
+    files = {}
+    with os.scandir(directory) as it:
+        for entry in it:
+            if not _matches(entry.name, policy):
+                continue
+            if entry.name in known and entry.name not in fresh:
+                files[entry.name] = known[entry.name]
+            elif entry.is_file():
+                st = entry.stat()
+                files[entry.name] = [st.st_mtime, st.st_size]
+    return files
+
+
+def load_files(directory, policy, new_files=None, rescan=False):
+    """Tracked files as {name: [mtime, size]}, from the manifest when it is usable"""
+    manifest = _load_manifest(directory)
+    if manifest is None or rescan:
+        return _scan(directory, policy)
+    if os.stat(directory).st_mtime_ns == manifest['dir_mtime_ns']:
+        return manifest['files']
+    fresh = {os.path.basename(path) for path in new_files or ()}
+    return _reconcile(directory, policy, manifest['files'], fresh)
+
+
+def plan(files, policy, now=None):
+    """Names to delete under policy, given {name: [mtime, size]}"""
+    if now is None:
+        now = time.time()
+    # Newest first; the newest keep_latest files are never removed
+    ordered = sorted(files.items(), key=lambda kv: kv[1][0], reverse=True)
+    protected = {name for name, _ in ordered[:policy.get('keep_latest', 1)]}
+    doomed = set()
+
+    max_age = policy.get('max_age')
+    if max_age is not None:
+        doomed.update(name for name, (mtime, _) in ordered if now - mtime > max_age)
+
+    # Thinning: per pattern so matching original/overlay/report sets stay aligned
+    tiers = policy.get('thinning') or []
+    for pattern in policy['patterns']:
+        seen_buckets = set()
+        for name, (mtime, _) in ordered:
+            if name in doomed or not fnmatch.fnmatch(name, pattern):
+                continue
+            age = now - mtime
+            for tier_index, (tier_age, bucket) in enumerate(tiers):
+                if age <= tier_age:
+                    if bucket:
+                        key = (tier_index, int(mtime // bucket))
+                        if key in seen_buckets:
+                            doomed.add(name)
+                        seen_buckets.add(key)
+                    break
+
+    # Count and size budgets trim the oldest survivors
+    survivors = [(name, size) for name, (_, size) in ordered if name not in doomed]
+    max_files = policy.get('max_files')
+    if max_files is not None:
+        doomed.update(name for name, _ in survivors[max_files:])
+        survivors = survivors[:max_files]
+    max_bytes = policy.get('max_bytes')
+    if max_bytes is not None:
+        total = 0
+        for name, size in survivors:
+            total += size
+            if total > max_bytes:
+                doomed.add(name)
+
+    return sorted(doomed - protected)
+
+
+def enforce(directory, policy, new_files=None, rescan=False, dry_run=False, now=None):
+    """Apply policy to directory, update its manifest and return the removed names"""
+    if not os.path.isdir(directory):
+        return []
+    files = load_files(directory, policy, new_files=new_files, rescan=rescan)
+    doomed = plan(files, policy, now=now)
+    if dry_run:
+        return doomed
+    removed = []
+    for name in doomed:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Retention: could not remove {name}: {e}")
+            continue
+        files.pop(name, None)
+        removed.append(name)
+    _save_manifest(directory, files)
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prune output directories by retention policy')
+    parser.add_argument('--dry-run', action='store_true', help='Only report what would be removed')
+    parser.add_argument('--rescan', action='store_true', help='Ignore manifests and re-list directories')
+    args = parser.parse_args()
+
+    for directory, policy in DEFAULT_POLICIES.items():
+        removed = enforce(directory, policy, rescan=args.rescan, dry_run=args.dry_run)
+        verb = 'Would remove' if args.dry_run else 'Removed'
+        print(f"{directory}: {verb} {len(removed)} files")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Per-stage timing and resource metrics for a pipeline run.
+
+A RunMetrics collects, per named stage, wall time, CPU time (own and
+child processes, e.g. the ML subprocess) and how much the stage raised
+the process's peak RSS (ru_maxrss only ever grows, so the peak itself is
+the whole run's; the growth shows which stage needed the memory), plus
+run counters such as bytes downloaded and images written. At the end of the run it
+appends one JSON line to a metrics log and rewrites a Prometheus textfile
+(node_exporter textfile collector format).
+
+Stages can be used two ways:
+    metrics.begin('fetch_border')    # sequential phases: ends the previous one
+    with metrics.stage('upscale'):   # nested, e.g. inside a loop; repeated
+        ...                          # entries of a name add up
+
+Only the stdlib is used, so importing this costs nothing on the early-exit
+path.
+
+Usage:
+    metrics = RunMetrics('cumulus')
+    metrics.begin('fetch_border')
+    metrics.add('bytes_downloaded', len(response.content))
+    metrics.finish('ok', jsonl_path='.../cumulus_runs.jsonl', prom_path='.../cumulus.prom')
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+from contextlib import contextmanager
+
+
+def _peak_rss_bytes(who=resource.RUSAGE_SELF):
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _child_cpu():
+    t = os.times()
+    return t.children_user + t.children_system
+
+
+class RunMetrics:
+    """Stage timings and counters for one run"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self._wall0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        self._child0 = _child_cpu()
+        self.stages = {}
+        self.counters = {}
+        self._current = None
+
+    def _enter(self):
+        return time.perf_counter(), time.process_time(), _child_cpu(), _peak_rss_bytes()
+
+    def _exit(self, name, entered):
+        wall0, cpu0, child0, peak0 = entered
+        stage = self.stages.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'child_cpu': 0.0, 'count': 0,
+                                              'peak_rss_growth': 0})
+        stage['wall'] += time.perf_counter() - wall0
+        stage['cpu'] += time.process_time() - cpu0
+        stage['child_cpu'] += _child_cpu() - child0
+        stage['count'] += 1
+        stage['peak_rss_growth'] += _peak_rss_bytes() - peak0
+
+    @contextmanager
+    def stage(self, name):
+        entered = self._enter()
+        try:
+            yield
+        finally:
+            self._exit(name, entered)
+
+    def begin(self, name):
+        """Start a sequential stage, ending the current one"""
+        self.end()
+        self._current = (name, self._enter())
+
+    def end(self):
+        if self._current is not None:
+            self._exit(*self._current)
+            self._current = None
+
+    def add(self, counter, amount=1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def record(self, outcome=None):
+        """The run as a dict (ends the current stage)"""
+        self.end()
+        return self._snapshot(outcome)
+
+    def _snapshot(self, outcome=None):
+        return {
+            'name': self.name,
+            'timestamp': self.started,
+            'outcome': outcome,
+            'wall': round(time.perf_counter() - self._wall0, 4),
+            'cpu': round(time.process_time() - self._cpu0, 4),
+            'child_cpu': round(_child_cpu() - self._child0, 4),
+            'peak_rss': _peak_rss_bytes(),
+            'child_peak_rss': _peak_rss_bytes(resource.RUSAGE_CHILDREN),
+            'stages': {name: {k: round(v, 4) if isinstance(v, float) else v for k, v in s.items()}
+                       for name, s in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+
+    def summary(self):
+        """Compact wall times (seconds) of the stages completed so far, and counters"""
+        record = self._snapshot()
+        return {
+            'wall': record['wall'],
+            'stages': {name: s['wall'] for name, s in record['stages'].items()},
+            'counters': record['counters'],
+        }
+
+    def prometheus(self, record):
+        """Prometheus text exposition of a record"""
+        prefix = self.name
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append(f'# HELP {prefix}_{name} {help_text}')
+            lines.append(f'# TYPE {prefix}_{name} gauge')
+            for labels, value in samples:
+                lines.append(f'{prefix}_{name}{labels} {value}')
+
+        metric('run_timestamp_seconds', 'Start of the last run (epoch seconds)', [('', record['timestamp'])])
+        metric('run_seconds', 'Wall time of the last run', [('', record['wall'])])
+        metric('run_cpu_seconds', 'CPU time of the last run (own process)', [('', record['cpu'])])
+        metric('run_outcome', 'Outcome of the last run', [(f'{{outcome="{record["outcome"]}"}}', 1)])
+        metric('peak_rss_bytes', 'Peak resident set size of the last run',
+               [('{process="self"}', record['peak_rss']), ('{process="children"}', record['child_peak_rss'])])
+        stages = sorted(record['stages'].items())
+        metric('stage_seconds', 'Wall time per stage in the last run',
+               [(f'{{stage="{name}"}}', s['wall']) for name, s in stages])
+        metric('stage_cpu_seconds', 'CPU time per stage in the last run (own + children)',
+               [(f'{{stage="{name}"}}', round(s['cpu'] + s['child_cpu'], 4)) for name, s in stages])
+        metric('stage_peak_rss_growth_bytes', 'Growth of the peak resident set size per stage in the last run',
+               [(f'{{stage="{name}"}}', s['peak_rss_growth']) for name, s in stages])
+        for counter, value in sorted(record['counters'].items()):
+            metric(counter, f'{counter.replace("_", " ").capitalize()} in the last run', [('', value)])
+        return '\n'.join(lines) + '\n'
+
+    def finish(self, outcome='ok', jsonl_path=None, prom_path=None):
+        """Write the run's JSON line and Prometheus textfile; returns the record"""
+        record = self.record(outcome)
+        try:
+            if jsonl_path:
+                os.makedirs(os.path.dirname(jsonl_path) or '.', exist_ok=True)
+                with open(jsonl_path, 'a') as f:
+                    f.write(json.dumps(record, separators=(',', ':')) + '\n')
+            if prom_path:
+                os.makedirs(os.path.dirname(prom_path) or '.', exist_ok=True)
+                # node_exporter may read at any time: write aside and rename
+                tmp_path = prom_path + '.tmp'
+                with open(tmp_path, 'w') as f:
+                    f.write(self.prometheus(record))
+                os.replace(tmp_path, prom_path)
+        except OSError as e:
+            print(f'Could not write run metrics: {e}')
+        return record
+
+    def report(self, record=None):
+        """Human-readable per-stage table"""
+        record = record or self.record()
+        rows = []
+        for name, s in record['stages'].items():
+            repeat = '' if s['count'] == 1 else f" x{s['count']}"
+            rows.append(f"{name:20s} {s['wall']:8.2f}s wall {s['cpu'] + s['child_cpu']:8.2f}s cpu"
+                        f" {s['peak_rss_growth'] / 1e6:+6.0f}MB peak{repeat}")
+        rows.append(f"{'total':20s} {record['wall']:8.2f}s wall, peak RSS {record['peak_rss'] / 1e6:.0f}MB")
+        return '\n'.join(rows)
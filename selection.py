@@ -0,0 +1,336 @@
+"""
+Crossing selection: which cloudy crossings get a zoomed image this run.
+
+Candidates are the dicts cumulus.py builds for cloudy crossings ('index',
+'point' with pixel 'x'/'y', 'probability'). A strategy returns up to
+max_count of them, best first; selected[0] is the primary crossing.
+
+Distance checks go through GridIndex, a uniform grid over the selected
+points, so each check looks at a few cells instead of every selected
+crossing. That keeps selection near-linear when the 51 crossings are
+replaced by thousands of densified border points.
+
+Strategies (STRATEGIES):
+    greedy    highest probability first, at least min_distance apart, then
+              min_distance / 2, then anything (what cumulus.py always did)
+    farthest  weighted farthest-point sampling: each pick maximises
+              probability x distance to the nearest pick so far
+    poisson   probability-weighted Poisson-disk: candidates drawn in
+              weighted random order (fixed seed), each with an exclusion
+              radius that shrinks as its probability grows
+
+Hysteresis (select_sticky): crossings picked last run, read back from
+selection.json, compete with their probability raised by a margin, so a
+newcomer only takes their slot by beating them by more than the margin. A
+crossing that is no longer cloudy is not a candidate and drops out. Every
+changed slot costs a NOAA crop fetch, an upscale and a web update, so
+churn() counts kept/added/dropped picks for the run log.
+
+Usage:
+    import selection
+    selected = selection.select(cloud_crossings, 'greedy', max_count=9, min_distance=50)
+    previous = selection.previous_selection('public/images/crossings/selection.json')
+    selected = selection.select_sticky(cloud_crossings, previous, 'greedy', margin=0.1)
+
+    python3 selection.py      # determinism/spacing checks and benchmark
+"""
+
+import json
+import math
+import random
+
+import numpy as np
+
+MIN_DISTANCE = 50
+MAX_CROSSINGS = 9
+# Probability a newcomer must beat a previously selected crossing by
+SELECTION_MARGIN = 0.1
+
+
+class GridIndex:
+    """Uniform grid of points for "is anything within r" queries"""
+
+    def __init__(self, cell_size):
+        self.cell_size = float(max(cell_size, 1))
+        self.cells = {}
+
+    def _cell(self, x, y):
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+
+    def add(self, x, y):
+        self.cells.setdefault(self._cell(x, y), []).append((x, y))
+
+    def any_within(self, x, y, radius):
+        """True if a stored point is closer than radius to (x, y)"""
+        if radius <= 0:
+            return False
+        reach = int(math.ceil(radius / self.cell_size))
+        cx, cy = self._cell(x, y)
+        r2 = radius * radius
+        for gx in range(cx - reach, cx + reach + 1):
+            for gy in range(cy - reach, cy + reach + 1):
+                for px, py in self.cells.get((gx, gy), ()):
+                    if (px - x) ** 2 + (py - y) ** 2 < r2:
+                        return True
+        return False
+
+
+def _xy(candidate):
+    return candidate['point']['x'], candidate['point']['y']
+
+
+def _by_probability(candidates):
+    # Stable: equal probabilities keep their frontera.json order
+    return sorted(candidates, key=lambda c: c['probability'], reverse=True)
+
+
+def select_greedy(candidates, max_count=MAX_CROSSINGS, min_distance=MIN_DISTANCE):
+    """
+    Highest probability first, keeping min_distance, then min_distance / 2, then any.
+
+    Same picks as the loop cumulus.py used: a candidate too close at one
+    distance stays too close as picks are added, so each relaxation is a
+    single pass over the remaining candidates in probability order.
+    """
+    remaining = _by_probability(candidates)
+    selected = []
+    index = GridIndex(min_distance)
+    for distance in (min_distance, min_distance / 2, 0):
+        left = []
+        for candidate in remaining:
+            x, y = _xy(candidate)
+            if len(selected) < max_count and not index.any_within(x, y, distance):
+                selected.append(candidate)
+                index.add(x, y)
+            else:
+                left.append(candidate)
+        remaining = left
+    return selected
+
+
+def select_farthest(candidates, max_count=MAX_CROSSINGS, min_distance=MIN_DISTANCE):
+    """
+    Weighted farthest-point sampling, starting from the highest probability.
+
+    Distances are capped at 4 x min_distance so that, past a good spread,
+    probability decides rather than remoteness. Candidates closer than
+    min_distance / 2 to a pick are only taken once nothing else is left.
+    """
+    ordered = _by_probability(candidates)
+    if not ordered:
+        return []
+    xy = np.array([_xy(c) for c in ordered], dtype=np.float64)
+    weight = np.array([c['probability'] for c in ordered], dtype=np.float64)
+    nearest = np.full(len(ordered), np.inf)
+    taken = np.zeros(len(ordered), dtype=bool)
+    cap = 4.0 * min_distance
+    selected = []
+    pick = 0
+    while True:
+        selected.append(ordered[pick])
+        taken[pick] = True
+        nearest = np.minimum(nearest, np.hypot(xy[:, 0] - xy[pick, 0], xy[:, 1] - xy[pick, 1]))
+        if len(selected) >= max_count or taken.all():
+            break
+        score = np.where(taken, -np.inf, weight * np.minimum(nearest, cap))
+        crowded = ~taken & (nearest < min_distance / 2)
+        if (~taken & ~crowded).any():
+            score[crowded] = -np.inf
+        # argmax takes the first maximum, i.e. the higher probability on ties
+        pick = int(np.argmax(score))
+    return selected
+
+
+def select_poisson(candidates, max_count=MAX_CROSSINGS, min_distance=MIN_DISTANCE, seed=0):
+    """
+    Probability-weighted Poisson-disk sampling.
+
+    Candidates are visited in weighted random order (Efraimidis-Spirakis
+    keys from a seeded generator, so the same input gives the same picks)
+    and accepted when no pick lies within their radius, which goes from
+    1.5 x min_distance at probability 0 to min_distance / 2 at 1. If that
+    leaves slots open the greedy relaxation fills them.
+    """
+    rng = random.Random(seed)
+    keyed = []
+    for order, candidate in enumerate(candidates):
+        p = min(max(candidate['probability'], 1e-6), 1.0)
+        keyed.append((rng.random() ** (1.0 / p), -order, candidate))
+    keyed.sort(key=lambda k: (k[0], k[1]), reverse=True)
+
+    r_max, r_min = 1.5 * min_distance, 0.5 * min_distance
+    index = GridIndex(r_max)
+    selected = []
+    for _, _, candidate in keyed:
+        if len(selected) >= max_count:
+            break
+        x, y = _xy(candidate)
+        p = min(max(candidate['probability'], 0.0), 1.0)
+        if not index.any_within(x, y, r_max - (r_max - r_min) * p):
+            selected.append(candidate)
+            index.add(x, y)
+
+    if len(selected) < max_count:
+        chosen = {id(c) for c in selected}
+        rest = [c for c in candidates if id(c) not in chosen]
+        for candidate in select_greedy(rest, len(rest), min_distance / 2):
+            if len(selected) >= max_count:
+                break
+            selected.append(candidate)
+    # Primary crossing is still the most probable pick
+    selected.sort(key=lambda c: c['probability'], reverse=True)
+    return selected
+
+
+STRATEGIES = {
+    'greedy': select_greedy,
+    'farthest': select_farthest,
+    'poisson': select_poisson,
+}
+
+
+def select(candidates, strategy='greedy', max_count=MAX_CROSSINGS, min_distance=MIN_DISTANCE):
+    """Pick up to max_count candidates with the named strategy (see STRATEGIES)"""
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown selection strategy '{strategy}', expected one of {sorted(STRATEGIES)}")
+    return STRATEGIES[strategy](list(candidates), max_count, min_distance)
+
+
+def previous_selection(path):
+    """Border indices listed in an earlier selection.json (empty set if unreadable)"""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    return {c['border_index'] for c in data.get('crossings', []) if 'border_index' in c}
+
+
+def select_sticky(candidates, previous, strategy='greedy', margin=SELECTION_MARGIN,
+                  max_count=MAX_CROSSINGS, min_distance=MIN_DISTANCE):
+    """
+    select() with hysteresis towards the previous picks.
+
+    Candidates whose index is in previous take part with probability +
+    margin; the returned dicts are the caller's own, with their real
+    probabilities.
+    """
+    boosted = []
+    originals = {}
+    for candidate in candidates:
+        if candidate['index'] in previous:
+            sticky = dict(candidate, probability=candidate['probability'] + margin)
+            originals[id(sticky)] = candidate
+            candidate = sticky
+        boosted.append(candidate)
+    picks = select(boosted, strategy, max_count, min_distance)
+    return [originals.get(id(c), c) for c in picks]
+
+
+def churn(previous, selected):
+    """{'kept', 'added', 'dropped'} counts between previous indices and this selection"""
+    current = {c['index'] for c in selected}
+    return {
+        'kept': len(current & previous),
+        'added': len(current - previous),
+        'dropped': len(previous - current),
+    }
+
+
+def _greedy_reference(candidates, max_count=MAX_CROSSINGS, min_distance=MIN_DISTANCE):
+    """The quadratic loop cumulus.py used before this module, kept to check select_greedy"""
+    def far_enough(candidate, selected, min_dist):
+        return all(((candidate['point']['x'] - s['point']['x']) ** 2 +
+                    (candidate['point']['y'] - s['point']['y']) ** 2) ** 0.5 >= min_dist
+                   for s in selected)
+
+    remaining = _by_probability(candidates)
+    if not remaining:
+        return []
+    selected = [remaining.pop(0)]
+    while len(selected) < max_count and remaining:
+        for distance in (min_distance, min_distance / 2):
+            found = next((c for c in remaining if far_enough(c, selected, distance)), None)
+            if found is not None:
+                selected.append(found)
+                remaining.remove(found)
+                break
+        else:
+            selected.append(remaining.pop(0))
+    return selected
+
+
+def _min_spacing(selected):
+    """Smallest pairwise distance between picks (inf for fewer than two)"""
+    xy = np.array([_xy(c) for c in selected], dtype=np.float64).reshape(-1, 2)
+    if len(xy) < 2:
+        return math.inf
+    d = np.hypot(xy[:, None, 0] - xy[None, :, 0], xy[:, None, 1] - xy[None, :, 1])
+    return float(d[np.triu_indices(len(xy), 1)].min())
+
+
+def _synthetic_candidates(n, seed):
+    """n points along a wavy 1000x500 'border', probabilities with some ties"""
+    rng = random.Random(seed)
+    candidates = []
+    for i in range(n):
+        x = int(i * 1000 / n)
+        y = int(250 + 120 * math.sin(x / 90.0) + rng.uniform(-20, 20))
+        candidates.append({'index': i, 'point': {'x': x, 'y': y},
+                           'probability': round(rng.random(), 2)})
+    return candidates
+
+
+if __name__ == '__main__':
+    # Deterministic checks plus a benchmark:  python3 selection.py
+    import sys
+    import time
+
+    failures = 0
+    for n, seed in ((51, 1), (51, 2), (200, 3), (2000, 4)):
+        candidates = _synthetic_candidates(n, seed)
+        expected = [c['index'] for c in _greedy_reference(candidates)]
+        for name, strategy in STRATEGIES.items():
+            result = strategy(candidates)
+            picks = [c['index'] for c in result]
+            again = [c['index'] for c in strategy(candidates)]
+            ok = picks == again and len(picks) == min(n, MAX_CROSSINGS) and len(set(picks)) == len(picks)
+            if name == 'greedy':
+                ok = ok and picks == expected
+            # The synthetic border is ~1000px long, room for every pick at min_distance / 2
+            spacing = _min_spacing(result)
+            ok = ok and spacing >= MIN_DISTANCE / 2
+            failures += not ok
+            print(f'{name:8s} n={n:5d} seed={seed}: {picks} spacing {spacing:.0f} {"ok" if ok else "FAILED"}')
+
+    # Hysteresis: jitter probabilities between runs and count slot changes
+    for margin in (0.0, SELECTION_MARGIN):
+        rng = random.Random(5)
+        base = _synthetic_candidates(51, 5)
+        previous = set()
+        changes = 0
+        for run in range(50):
+            candidates = [dict(c, probability=min(1.0, max(0.0, c['probability'] + rng.gauss(0, 0.05))))
+                          for c in base]
+            picks = select_sticky(candidates, previous, 'greedy', margin=margin)
+            changes += churn(previous, picks)['added'] if run else 0
+            previous = {c['index'] for c in picks}
+        print(f'sticky margin={margin:.2f}: {changes} new picks over 49 runs')
+    if select_sticky(_synthetic_candidates(51, 1), set()) != select_greedy(_synthetic_candidates(51, 1)):
+        failures += 1
+        print('select_sticky without previous picks differs from select FAILED')
+
+    print()
+    for n in (51, 1000, 5000):
+        candidates = _synthetic_candidates(n, 0)
+        # Many cloudy points close together is the reference loop's worst case
+        for c in candidates:
+            c['probability'] = 0.5
+        timings = []
+        for name, strategy in list(STRATEGIES.items()) + [('reference', _greedy_reference)]:
+            start = time.perf_counter()
+            strategy(candidates)
+            timings.append(f'{name} {(time.perf_counter() - start) * 1000:.1f}ms')
+        print(f'n={n:5d}: ' + ', '.join(timings))
+
+    sys.exit(1 if failures else 0)
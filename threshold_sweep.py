@@ -0,0 +1,207 @@
+"""
+Threshold and city-light penalty sweep against hand labels.
+
+Tuning --threshold by re-running cloud_detection_ml_final.py costs a full
+MobileNet pass per try. Here each labeled image goes through
+CloudDetectorML.patch_features() once (cached in
+border_images/sweep_features/); every penalty setting is then a cheap
+combine_features() and every threshold a comparison, so a whole grid of
+settings is scored in seconds.
+
+Labels (default crossing_images/labels.json), paths relative to the repo:
+
+    [{"image": "crossing_images/crossing_01.jpg", "cloudy": true},
+     {"image": "border_images/border_2025-08-19_12-58-06.jpg",
+      "points": {"12": true, "30": false}}]
+
+"cloudy" labels a crop at its center; "points" labels frontera.json
+crossings on a 1000x500 frame. Either is sampled as detect_at_points does
+(6x6 mean of the probability map). Entries labeled null are skipped, so
+--init-labels can write a template to fill in by hand.
+
+Usage:
+    python3 threshold_sweep.py --init-labels crossing_images/ > crossing_images/labels.json
+    python3 threshold_sweep.py
+    python3 threshold_sweep.py --thresholds 0.1:0.5:0.02 --orange 0.3,0.5,1 --off-color 0.6,1
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import itertools
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+LABELS_PATH = os.path.join(SCRIPT_DIR, 'crossing_images', 'labels.json')
+POINTS_PATH = os.path.join(SCRIPT_DIR, 'public', 'images', 'frontera.json')
+CACHE_DIR = os.path.join(SCRIPT_DIR, 'border_images', 'sweep_features')
+DETECTOR_SOURCE = os.path.join(SCRIPT_DIR, 'cloud_detection_ml_final.py')
+# --penalty flag -> CloudDetectorML.PENALTIES key
+PENALTY_FLAGS = {'orange': 'orange', 'textured': 'textured', 'off_color': 'off_color', 'boost': 'cloud_boost'}
+
+
+def parse_values(text):
+    """'0.1,0.2' or 'start:stop:step' (inclusive) as a list of floats"""
+    if ':' in text:
+        start, stop, step = (float(v) for v in text.split(':'))
+        return [round(v, 6) for v in np.arange(start, stop + step / 2, step)]
+    return [float(v) for v in text.split(',')]
+
+
+def load_labels(path, points):
+    """[(image_path, xy (N, 2), labels (N,) bool)] from a labels file"""
+    with open(path) as f:
+        entries = json.load(f)
+    from PIL import Image
+    samples = []
+    for entry in entries:
+        image_path = os.path.join(SCRIPT_DIR, entry['image'])
+        if 'points' in entry:
+            labeled = [(int(i), v) for i, v in entry['points'].items() if v is not None]
+            xy = [(points[i]['x'], points[i]['y']) for i, _ in labeled]
+            labels = [v for _, v in labeled]
+        elif entry.get('cloudy') is not None:
+            with Image.open(image_path) as img:
+                w, h = img.size
+            xy, labels = [(w // 2, h // 2)], [entry['cloudy']]
+        else:
+            continue
+        if labels:
+            samples.append((image_path, np.array(xy, dtype=np.intp), np.array(labels, dtype=bool)))
+    return samples
+
+
+def init_labels(directory):
+    """Template labels for every JPEG in a directory (cloudy: null)"""
+    names = sorted(n for n in os.listdir(directory) if n.lower().endswith(('.jpg', '.jpeg')))
+    rel = os.path.relpath(os.path.abspath(directory), SCRIPT_DIR)
+    return [{'image': os.path.join(rel, name), 'cloudy': None} for name in names]
+
+
+def cached_features(detector, image_path, use_cache=True):
+    """patch_features() of an image, from the cache when its inputs are unchanged"""
+    digest = hashlib.sha1()
+    digest.update(json.dumps([os.path.abspath(image_path), os.path.getmtime(image_path),
+                              detector.grid_size, detector.patch_size]).encode())
+    with open(DETECTOR_SOURCE, 'rb') as f:
+        digest.update(f.read())
+    cache_path = os.path.join(CACHE_DIR, digest.hexdigest()[:16] + '.npz')
+    if use_cache and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            features = {k: cached[k] for k in cached.files}
+        features['shape'] = tuple(int(v) for v in features['shape'])
+        return features, True
+
+    from PIL import Image
+    with Image.open(image_path) as img:
+        features = detector.patch_features(img.convert('RGB'))
+    if use_cache:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        np.savez_compressed(cache_path, **{k: np.asarray(v) for k, v in features.items()})
+    return features, False
+
+
+def scores(probs, labels, thresholds):
+    """Per threshold: precision, recall, f1, accuracy and the confusion counts"""
+    predicted = probs[None, :] > np.asarray(thresholds)[:, None]
+    tp = (predicted & labels).sum(axis=1)
+    fp = (predicted & ~labels).sum(axis=1)
+    fn = (~predicted & labels).sum(axis=1)
+    tn = (~predicted & ~labels).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    accuracy = (tp + tn) / len(labels)
+    return [{'threshold': float(t), 'precision': float(p), 'recall': float(r), 'f1': float(f),
+             'accuracy': float(a), 'tp': int(a_), 'fp': int(b_), 'fn': int(c_), 'tn': int(d_)}
+            for t, p, r, f, a, a_, b_, c_, d_ in zip(thresholds, precision, recall, f1, accuracy, tp, fp, fn, tn)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sweep thresholds and city-light penalties against hand labels')
+    parser.add_argument('--labels', default=LABELS_PATH, help='Labels JSON')
+    parser.add_argument('--init-labels', metavar='DIR', default=None,
+                        help='Print a labels template for the JPEGs in DIR and exit')
+    parser.add_argument('--thresholds', default='0.05:0.6:0.025', help='List or start:stop:step')
+    for flag, key in PENALTY_FLAGS.items():
+        parser.add_argument('--' + flag.replace('_', '-'), default=None,
+                            help=f'Values for the {key} penalty multiplier')
+    parser.add_argument('--top', type=int, default=15, help='Settings to show, best F1 first')
+    parser.add_argument('--no-cache', action='store_true', help='Recompute patch features')
+    parser.add_argument('--json', default=None, help='Write every setting\'s scores to a JSON file')
+    args = parser.parse_args()
+
+    if args.init_labels:
+        json.dump(init_labels(args.init_labels), sys.stdout, indent=1)
+        print()
+        return
+
+    with open(POINTS_PATH) as f:
+        points = json.load(f)['points']
+    samples = load_labels(args.labels, points)
+    if not samples:
+        sys.exit(f'No labeled images in {args.labels}')
+
+    from cloud_detection_ml_final import CloudDetectorML
+    from point_sampler import window_means
+    detector = CloudDetectorML()
+
+    start = time.perf_counter()
+    features, cached = [], 0
+    for image_path, _, _ in samples:
+        f, hit = cached_features(detector, image_path, not args.no_cache)
+        features.append(f)
+        cached += hit
+    feature_s = time.perf_counter() - start
+    n_labels = sum(len(labels) for _, _, labels in samples)
+    print(f'{len(samples)} images, {n_labels} labels ({int(sum(l.sum() for _, _, l in samples))} cloudy); '
+          f'features in {feature_s:.1f}s ({cached} cached)')
+
+    thresholds = parse_values(args.thresholds)
+    grids = {key: parse_values(getattr(args, flag)) if getattr(args, flag) else [CloudDetectorML.PENALTIES[key]]
+             for flag, key in PENALTY_FLAGS.items()}
+    labels = np.concatenate([l for _, _, l in samples])
+
+    results = []
+    sweep_start = time.perf_counter()
+    for values in itertools.product(*grids.values()):
+        penalties = dict(zip(grids, values))
+        setting_start = time.perf_counter()
+        probs = np.concatenate([window_means(detector.combine_features(f, penalties), xy, radius=3)
+                                for f, (_, xy, _) in zip(features, samples)])
+        probs = np.nan_to_num(probs, nan=0.0)
+        setting_s = time.perf_counter() - setting_start
+        for score in scores(probs, labels, thresholds):
+            score.update(penalties=penalties, seconds=round(setting_s, 4))
+            results.append(score)
+    sweep_s = time.perf_counter() - sweep_start
+    n_settings = len(results)
+    print(f'{n_settings} settings ({n_settings // len(thresholds)} penalty combinations x {len(thresholds)} '
+          f'thresholds) in {sweep_s:.2f}s')
+
+    current = {'threshold': detector.threshold, **CloudDetectorML.PENALTIES}
+    results.sort(key=lambda r: (-r['f1'], -r['accuracy']))
+    print(f"{'thr':>6s} {'orange':>6s} {'text':>6s} {'color':>6s} {'boost':>6s} "
+          f"{'prec':>6s} {'recall':>6s} {'f1':>6s} {'acc':>6s} {'ms':>7s}")
+    for r in results[:args.top]:
+        p = r['penalties']
+        is_current = (abs(r['threshold'] - current['threshold']) < 1e-9
+                      and all(p[k] == current[k] for k in p))
+        print(f"{r['threshold']:6.3f} {p['orange']:6.2f} {p['textured']:6.2f} {p['off_color']:6.2f} "
+              f"{p['cloud_boost']:6.2f} {r['precision']:6.3f} {r['recall']:6.3f} {r['f1']:6.3f} "
+              f"{r['accuracy']:6.3f} {r['seconds'] * 1000:7.1f}{'  (current)' if is_current else ''}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'labels': args.labels, 'images': len(samples), 'n_labels': n_labels,
+                       'feature_seconds': round(feature_s, 2), 'sweep_seconds': round(sweep_s, 2),
+                       'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
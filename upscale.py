@@ -11,8 +11,9 @@ import os
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
-import numpy as np
-from PIL import Image
+
+from frame import Frame
+import profiling
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(SCRIPT_DIR, 'models', 'RealESRGAN_x2plus.pth')
@@ -106,47 +107,41 @@ def _load_model():
     return model
 
 
+@profiling.torch_traced('upscale_image')
 def upscale_image(img):
     """
     Upscale a PIL Image by 2x using Real-ESRGAN.
 
     Args:
-        img: PIL Image (RGB)
+        img: PIL Image (RGB) or frame.Frame
 
     Returns:
         PIL Image at 2x resolution
     """
     model = _load_model()
 
-    # PIL -> numpy -> tensor
-    img_np = np.array(img).astype(np.float32) / 255.0
-    h, w = img_np.shape[:2]
+    # PIL -> frame -> float CHW tensor (one copy, see frame.py)
+    frame = img if isinstance(img, Frame) else Frame.from_pil(img)
+    h, w = frame.shape[:2]
+    tensor = frame.tensor()
 
     # Pad to even dimensions (pixel_unshuffle requires divisible by 2)
     pad_h = h % 2
     pad_w = w % 2
     if pad_h or pad_w:
-        img_np = np.pad(img_np, ((0, pad_h), (0, pad_w), (0, 0)), mode='reflect')
-
-    # HWC -> CHW, add batch dim
-    tensor = torch.from_numpy(img_np.transpose(2, 0, 1)).unsqueeze(0)
+        tensor = F.pad(tensor, (0, pad_w, 0, pad_h), mode='reflect')
 
     with torch.no_grad():
         output = model(tensor)
 
-    # Clamp and convert back
-    output = output.squeeze(0).clamp(0, 1).numpy()
-    output = (output.transpose(1, 2, 0) * 255.0).round().astype(np.uint8)
-
-    # Crop padding (scaled by 2x)
-    if pad_h or pad_w:
-        output = output[:h * 2, :w * 2]
-
-    return Image.fromarray(output)
+    # Crop padding (scaled by 2x), then clamp and convert back
+    output = output[:, :, :h * 2, :w * 2]
+    return Frame.from_tensor(output).pil()
 
 
 if __name__ == '__main__':
     import sys
+    from PIL import Image
     if len(sys.argv) < 2:
         print('Usage: python3 upscale.py <input_image> [output_image]')
         sys.exit(1)